@@ -164,6 +164,7 @@ export function ChatInput({
   const [recognition, setRecognition] = useState<any>(null);
   const [showMentionDropdown, setShowMentionDropdown] = useState(false);
   const autocompleteTimerRef = useRef<NodeJS.Timeout | null>(null);
+  const autocompleteAbortRef = useRef<AbortController | null>(null);
   const skipAutocompleteRef = useRef(false);
   const [mentionSearch, setMentionSearch] = useState("");
   const [mentionPosition, setMentionPosition] = useState(0);
@@ -232,6 +233,45 @@ export function ChatInput({
       return;
     }
 
+    // Cancel requests for text the user has already typed past
+    autocompleteAbortRef.current?.abort();
+    const controller = new AbortController();
+    autocompleteAbortRef.current = controller;
+
+    // Only show suggestions that continue the current message
+    const showCompletion = (completion: string) => {
+      if (
+        completion &&
+        completion.length > message.length &&
+        completion.startsWith(message)
+      ) {
+        // Extract just the completion part (not the original text)
+        setAutocompleteSuggestion(completion.slice(message.length));
+        return true;
+      }
+      return false;
+    };
+
+    // Instant suggestion from the user's own prompt history (short debounce)
+    const localTimer = setTimeout(async () => {
+      if (!token) return;
+
+      try {
+        const completion = await autocompletePrompt(
+          token,
+          message,
+          selectedModel,
+          "local",
+          controller.signal
+        );
+        if (!showCompletion(completion)) {
+          setAutocompleteSuggestion("");
+        }
+      } catch (error) {
+        // Silently fail - the model suggestion may still arrive
+      }
+    }, 120);
+
     // Set a timer to autocomplete after user stops typing (800ms debounce)
     autocompleteTimerRef.current = setTimeout(async () => {
       if (!token) return;
@@ -241,35 +281,33 @@ export function ChatInput({
         const completion = await autocompletePrompt(
           token,
           message,
-          selectedModel
+          selectedModel,
+          "llm",
+          controller.signal
         );
 
-        // Only show suggestion if it's different and longer than current message
-        if (
-          completion &&
-          completion.length > message.length &&
-          completion.startsWith(message)
-        ) {
-          // Extract just the completion part (not the original text)
-          const suggestionPart = completion.slice(message.length);
-          setAutocompleteSuggestion(suggestionPart);
-        } else {
-          setAutocompleteSuggestion("");
-        }
+        // Keep the local suggestion if the model has nothing better
+        showCompletion(completion);
       } catch (error) {
         // Silently fail - don't show error for autocomplete
-        console.log("Autocomplete failed:", error);
-        setAutocompleteSuggestion("");
+        if (!controller.signal.aborted) {
+          console.log("Autocomplete failed:", error);
+        }
       } finally {
-        setIsAutocompleting(false);
+        if (!controller.signal.aborted) {
+          setIsAutocompleting(false);
+        }
       }
     }, 800);
 
-    // Cleanup timer on unmount or when message changes
+    // Cleanup timers and requests on unmount or when message changes
     return () => {
+      clearTimeout(localTimer);
       if (autocompleteTimerRef.current) {
         clearTimeout(autocompleteTimerRef.current);
       }
+      controller.abort();
+      setIsAutocompleting(false);
     };
   }, [message, token, selectedModel, isLoading, isEnhancing]);
 
@@ -87,6 +87,9 @@ export function useMessageHandler(page: string) {
             let aiResponse = "";
             let accumulatedContent = ""; // Build content sequentially as events arrive
             let finalAnswer = "";
+            // End offset of each query step's result; charts are decided in the
+            // background and may arrive after the next step has started
+            const stepEnds: Record<number, number> = {};
             const streamingMessageId = (Date.now() + 1).toString();
 
             // Check if it's general mode
@@ -191,6 +194,9 @@ export function useMessageHandler(page: string) {
                       2
                     )}\n\`\`\`\n</details>\n`;
                   }
+                  if (typeof data.step === "number") {
+                    stepEnds[data.step] = accumulatedContent.length;
+                  }
                   setMessages((prev) => {
                     const updated = [...prev];
                     const lastMsg = updated[updated.length - 1];
@@ -271,11 +277,27 @@ export function useMessageHandler(page: string) {
                 } else if (data.type === "chart_config") {
                   // Append chart configuration to accumulated content
                   setCurrentStatus("AI is generating visualization...");
-                  accumulatedContent += `\n\n**📊 Visualization:**\n\`\`\`chart\n${JSON.stringify(
+                  const chartBlock = `\n\n**📊 Visualization:**\n\`\`\`chart\n${JSON.stringify(
                     data.content,
                     null,
                     2
                   )}\n\`\`\`\n`;
+                  const insertAt =
+                    typeof data.step === "number" ? stepEnds[data.step] : undefined;
+                  if (insertAt !== undefined && insertAt < accumulatedContent.length) {
+                    // Place the chart under its own step's result
+                    accumulatedContent =
+                      accumulatedContent.slice(0, insertAt) +
+                      chartBlock +
+                      accumulatedContent.slice(insertAt);
+                    for (const step of Object.keys(stepEnds)) {
+                      if (stepEnds[Number(step)] >= insertAt) {
+                        stepEnds[Number(step)] += chartBlock.length;
+                      }
+                    }
+                  } else {
+                    accumulatedContent += chartBlock;
+                  }
                   setMessages((prev) => {
                     const updated = [...prev];
                     const lastMsg = updated[updated.length - 1];
@@ -758,11 +758,16 @@ export async function enhancePrompt(
 
 /**
  * Autocomplete a user's prompt using AI
+ *
+ * mode "local" returns an instant suggestion from the user's own prompt
+ * history; the default asks the model.
  */
 export async function autocompletePrompt(
   token: string,
   prompt: string,
-  model: string
+  model: string,
+  mode: "local" | "llm" = "llm",
+  signal?: AbortSignal
 ): Promise<string> {
   const response = await fetch(`${API_BASE_URL}/api/autocomplete-prompt`, {
     method: "POST",
@@ -770,7 +775,8 @@ export async function autocompletePrompt(
       "Content-Type": "application/json",
       Authorization: `Bearer ${token}`,
     },
-    body: JSON.stringify({ prompt, model }),
+    body: JSON.stringify({ prompt, model, mode }),
+    signal,
   });
 
   if (!response.ok) {
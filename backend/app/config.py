@@ -1,6 +1,7 @@
 """Application configuration."""
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -17,6 +18,138 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     
+    # AI provider client pool
+    provider_client_pool_size: int = 64
+    provider_client_idle_seconds: int = 600
+    
+    # Provider concurrency and rate limits (0 = unlimited). Concurrency is capped per
+    # provider and per API key; requests/tokens per minute are budgeted per API key.
+    provider_max_concurrency: int = 16
+    provider_key_max_concurrency: int = 8
+    provider_requests_per_minute: float = 0
+    provider_tokens_per_minute: float = 0
+    # Per-provider overrides, e.g. PROVIDER_LIMITS='{"openai": {"requests_per_minute": 500}}'
+    provider_limits: Dict[str, Dict[str, float]] = {}
+    rate_limit_max_wait_seconds: float = 30
+    rate_limit_max_retries: int = 3
+    
+    # Provider timeouts, retries and circuit breakers. PROVIDER_TIMEOUTS overrides the
+    # per-stage defaults, e.g. '{"sql": {"first_token": 30, "total": 120}}'
+    provider_connect_timeout_seconds: float = 10
+    provider_timeouts: Dict[str, Dict[str, float]] = {}
+    provider_retry_attempts: int = 2
+    provider_retry_base_delay_seconds: float = 0.5
+    circuit_breaker_failure_threshold: int = 5
+    circuit_breaker_reset_seconds: float = 30
+    
+    # Race mode: fast partner models tried in order; the first one whose provider differs
+    # from the user's model and has a configured API key races the user's model
+    race_partner_models: List[str] = ["gemini-2.5-flash", "gpt-4o-mini", "claude-haiku-4.5", "deepseek-chat"]
+    
+    # Per-stage model routing: lightweight stages use the first candidate from the user's
+    # own provider, else from another provider with a configured key ("sql" and
+    # "summary" always use the user's model)
+    stage_routing_enabled: bool = True
+    stage_model_routes: Dict[str, List[str]] = {
+        "chart": ["gemini-2.5-flash", "gpt-4o-mini", "claude-haiku-4.5", "deepseek-chat"],
+        "next_step": ["gemini-2.5-flash", "gpt-4o-mini", "claude-haiku-4.5", "deepseek-chat"],
+        "autocomplete": ["gemini-2.0-flash", "gpt-4o-mini", "claude-haiku-4.5", "deepseek-chat"],
+        "enhance": ["gemini-2.5-flash", "gpt-4o-mini", "claude-haiku-4.5", "deepseek-chat"],
+        "conversation_summary": ["gemini-2.5-flash", "gpt-4o-mini", "claude-haiku-4.5", "deepseek-chat"]
+    }
+    # Stage calls taking at least this long are logged (all latencies are in diagnostics)
+    stage_slow_call_seconds: float = 30.0
+    
+    # Conversation history sent to providers: stored result tables and charts are replaced
+    # by one-line digests (columns, row count and the first rows)
+    history_compact_results: bool = True
+    history_result_rows: int = 3
+    
+    # Dataset database I/O runs in bounded thread pools: a read lane (SELECTs, schemas, file
+    # parsing) and a write lane (writes, uploads); calls beyond workers + max_queue wait
+    dataset_read_workers: int = 4
+    dataset_write_workers: int = 1
+    dataset_executor_max_queue: int = 64
+    
+    # Pacing profile for streamed answers: "none" (no artificial delay) or "demo" (pauses
+    # that keep each loading state on screen); requests can choose one with AskRequest.pacing
+    pacing_profile: str = "none"
+    
+    # Speculative SQL: run a generated SELECT as soon as its ```sql block is complete,
+    # while the model is still writing the rest of its response
+    speculative_sql_enabled: bool = True
+    
+    # Query plans: broad questions may be answered with up to `max_queries` independent
+    # SELECTs planned in one response, run in parallel and summarized by one conclusion call
+    query_planning_enabled: bool = True
+    query_plan_max_queries: int = 4
+    
+    # Local stop rules: end the multi-step loops without a next-step call when the
+    # question's shape and the first result show it is answered
+    stop_rules_enabled: bool = True
+    
+    # Structured output: SQL steps and chart decisions are requested as JSON (schema or
+    # forced tool call where the provider supports it), falling back to text parsing
+    structured_output_enabled: bool = False
+    
+    # Few-shot SQL examples: questions answered by one successful query are kept per table
+    # (newest `max_per_dataset`) and the `top_k` most similar (BM25) are added to SQL prompts
+    sql_examples_enabled: bool = True
+    sql_examples_top_k: int = 3
+    sql_examples_max_per_dataset: int = 500
+    
+    # Local intent classifier (TF-IDF + logistic regression, trained offline with
+    # `python -m app.services.intent_classifier`): questions it is at least `threshold`
+    # sure are unrelated to the data are answered without an LLM call
+    intent_classifier_enabled: bool = True
+    intent_classifier_path: str = "./intent_classifier.joblib"
+    intent_classifier_threshold: float = 0.9
+    intent_classifier_min_examples: int = 20
+    
+    # Rolling conversation summary, updated in the background after each turn: messages
+    # older than the newest `keep_messages` are folded into it once `batch_messages` are pending
+    conversation_summary_enabled: bool = True
+    conversation_summary_keep_messages: int = 6
+    conversation_summary_batch_messages: int = 4
+    conversation_summary_max_words: int = 250
+    
+    # Prompt input token budgets by model name prefix ("default" otherwise, 0 = unlimited).
+    # Over budget, history messages, then chart history, SQL examples and SQL history, then
+    # sample rows are trimmed.
+    prompt_budget_enabled: bool = True
+    prompt_token_budgets: Dict[str, int] = {"default": 24000}
+    
+    # Pre-encoded, downscaled image attachments (content-addressed)
+    attachment_cache_dir: str = "uploads/chat/.encoded"
+    attachment_cache_memory_entries: int = 64
+    
+    # Prompt autocomplete: past prompts used to train each user's local completer,
+    # LLM completions remembered per user, and users kept in memory
+    autocomplete_history_size: int = 500
+    autocomplete_cache_entries: int = 32
+    autocomplete_max_users: int = 256
+    
+    # AI interaction log (debug/ai_interactions.jsonl, written by a background thread)
+    ai_log_enabled: bool = True
+    ai_log_dir: Optional[str] = None
+    ai_log_sample_rate: float = 1.0
+    ai_log_include_text: bool = True
+    ai_log_max_bytes: int = 50 * 1024 * 1024
+    ai_log_rotate_seconds: int = 86400
+    ai_log_backup_count: int = 10
+    ai_log_compress: bool = True
+    
+    # Local replay provider (`local:` / `replay:` models, used for offline benchmarking)
+    replay_log_path: Optional[str] = None
+    replay_latency_ms: int = 0
+    replay_tokens_per_second: float = 0
+    
+    # LLM response cache (opt-in)
+    llm_cache_enabled: bool = False
+    llm_cache_path: str = "./llm_cache.db"
+    llm_cache_ttl_seconds: int = 86400
+    llm_cache_max_bytes: int = 50 * 1024 * 1024
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
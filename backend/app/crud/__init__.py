@@ -15,6 +15,14 @@ from app.crud.message import (
     create_message,
     get_conversation_messages,
     get_conversation_history,
+    get_user_prompts,
+    get_prompt_replies,
+)
+
+from app.crud.summary import (
+    get_conversation_summary,
+    get_messages_after,
+    upsert_conversation_summary,
 )
 
 from app.crud.user import (
@@ -42,6 +50,12 @@ __all__ = [
     "create_message",
     "get_conversation_messages",
     "get_conversation_history",
+    "get_user_prompts",
+    "get_prompt_replies",
+    # Conversation summary CRUD
+    "get_conversation_summary",
+    "get_messages_after",
+    "upsert_conversation_summary",
     # User CRUD
     "update_user_api_keys",
     "get_user_api_keys",
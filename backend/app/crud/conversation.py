@@ -79,7 +79,7 @@ def delete_conversation(db: Session, conversation_id: int) -> bool:
 def delete_all_conversations(db: Session, user_id: Optional[int] = None) -> int:
     """Delete all conversations for a user and return the count of deleted conversations.
     
-    Explicitly deletes all messages first, then deletes conversations.
+    Explicitly deletes all messages and summaries first, then deletes conversations.
     """
     query = db.query(models.Conversation)
     
@@ -94,6 +94,7 @@ def delete_all_conversations(db: Session, user_id: Optional[int] = None) -> int:
     # Delete all messages for these conversations
     if conversation_ids:
         db.query(models.Message).filter(models.Message.conversation_id.in_(conversation_ids)).delete(synchronize_session=False)
+        db.query(models.ConversationSummary).filter(models.ConversationSummary.conversation_id.in_(conversation_ids)).delete(synchronize_session=False)
     
     # Delete all conversations
     query.delete(synchronize_session=False)
@@ -198,6 +198,78 @@ def _cleanup_old_chart_records(db: Session, conversation_id: int, keep_count: in
         db.commit()
 
 
+def create_sql_example(
+    db: Session,
+    table_name: str,
+    question: str,
+    sql_query: str,
+    row_count: int = 0,
+    keep_count: int = 500
+) -> Optional[models.SqlExample]:
+    """Store a question and the SQL that answered it for a table (None if already stored)."""
+    existing = db.query(models.SqlExample).filter(
+        models.SqlExample.table_name == table_name,
+        models.SqlExample.question == question,
+        models.SqlExample.sql_query == sql_query
+    ).first()
+    if existing:
+        return None
+    
+    db_record = models.SqlExample(
+        table_name=table_name,
+        question=question,
+        sql_query=sql_query,
+        row_count=row_count
+    )
+    db.add(db_record)
+    db.commit()
+    db.refresh(db_record)
+    
+    # Maintain only the latest keep_count examples per table
+    stale_ids = [
+        example_id for (example_id,) in db.query(models.SqlExample.id).filter(
+            models.SqlExample.table_name == table_name
+        ).order_by(desc(models.SqlExample.id)).offset(keep_count).all()
+    ]
+    if stale_ids:
+        db.query(models.SqlExample).filter(models.SqlExample.id.in_(stale_ids)).delete(synchronize_session=False)
+        db.commit()
+    
+    return db_record
+
+
+def get_sql_examples(db: Session, table_name: str) -> List[models.SqlExample]:
+    """Get the stored SQL examples of a table, oldest first."""
+    return db.query(models.SqlExample).filter(
+        models.SqlExample.table_name == table_name
+    ).order_by(models.SqlExample.id.asc()).all()
+
+
+def get_sql_example_tables(db: Session) -> List[str]:
+    """Get the names of the tables that have stored SQL examples."""
+    return [table_name for (table_name,) in db.query(models.SqlExample.table_name).distinct().all()]
+
+
+def delete_sql_examples(db: Session, table_name: str) -> int:
+    """Delete the stored SQL examples of a table and return how many were deleted."""
+    count = db.query(models.SqlExample).filter(
+        models.SqlExample.table_name == table_name
+    ).delete(synchronize_session=False)
+    db.commit()
+    return count
+
+
+def delete_execution_history(db: Session, conversation_id: int):
+    """Delete the SQL and chart history records of a conversation."""
+    db.query(models.SqlExecutionHistory).filter(
+        models.SqlExecutionHistory.conversation_id == conversation_id
+    ).delete(synchronize_session=False)
+    db.query(models.ChartGenerationHistory).filter(
+        models.ChartGenerationHistory.conversation_id == conversation_id
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
 def get_history_context_for_ai(
     db: Session,
     conversation_id: int,
@@ -213,6 +285,19 @@ def get_history_context_for_ai(
     sql_records = get_recent_sql_history(db, conversation_id, max_sql_entries)
     chart_records = get_recent_chart_history(db, conversation_id, max_chart_entries)
     
+    return format_history_context_for_ai(sql_records, chart_records)
+
+
+def format_history_context_for_ai(
+    sql_records: List[models.SqlExecutionHistory],
+    chart_records: List[models.ChartGenerationHistory]
+) -> Dict[str, str]:
+    """
+    Format SQL and chart history records (newest first) for AI prompts.
+    
+    Returns:
+        Dictionary with 'sql_context' and 'chart_context' strings
+    """
     sql_context = ""
     chart_context = ""
     
@@ -1,5 +1,5 @@
 """CRUD operations for Message model."""
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
 from app import models
 import json
@@ -55,3 +55,52 @@ def get_conversation_history(db: Session, conversation_id: int, limit: int = 10)
         }
         for msg in messages
     ]
+
+
+def get_user_prompts(db: Session, user_id: int, limit: int = 500) -> List[str]:
+    """Get the most recent prompts a user has sent, oldest first."""
+    messages = db.query(models.Message.content).join(
+        models.Conversation, models.Message.conversation_id == models.Conversation.id
+    ).filter(
+        models.Conversation.user_id == user_id,
+        models.Message.role == models.MessageRole.USER
+    ).order_by(models.Message.created_at.desc()).limit(limit).all()
+    
+    return [content for (content,) in reversed(messages)]
+
+
+def get_prompt_replies(
+    db: Session,
+    user_ids: Optional[List[int]] = None,
+    limit: int = 20000
+) -> List[Tuple[str, str]]:
+    """
+    Get (user prompt, assistant reply) pairs from the most recent messages.
+    
+    Args:
+        db: Database session
+        user_ids: Only conversations of these users (None = every conversation)
+        limit: Most recent messages to pair
+    """
+    query = db.query(
+        models.Message.id, models.Message.conversation_id, models.Message.role, models.Message.content
+    )
+    if user_ids is not None:
+        query = query.join(
+            models.Conversation, models.Conversation.id == models.Message.conversation_id
+        ).filter(models.Conversation.user_id.in_(user_ids))
+    messages = query.order_by(models.Message.id.desc()).limit(limit).all()
+    
+    # Pair within each conversation (conversations can interleave by id)
+    pairs = []
+    previous = None
+    for message in sorted(messages, key=lambda message: (message.conversation_id, message.id)):
+        if (
+            previous is not None
+            and message.role == models.MessageRole.ASSISTANT
+            and previous.role == models.MessageRole.USER
+            and previous.conversation_id == message.conversation_id
+        ):
+            pairs.append((previous.content, message.content))
+        previous = message
+    return pairs
@@ -0,0 +1,42 @@
+"""CRUD operations for rolling conversation summaries."""
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from app import models
+
+
+def get_conversation_summary(db: Session, conversation_id: int) -> Optional[models.ConversationSummary]:
+    """Get the rolling summary of a conversation, if one has been written."""
+    return db.query(models.ConversationSummary).filter(
+        models.ConversationSummary.conversation_id == conversation_id
+    ).first()
+
+
+def get_messages_after(db: Session, conversation_id: int, after_message_id: int = 0) -> List[models.Message]:
+    """Get a conversation's messages newer than a message id, oldest first."""
+    return db.query(models.Message).filter(
+        models.Message.conversation_id == conversation_id,
+        models.Message.id > after_message_id
+    ).order_by(models.Message.id.asc()).all()
+
+
+def upsert_conversation_summary(
+    db: Session,
+    conversation_id: int,
+    summary: str,
+    last_message_id: int,
+    message_count: int,
+    model: Optional[str] = None
+) -> models.ConversationSummary:
+    """Create or replace the rolling summary of a conversation."""
+    db_summary = get_conversation_summary(db, conversation_id)
+    if db_summary is None:
+        db_summary = models.ConversationSummary(conversation_id=conversation_id)
+        db.add(db_summary)
+    
+    db_summary.summary = summary
+    db_summary.last_message_id = last_message_id
+    db_summary.message_count = message_count
+    db_summary.model = model
+    db.commit()
+    db.refresh(db_summary)
+    return db_summary
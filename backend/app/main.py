@@ -8,7 +8,7 @@ from app.database import engine
 from app.config import get_settings
 
 # Import route modules
-from app.routes import auth, ask, settings as settings_routes, dataset, chat
+from app.routes import auth, ask, settings as settings_routes, dataset, chat, diagnostics
 
 settings = get_settings()
 
@@ -38,6 +38,7 @@ app.include_router(chat.router)              # Chat page (conversations, message
 app.include_router(ask.router)               # Ask mode endpoints (Chat page)
 app.include_router(settings_routes.router)   # Settings page endpoints (API Keys)
 app.include_router(dataset.router)           # Dataset page endpoints (Upload/View datasets)
+app.include_router(diagnostics.router)       # Diagnostics endpoints (provider pools, caches, metrics)
 
 # Mount static files for uploaded attachments
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -63,6 +64,7 @@ def health_check():
 # - app/routes/ask.py           -> Ask mode / Chat functionality
 # - app/routes/settings.py      -> Settings page (API Keys management)
 # - app/routes/dataset.py       -> Dataset page (Upload/View datasets)
+# - app/routes/diagnostics.py   -> Runtime diagnostics (provider pools, caches, metrics)
 #
 # Each module contains endpoints specific to its page/feature for better
 # code organization and maintainability.
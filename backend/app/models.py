@@ -1,6 +1,6 @@
 """SQLAlchemy models for AskQL system."""
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, backref
 from sqlalchemy.sql import func
 from app.database import Base
 import enum
@@ -125,3 +125,34 @@ class ChartGenerationHistory(Base):
     
     # Relationship to conversation
     conversation = relationship("Conversation", backref="chart_history")
+
+
+class SqlExample(Base):
+    """Model for storing questions answered by a single successful SQL query, per dataset table."""
+    __tablename__ = "sql_examples"
+
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String(255), index=True, nullable=False)  # One row per table the query reads
+    question = Column(Text, nullable=False)
+    sql_query = Column(Text, nullable=False)
+    row_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ConversationSummary(Base):
+    """Model for storing the rolling summary of a conversation's older messages."""
+    __tablename__ = "conversation_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), unique=True, index=True, nullable=False)
+    summary = Column(Text, nullable=False)
+    last_message_id = Column(Integer, nullable=False)  # Newest message folded into the summary
+    message_count = Column(Integer, default=0)  # Number of messages folded into the summary
+    model = Column(String(100), nullable=True)  # AI model that wrote the latest update
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # Relationship to conversation (deleted with it)
+    conversation = relationship(
+        "Conversation",
+        backref=backref("summary", uselist=False, cascade="all, delete-orphan")
+    )
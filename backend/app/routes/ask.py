@@ -7,7 +7,13 @@ import json
 from app import crud, schemas
 from app.database import get_db
 from app.services.ai_service import ai_service
+from app.services.autocomplete_service import autocomplete_service
+from app.services.conversation_summarizer import conversation_summarizer
+from app.services.dataset_executor import dataset_executor
 from app.services.dataset_service import get_dataset_service
+from app.services.pacing import set_pacing_profile
+from app.services.response_cache import set_cache_bypass
+from app.services.stage_router import set_request_api_keys
 from app.services.sql_executor import process_ai_response_with_sql
 from app.services.ask_mode_service import process_ask_mode_stream
 from app.services.agent_mode_service import process_agent_mode_stream, confirm_agent_operation_stream
@@ -36,37 +42,22 @@ def get_user_id_from_request(request: Request, current_user_session: dict) -> in
 
 def get_api_key_for_model(model: str, user_api_keys: dict) -> str:
     """Get the appropriate API key for the given model."""
-    if model.startswith("gemini"):
-        api_key = user_api_keys.get("google")
-        if not api_key:
-            raise HTTPException(
-                status_code=400,
-                detail="Google API key not configured. Please add it in Settings."
-            )
-    elif model.startswith("gpt"):
-        api_key = user_api_keys.get("openai")
-        if not api_key:
-            raise HTTPException(
-                status_code=400,
-                detail="OpenAI API key not configured. Please add it in Settings."
-            )
-    elif model.startswith("claude"):
-        api_key = user_api_keys.get("anthropic")
-        if not api_key:
-            raise HTTPException(
-                status_code=400,
-                detail="Anthropic API key not configured. Please add it in Settings."
-            )
-    elif model.startswith("deepseek"):
-        api_key = user_api_keys.get("deepseek")
-        if not api_key:
-            raise HTTPException(
-                status_code=400,
-                detail="DeepSeek API key not configured. Please add it in Settings."
-            )
-    else:
+    try:
+        provider = ai_service.get_provider(model)
+    except ValueError:
         raise HTTPException(status_code=400, detail=f"Unsupported model: {model}")
     
+    # Local providers (e.g., replay:) don't need a key
+    if provider.api_key_name is None:
+        return ""
+    
+    api_key = user_api_keys.get(provider.api_key_name)
+    if not api_key:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{provider.display_name} API key not configured. Please add it in Settings."
+        )
+    
     return api_key
 
 
@@ -104,6 +95,11 @@ async def enhance_prompt(
         # Get API key for model
         api_key = get_api_key_for_model(model, user_api_keys)
         
+        # Allow callers to force a fresh answer instead of a cached one, and let
+        # lightweight stages route to a cheaper model using the user's other keys
+        set_cache_bypass(request_data.get("bypass_cache", False))
+        set_request_api_keys(user_api_keys)
+        
         # Extract table mentions from prompt (e.g., @Walmart_Sales)
         table_schemas = None
         if "@" in prompt:
@@ -117,7 +113,7 @@ async def enhance_prompt(
                 actual_tables = [t for t in mentions if t.lower() != 'general']
                 for table_name in actual_tables:
                     try:
-                        schema = dataset_service.get_table_schema(table_name)
+                        schema = await dataset_executor.read(dataset_service.get_cached_table_schema, table_name)
                         table_schemas.append(schema)
                     except Exception as e:
                         # Log error but continue with other tables
@@ -149,6 +145,12 @@ async def autocomplete_prompt(
     """
     Autocomplete a user's partial prompt with AI suggestions.
     Extracts table schemas if @ mentions are present in the prompt.
+    
+    With "mode": "local" the suggestion comes instantly from the user's own
+    prompt history (no model call), so the UI can show it while the model
+    suggestion is still on its way. A model request replaces the same user's
+    previous one still in flight; the replaced request returns an empty
+    suggestion with "superseded": true.
     """
     try:
         # Import session from auth routes
@@ -159,11 +161,6 @@ async def autocomplete_prompt(
         from app.routes.chat import get_user_id_from_request
         user_id = get_user_id_from_request(http_request, current_user_session)
         
-        # Get user's API keys
-        user_api_keys = crud.get_user_api_keys(db, user_id)
-        if not user_api_keys:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         # Get prompt and model from request
         prompt = request_data.get("prompt", "")
         model = request_data.get("model", "gemini-2.5-flash")
@@ -171,9 +168,33 @@ async def autocomplete_prompt(
         if not prompt:
             raise HTTPException(status_code=400, detail="Prompt is required")
         
+        if request_data.get("mode") == "local":
+            completion = autocomplete_service.complete_locally(
+                user_id,
+                prompt,
+                lambda uid, limit: crud.get_user_prompts(db, uid, limit)
+            )
+            return {"autocompleted_prompt": completion or "", "source": "local"}
+        
+        # Typing along a recent suggestion reuses it without another model call
+        if not request_data.get("bypass_cache", False):
+            cached = autocomplete_service.cached_completion(user_id, model, prompt)
+            if cached:
+                return {"autocompleted_prompt": cached, "source": "cache"}
+        
+        # Get user's API keys
+        user_api_keys = crud.get_user_api_keys(db, user_id)
+        if not user_api_keys:
+            raise HTTPException(status_code=404, detail="User not found")
+        
         # Get API key for model
         api_key = get_api_key_for_model(model, user_api_keys)
         
+        # Allow callers to force a fresh answer instead of a cached one, and let
+        # lightweight stages route to a cheaper model using the user's other keys
+        set_cache_bypass(request_data.get("bypass_cache", False))
+        set_request_api_keys(user_api_keys)
+        
         # Extract table mentions from prompt (e.g., @Walmart_Sales)
         table_schemas = None
         if "@" in prompt:
@@ -187,21 +208,28 @@ async def autocomplete_prompt(
                 actual_tables = [t for t in mentions if t.lower() != 'general']
                 for table_name in actual_tables:
                     try:
-                        schema = dataset_service.get_table_schema(table_name)
+                        schema = await dataset_executor.read(dataset_service.get_cached_table_schema, table_name)
                         table_schemas.append(schema)
                     except Exception as e:
                         # Log error but continue with other tables
                         print(f"Warning: Failed to get schema for table {table_name}: {str(e)}")
         
         # Autocomplete the prompt using AI service with table schemas
-        autocompleted_prompt = await ai_service.autocomplete_prompt(
-            prompt, 
-            model, 
-            api_key,
-            table_schemas=table_schemas
+        autocompleted_prompt = await autocomplete_service.complete_with_model(
+            user_id,
+            model,
+            prompt,
+            lambda: ai_service.autocomplete_prompt(
+                prompt, 
+                model, 
+                api_key,
+                table_schemas=table_schemas
+            )
         )
         
-        return {"autocompleted_prompt": autocompleted_prompt.strip()}
+        if autocompleted_prompt is None:
+            return {"autocompleted_prompt": "", "source": "llm", "superseded": True}
+        return {"autocompleted_prompt": autocompleted_prompt, "source": "llm"}
     
     except HTTPException:
         raise
@@ -236,6 +264,12 @@ async def ask_query(
         # Get API key for model
         api_key = get_api_key_for_model(request_data.model, user_api_keys)
         
+        # Allow callers to force a fresh answer instead of a cached one, and let
+        # lightweight stages route to a cheaper model using the user's other keys
+        set_cache_bypass(request_data.bypass_cache)
+        set_request_api_keys(user_api_keys)
+        set_pacing_profile(request_data.pacing)
+        
         # Get or create conversation
         if request_data.conversation_id:
             conversation = crud.get_conversation(db, request_data.conversation_id)
@@ -258,6 +292,7 @@ async def ask_query(
             content=request_data.query,
             attachments=attachments_list
         )
+        autocomplete_service.record_prompt(user_id, request_data.query)
         
         # Check if @general tag is used
         is_general_mode = request_data.selected_tables and 'general' in [t.lower() for t in request_data.selected_tables]
@@ -302,7 +337,7 @@ async def ask_query(
             actual_tables = [t for t in request_data.selected_tables if t.lower() != 'general']
             for table_name in actual_tables:
                 try:
-                    schema = dataset_service.get_table_schema(table_name)
+                    schema = await dataset_executor.read(dataset_service.get_table_schema, table_name)
                     table_schemas.append(schema)
                 except Exception as e:
                     # Log error but continue with other tables
@@ -315,7 +350,8 @@ async def ask_query(
                 model=request_data.model,
                 api_key=api_key,
                 table_schemas=table_schemas,
-                is_general_mode=is_general_mode
+                is_general_mode=is_general_mode,
+                stage="sql"
             )
         except Exception as e:
             raise HTTPException(
@@ -365,6 +401,9 @@ async def ask_query(
         # Update conversation timestamp to move it to top of recent chats
         crud.update_conversation_timestamp(db, conversation.id)
         
+        # Fold older messages into the conversation summary in the background
+        conversation_summarizer.schedule(conversation.id, request_data.model, api_key)
+        
         return schemas.AskResponse(
             conversation_id=conversation.id,
             user_message=user_message,
@@ -394,6 +433,10 @@ async def ask_query_stream(
                 print("⚠️ Client disconnected before processing started")
                 return
             
+            # Allow callers to force a fresh answer instead of a cached one, at their own pacing
+            set_cache_bypass(request_data.bypass_cache)
+            set_pacing_profile(request_data.pacing)
+            
             # Import session from auth routes
             from app.routes.auth import get_current_user_session
             current_user_session = get_current_user_session()
@@ -407,6 +450,9 @@ async def ask_query_stream(
                 yield f"data: {json.dumps({'error': 'User not found'})}\n\n"
                 return
             
+            # Let lightweight stages route to a cheaper model using the user's other keys
+            set_request_api_keys(user_api_keys)
+            
             # Determine which API key to use based on model
             model = request_data.model
             try:
@@ -437,6 +483,7 @@ async def ask_query_stream(
                 content=request_data.query,
                 attachments=attachments_list
             )
+            autocomplete_service.record_prompt(user_id, request_data.query)
             
             # If no tables selected (and not @general), return fixed message immediately
             if not request_data.selected_tables or len(request_data.selected_tables) == 0:
@@ -461,20 +508,36 @@ async def ask_query_stream(
                 yield f"data: {json.dumps({'type': 'done', 'conversation_id': conversation.id, 'user_message_id': user_message.id, 'assistant_message_id': assistant_message.id})}\n\n"
                 return
             
+            # Race mode: pair the user's model with a fast model from another configured provider
+            race_partner = None
+            if request_data.race_mode:
+                race_partner = ai_service.pick_race_partner(model, user_api_keys)
+                if not race_partner:
+                    print("⚠️ Race mode requested but no second provider key is configured - using a single model")
+            
             # Use Ask Mode service to process the stream
-            async for event in process_ask_mode_stream(
+            ask_events = process_ask_mode_stream(
                 request_data=request_data,
                 conversation_id=conversation.id,
                 user_message_id=user_message.id,
                 model=model,
                 api_key=api_key,
-                db=db
-            ):
-                # Check if client disconnected
-                if await http_request.is_disconnected():
-                    print("⚠️ Client disconnected during streaming, stopping...")
-                    break
-                yield event
+                db=db,
+                race_partner=race_partner
+            )
+            try:
+                async for event in ask_events:
+                    # Check if client disconnected
+                    if await http_request.is_disconnected():
+                        print("⚠️ Client disconnected during streaming, stopping...")
+                        break
+                    yield event
+            finally:
+                # Stop the background work (chart decisions) of an abandoned stream
+                await ask_events.aclose()
+            
+            # Fold older messages into the conversation summary in the background
+            conversation_summarizer.schedule(conversation.id, model, api_key)
             
         except Exception as e:
             print(f"❌ Error in ask stream: {str(e)}")
@@ -515,6 +578,12 @@ async def agent_mode(
                     print("⚠️ Client disconnected before processing started")
                     return
                 
+                # Allow callers to force a fresh answer instead of a cached one, and let
+                # lightweight stages route to a cheaper model using the user's other keys
+                set_cache_bypass(request_data.bypass_cache)
+                set_request_api_keys(user_api_keys)
+                set_pacing_profile(request_data.pacing)
+                
                 # Get or create conversation
                 conversation = None
                 if request_data.conversation_id:
@@ -545,6 +614,7 @@ async def agent_mode(
                 if is_confirmation_action:
                     db.flush()
                 else:
+                    autocomplete_service.record_prompt(user_id, request_data.query)
                     db.commit()
                 
                 # Use Agent Mode service to process the stream
@@ -562,6 +632,9 @@ async def agent_mode(
                         break
                     yield event
                 
+                # Fold older messages into the conversation summary in the background
+                conversation_summarizer.schedule(conversation.id, model, api_key)
+                
             except Exception as e:
                 print(f"❌ Agent error: {str(e)}")
                 import traceback
@@ -596,18 +669,27 @@ async def confirm_agent_operation_route(
             raise HTTPException(status_code=404, detail="Conversation not found")
         
         # Get API key from user settings if not provided
+        user_api_keys = crud.get_user_api_keys(db, user_id)
         if not request_data.api_key:
-            user_api_keys = crud.get_user_api_keys(db, user_id)
             if not user_api_keys:
                 raise HTTPException(status_code=404, detail="User not found")
             
             model = request_data.model or "gemini-2.5-flash"
             request_data.api_key = get_api_key_for_model(model, user_api_keys)
         
+        # Let lightweight stages route to a cheaper model with the user's other keys
+        set_request_api_keys(user_api_keys)
+        
         # Use Agent Mode service to confirm and execute operation with streaming
         async def event_generator():
+            set_pacing_profile(request_data.pacing)
             async for event in confirm_agent_operation_stream(request_data, db):
                 yield event
+            
+            # Fold older messages into the conversation summary in the background
+            conversation_summarizer.schedule(
+                request_data.conversation_id, request_data.model or "gemini-2.5-flash", request_data.api_key
+            )
         
         return StreamingResponse(
             event_generator(),
@@ -1,4 +1,5 @@
 """Chat page endpoints - includes attachments and conversation management."""
+import asyncio
 import os
 import uuid
 from pathlib import Path
@@ -13,6 +14,7 @@ from app.auth import get_current_user
 from app.database import get_db
 from app.models import User
 from app.config import get_settings
+from app.services.attachment_cache import attachment_cache
 
 settings = get_settings()
 
@@ -180,6 +182,13 @@ async def upload_chat_attachment(
             detail=f"Failed to save file: {str(e)}"
         )
     
+    # Pre-encode provider-ready (downscaled) payloads once, so chat turns never re-encode
+    if file.content_type.startswith("image/"):
+        try:
+            await asyncio.to_thread(attachment_cache.prepare, file_path, file_content, file.content_type)
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to pre-encode image attachment: {str(e)}")
+    
     # Return file information
     file_url = f"/uploads/chat/{unique_filename}"
     
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
 from sqlalchemy.orm import Session
 from typing import List
+import asyncio
 import json
 import os
 import tempfile
@@ -9,7 +10,9 @@ from pathlib import Path
 
 from app import crud, schemas
 from app.database import get_db
+from app.services.dataset_executor import dataset_executor
 from app.services.dataset_service import get_dataset_service
+from app.services.sql_examples import sql_examples
 
 router = APIRouter(prefix="/api/datasets", tags=["Dataset"])
 
@@ -96,12 +99,12 @@ async def upload_dataset(
         try:
             # Parse file based on type
             if file_ext == '.csv':
-                df, metadata = dataset_service.parse_csv(tmp_file_path)
+                df, metadata = await dataset_executor.read(dataset_service.parse_csv, tmp_file_path)
                 file_type = 'csv'
                 
                 # Save to database
                 table_name = Path(unique_filename).stem.replace(' ', '_').replace('-', '_')
-                dataset_service.save_to_database(df, table_name, user_id)
+                await dataset_executor.write(dataset_service.save_to_database, df, table_name, user_id)
                 
                 # Create dataset record
                 db_dataset = crud.create_dataset(
@@ -119,12 +122,12 @@ async def upload_dataset(
                 existing_datasets.append(db_dataset)
                 
             elif file_ext in ['.xlsx', '.xls']:
-                df, metadata = dataset_service.parse_excel(tmp_file_path)
+                df, metadata = await dataset_executor.read(dataset_service.parse_excel, tmp_file_path)
                 file_type = 'xlsx'
                 
                 # Save to database
                 table_name = Path(unique_filename).stem.replace(' ', '_').replace('-', '_')
-                dataset_service.save_to_database(df, table_name, user_id)
+                await dataset_executor.write(dataset_service.save_to_database, df, table_name, user_id)
                 
                 # Create dataset record
                 db_dataset = crud.create_dataset(
@@ -142,12 +145,12 @@ async def upload_dataset(
                 existing_datasets.append(db_dataset)
                 
             elif file_ext == '.json':
-                df, metadata = dataset_service.parse_json(tmp_file_path)
+                df, metadata = await dataset_executor.read(dataset_service.parse_json, tmp_file_path)
                 file_type = 'json'
                 
                 # Save to database
                 table_name = Path(unique_filename).stem.replace(' ', '_').replace('-', '_')
-                dataset_service.save_to_database(df, table_name, user_id)
+                await dataset_executor.write(dataset_service.save_to_database, df, table_name, user_id)
                 
                 # Create dataset record
                 db_dataset = crud.create_dataset(
@@ -165,13 +168,13 @@ async def upload_dataset(
                 existing_datasets.append(db_dataset)
                 
             elif file_ext in ['.db', '.sqlite', '.sqlite3']:
-                table_data, metadata = dataset_service.parse_database(tmp_file_path)
+                table_data, metadata = await dataset_executor.read(dataset_service.parse_database, tmp_file_path)
                 file_type = 'db'
                 
                 # Save each table from the database
                 for table_name, df in table_data:
                     safe_table_name = table_name.replace(' ', '_').replace('-', '_')
-                    dataset_service.save_to_database(df, safe_table_name, user_id)
+                    await dataset_executor.write(dataset_service.save_to_database, df, safe_table_name, user_id)
                     
                     table_metadata = dataset_service._get_dataframe_metadata(df)
                     
@@ -253,7 +256,7 @@ def get_dataset_data(
 
 
 @router.delete("/{dataset_id}", response_model=schemas.MessageResponseSimple)
-def delete_dataset(
+async def delete_dataset(
     dataset_id: int,
     request: Request,
     db: Session = Depends(get_db)
@@ -264,8 +267,8 @@ def delete_dataset(
     
     user_id = get_user_id_from_request(request, current_user_session)
     
-    # Get dataset record
-    dataset = crud.get_dataset(db, dataset_id)
+    # Get dataset record (session calls run off the event loop)
+    dataset = await asyncio.to_thread(crud.get_dataset, db, dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
@@ -273,16 +276,19 @@ def delete_dataset(
     if dataset.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Delete table from database
+    # Delete table from database (in the write lane, serialized with other dataset writes)
     dataset_service = get_dataset_service()
     try:
-        dataset_service.delete_table(dataset.table_name)
+        await dataset_executor.write(dataset_service.delete_table, dataset.table_name)
     except Exception as e:
         # Log error but continue with record deletion
         print(f"Warning: Failed to delete table {dataset.table_name}: {str(e)}")
     
+    # Delete the few-shot SQL examples of the table
+    await asyncio.to_thread(sql_examples.forget, db, dataset.table_name)
+    
     # Delete dataset record
-    success = crud.delete_dataset(db, dataset_id)
+    success = await asyncio.to_thread(crud.delete_dataset, db, dataset_id)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to delete dataset record")
     
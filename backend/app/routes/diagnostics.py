@@ -0,0 +1,90 @@
+"""Diagnostics API routes (provider pools, caches and runtime metrics)."""
+from typing import Any, Callable, Dict
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.auth import get_current_active_user
+
+from app.services.ai_service import ai_service
+from app.services.attachment_cache import attachment_cache
+from app.services.autocomplete_service import autocomplete_service
+from app.services.conversation_summarizer import conversation_summarizer
+from app.services.dataset_executor import dataset_executor
+from app.services.intent_classifier import intent_classifier
+from app.services.interaction_logger import interaction_logger
+from app.services.pacing import pacer
+from app.services.provider_clients import provider_clients
+from app.services.query_planner import query_planner
+from app.services.rate_limiter import rate_limiter
+from app.services.replay_provider import replay_provider
+from app.services.resilience import resilience
+from app.services.response_cache import response_cache
+from app.services.single_flight import single_flight
+from app.services.speculative_sql import speculative_sql
+from app.services.sql_examples import sql_examples
+from app.services.stage_router import stage_router
+from app.services.stop_rules import stop_rules
+from app.services.structured_output import structured_output
+from app.services.token_budget import token_budget
+
+# Every diagnostics route requires a signed-in user
+router = APIRouter(
+    prefix="/api/diagnostics",
+    tags=["Diagnostics"],
+    dependencies=[Depends(get_current_active_user)]
+)
+
+
+def _provider_stats() -> Dict[str, Any]:
+    """Provider client pool, coalescing and rate limit statistics."""
+    return {
+        "client_pool": provider_clients.get_stats(),
+        "replay": replay_provider.get_stats(),
+        "single_flight": single_flight.get_stats(),
+        "rate_limits": rate_limiter.get_stats(),
+        "race_wins": ai_service.race_wins
+    }
+
+
+# Section name -> stats provider; a new component registers its get_stats() here
+STATS_PROVIDERS: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "providers": _provider_stats,
+    "cache": response_cache.get_stats,
+    "circuit-breakers": resilience.get_stats,
+    "stages": stage_router.get_stats,
+    "attachments": attachment_cache.get_stats,
+    "interaction-log": interaction_logger.get_stats,
+    "autocomplete": autocomplete_service.get_stats,
+    "conversation-summaries": conversation_summarizer.get_stats,
+    "prompt-cache": ai_service.get_prompt_cache_stats,
+    "prompt-budget": token_budget.get_stats,
+    "pacing": pacer.get_stats,
+    "query-planner": query_planner.get_stats,
+    "speculative-sql": speculative_sql.get_stats,
+    "sql-examples": sql_examples.get_stats,
+    "stop-rules": stop_rules.get_stats,
+    "structured-output": structured_output.get_stats,
+    "dataset-executor": dataset_executor.get_stats,
+    "intent-classifier": intent_classifier.get_stats,
+}
+
+
+@router.get("")
+def get_diagnostics():
+    """Get the statistics of every registered component, keyed by section name."""
+    return {name: provider() for name, provider in STATS_PROVIDERS.items()}
+
+
+@router.get("/{section}")
+def get_diagnostics_section(section: str):
+    """Get the statistics of one registered component (e.g. "cache", "stages")."""
+    provider = STATS_PROVIDERS.get(section)
+    if provider is None:
+        raise HTTPException(status_code=404, detail=f"Unknown diagnostics section: {section}")
+    return provider()
+
+
+@router.delete("/cache")
+def clear_cache():
+    """Drop every cached LLM response."""
+    return {"removed": response_cache.clear()}
@@ -134,6 +134,9 @@ class AskRequest(BaseModel):
     model: str = Field(default="gemini-2.5-flash")
     selected_tables: Optional[List[str]] = None
     attachments: Optional[List[AttachmentInfo]] = []
+    bypass_cache: bool = False
+    race_mode: bool = False
+    pacing: Optional[str] = None  # Pacing profile ("none" or "demo"); server default if unset
 
 
 class AskResponse(BaseModel):
@@ -261,3 +264,4 @@ class AgentConfirmationRequest(BaseModel):
     confirmed: bool
     model: Optional[str] = None
     api_key: Optional[str] = None
+    pacing: Optional[str] = None
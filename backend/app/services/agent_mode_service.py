@@ -1,16 +1,20 @@
 """Agent Mode service for handling CRUD operations on datasets - Revised to work like Ask Mode."""
 import json
 import re
-import asyncio
 from typing import AsyncGenerator, List
 from sqlalchemy.orm import Session
 
 from app import crud, schemas
 from app.models import Message
 from app.services.ai_service import ai_service
+from app.services.dataset_executor import dataset_executor
+from app.services.interaction_logger import interaction_logger
+from app.services.pacing import pacer
 from app.services.dataset_service import get_dataset_service
 from app.services.sql_executor import extract_sql_from_response
 from app.services.query_executor import execute_select_query_with_chart, build_result_content_for_storage
+from app.services.speculative_sql import speculative_sql
+from app.services.stop_rules import stop_rules
 
 
 def _truncate_text_fields(data, max_length: int = 20):
@@ -112,6 +116,7 @@ async def process_agent_mode_stream(
             for msg in all_messages:
                 if msg.id != user_message_id:  # Exclude current message
                     conversation_history.append({
+                        "id": msg.id,
                         "role": msg.role,
                         "content": msg.content
                     })
@@ -120,7 +125,7 @@ async def process_agent_mode_stream(
     
     # Extract table names mentioned in the current user message to check for @general
     dataset_service = get_dataset_service()
-    available_tables = dataset_service.get_all_table_names()  # Get all available tables
+    available_tables = await dataset_executor.read(dataset_service.get_all_table_names)  # Get all available tables
     mentioned_tables = extract_table_names_from_message(request_data.query, available_tables)
     
     # Check if @general is used - redirect to general conversation
@@ -201,7 +206,7 @@ async def process_agent_mode_stream(
         for table_name in mentioned_tables:
             if table_name != "general":  # Skip @general as it's not a real table
                 try:
-                    schema = dataset_service.get_table_schema(table_name)
+                    schema = await dataset_executor.read(dataset_service.get_table_schema, table_name)
                     table_schemas.append(schema)
                 except Exception as e:
                     print(f"Failed to get schema for table {table_name}: {str(e)}")
@@ -244,7 +249,7 @@ async def handle_confirmation_response(
     for table_name in mentioned_tables:
         if table_name != "general":
             try:
-                schema = dataset_service.get_table_schema(table_name)
+                schema = await dataset_executor.read(dataset_service.get_table_schema, table_name)
                 table_schemas.append(schema)
             except Exception as e:
                 print(f"Failed to get schema for table {table_name}: {str(e)}")
@@ -266,7 +271,7 @@ async def handle_confirmation_response(
             operation = operation_match.group(1).strip()
             
             # Execute the operation
-            result = dataset_service.execute_write_query(sql_query)
+            result = await dataset_executor.write(dataset_service.execute_write_query, sql_query)
             
             # Remove confirmation buttons from the message
             updated_content = re.sub(r'\n\n<confirmation[^>]+/>', '', last_assistant_msg.content)
@@ -330,7 +335,9 @@ async def process_agent_operations_stream(
     """Process agent operations with streaming like ask mode."""
     
     # Use the exact same pattern as ask mode - start with AI analysis
-    ai_response = await ai_service.generate_response(
+    # (a SELECT starts running as soon as its block is complete)
+    speculation = speculative_sql.begin()
+    ai_response = await ai_service.generate_sql_response(
         query=request_data.query,
         model=model,
         api_key=api_key,
@@ -338,7 +345,9 @@ async def process_agent_operations_stream(
         table_schemas=table_schemas,
         is_agent_mode=True,
         db_session=db,
-        conversation_id=conversation_id
+        conversation_id=conversation_id,
+        stage="sql",
+        on_text=speculation.feed if speculation else None
     )
     
     # Send initial AI response like ask mode
@@ -431,7 +440,8 @@ async def process_agent_operations_stream(
             api_key=api_key,
             result_storage=result_storage,
             db_session=db,
-            conversation_id=conversation_id
+            conversation_id=conversation_id,
+            speculation=speculation
         ):
             yield event
         
@@ -450,7 +460,18 @@ async def process_agent_operations_stream(
         iteration = 1
         
         # Continue with multi-step queries if needed
+        stop_rules.record_turn()
         while iteration < max_iterations:
+            # Stop without a next-step call when the question's shape and the result show it is answered
+            if stop_rules.check(
+                request_data.query,
+                all_results[-1],
+                len(all_sql_queries),
+                multi_step='MULTI_STEP_QUERY' in ai_response,
+                agent_mode=True
+            ):
+                break
+            
             # Check if we should continue (like ask mode multi-step logic)
             # Build results summary for the prompt
             results_summary = []
@@ -517,14 +538,20 @@ Your decision:
             # Send loading status while AI decides next step
             yield f"data: {json.dumps({'type': 'loading', 'content': 'AI is analyzing results...'})}\n\n"
             
-            next_step_response = await ai_service.generate_response(
+            if speculation:
+                # The previous response's speculation was taken or is no longer needed
+                speculation.cancel()
+            speculation = speculative_sql.begin()
+            next_step_response = await ai_service.generate_sql_response(
                 query=next_step_prompt,
                 model=model,
                 api_key=api_key,
                 conversation_history=conversation_history,
                 table_schemas=table_schemas,
                 db_session=db,
-                conversation_id=conversation_id
+                conversation_id=conversation_id,
+                stage="next_step",
+                on_text=speculation.feed if speculation else None
             )
             
             if 'QUERY_COMPLETE' in next_step_response:
@@ -550,14 +577,14 @@ Your decision:
                 # Show AI is planning after the delay
                 yield f"data: {json.dumps({'type': 'loading', 'content': 'AI is planning...'})}\n\n"
                 
-                # Add delay to show planning status
-                await asyncio.sleep(1.0)
+                # Optional pause to show planning status (pacing profile)
+                await pacer.pause("agent_planning")
             else:
                 all_reasoning.append(None)
             
             # Send status that AI is writing SQL commands
             yield f"data: {json.dumps({'type': 'loading', 'content': 'AI is writing SQL commands...'})}\n\n"
-            await asyncio.sleep(0.5)
+            await pacer.pause("agent_writing_sql")
             
             # Check if next query is destructive and needs confirmation
             next_sql_upper = next_sql.upper().strip()
@@ -619,8 +646,8 @@ Your decision:
                 yield f"data: {json.dumps({'type': 'done', 'conversation_id': conversation_id, 'user_message_id': user_message_id, 'assistant_message_id': assistant_message.id})}\n\n"
                 return
             else:
-                # Add delay to show 'AI is writing SQL commands' message before execution
-                await asyncio.sleep(1.5)
+                # Optional pause to show 'AI is writing SQL commands' before execution (pacing profile)
+                await pacer.pause("agent_before_read")
                 
                 # Execute READ query normally
                 next_result_storage = {}
@@ -631,7 +658,8 @@ Your decision:
                     api_key=api_key,
                     result_storage=next_result_storage,
                     db_session=db,
-                    conversation_id=conversation_id
+                    conversation_id=conversation_id,
+                    speculation=speculation
                 ):
                     yield event
                 
@@ -883,15 +911,13 @@ Your decision:"""
     # Show loading status while AI analyzes
     yield f"data: {json.dumps({'type': 'loading', 'content': 'AI is analyzing data...'})}\n\n"
     
-    # Debug: Save prompt and response to file
-    import os
-    debug_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'debug')
-    os.makedirs(debug_dir, exist_ok=True)
-    
-    with open(os.path.join(debug_dir, 'agent_continuation_prompt.txt'), 'w', encoding='utf-8') as f:
-        f.write("=== AGENT CONTINUATION PROMPT ===\n\n")
-        f.write(next_step_prompt)
-        f.write("\n\n=== END PROMPT ===\n")
+    # Debug: record the continuation prompt (written by the background interaction logger)
+    interaction_logger.log({
+        "kind": "agent_continuation_prompt",
+        "model": model,
+        "conversation_id": conversation_id,
+        "prompt": next_step_prompt
+    })
     
     next_step_response = await ai_service.generate_response(
         query=next_step_prompt,
@@ -901,7 +927,8 @@ Your decision:"""
         table_schemas=table_schemas,
         is_agent_mode=True,
         db_session=db,
-        conversation_id=conversation_id
+        conversation_id=conversation_id,
+        stage="next_step"
     )
     
     if 'OPERATION_COMPLETE' in next_step_response:
@@ -969,11 +996,11 @@ Provide a concise, friendly summary of what was accomplished. Keep it under 2 se
             
             # Send the next step reasoning first
             yield f"data: {json.dumps({'type': 'brief_reasoning', 'content': next_message})}\n\n"
-            await asyncio.sleep(0.5)
+            await pacer.pause("agent_next_step")
             
             # Show loading status while preparing next step
             yield f"data: {json.dumps({'type': 'loading', 'content': 'AI is writing SQL commands...'})}\n\n"
-            await asyncio.sleep(0.5)
+            await pacer.pause("agent_writing_sql")
             
             if next_op_type == "READ":
                 # Execute READ operation with streaming
@@ -1091,7 +1118,7 @@ async def confirm_agent_operation_stream(
     
     # Execute the SQL operation
     dataset_service = get_dataset_service()
-    result = dataset_service.execute_write_query(request_data.sql_query)
+    result = await dataset_executor.write(dataset_service.execute_write_query, request_data.sql_query)
     
     # Build result message to append
     if result.get('success'):
@@ -1137,6 +1164,7 @@ async def confirm_agent_operation_stream(
             all_messages = crud.get_conversation_messages(db, request_data.conversation_id)
             for msg in all_messages:
                 conversation_history.append({
+                    "id": msg.id,
                     "role": msg.role,
                     "content": msg.content
                 })
@@ -1145,7 +1173,7 @@ async def confirm_agent_operation_stream(
         
         # Extract table names from conversation to get schemas
         dataset_service = get_dataset_service()
-        available_tables = dataset_service.get_all_table_names()
+        available_tables = await dataset_executor.read(dataset_service.get_all_table_names)
         
         # Find the original user message with @ mentions
         mentioned_tables = []
@@ -1160,7 +1188,7 @@ async def confirm_agent_operation_stream(
         for table_name in mentioned_tables:
             if table_name != "general":
                 try:
-                    schema = dataset_service.get_table_schema(table_name)
+                    schema = await dataset_executor.read(dataset_service.get_table_schema, table_name)
                     table_schemas.append(schema)
                 except Exception as e:
                     print(f"Failed to get schema for table {table_name}: {str(e)}")
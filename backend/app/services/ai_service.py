@@ -1,6 +1,27 @@
 """AI service for handling multiple AI providers."""
-import google.generativeai as genai
-from typing import Optional
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.attachment_cache import attachment_cache
+from app.services.history_sanitizer import sanitize_history
+from app.services.interaction_logger import interaction_logger
+from app.services.provider_clients import ProviderAPIError, provider_clients
+from app.services.query_planner import QUERY_PLAN_MARKER, query_planner
+from app.services.response_cache import response_cache
+from app.services.single_flight import single_flight
+from app.services.sql_examples import format_sql_examples_for_prompt, sql_examples
+from app.services.rate_limiter import estimate_tokens, rate_limiter
+from app.services.resilience import is_transient_error, resilience
+from app.services.stage_router import stage_router
+from app.services.structured_output import (
+    SQL_STEP_INSTRUCTIONS, SQL_STEP_SCHEMA, PartialJsonObject, SqlStep, anthropic_tool_args,
+    gemini_generation_config, openai_response_format, parse_structured, render_sql_step, structured_output
+)
+from app.services.token_budget import PromptSection, token_budget
 
 
 def _truncate_text_fields(data, max_length: int = 20):
@@ -23,12 +44,117 @@ def _truncate_text_fields(data, max_length: int = 20):
         return data
 
 
+def _joined_prompt(system_prompt: Optional[str], prompt: str) -> str:
+    """The full prompt as one string (system prefix followed by the per-turn prompt), as logged and keyed."""
+    return f"{system_prompt or ''}{prompt}"
+
+
+def _prompt_token_usage(usage) -> Tuple[int, int]:
+    """Extract (input_tokens, cached_input_tokens) from a provider's usage report."""
+    if usage is None:
+        return 0, 0
+    if hasattr(usage, "prompt_token_count"):
+        # Gemini (implicit prefix caching)
+        return usage.prompt_token_count or 0, getattr(usage, "cached_content_token_count", 0) or 0
+    if hasattr(usage, "input_tokens"):
+        # Anthropic: input_tokens excludes tokens read from or written to the cache
+        cached = getattr(usage, "cache_read_input_tokens", 0) or 0
+        written = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        return (usage.input_tokens or 0) + cached + written, cached
+    # OpenAI-compatible (DeepSeek reports its disk cache hits as prompt_cache_hit_tokens)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", 0) if details else 0) or getattr(usage, "prompt_cache_hit_tokens", 0) or 0
+    return getattr(usage, "prompt_tokens", 0) or 0, cached
+
+
+class ModelProvider:
+    """A model family that AIService can dispatch to."""
+    
+    def __init__(
+        self,
+        name: str,
+        prefixes: tuple,
+        generate,
+        generate_stream,
+        api_key_name: Optional[str] = None,
+        display_name: Optional[str] = None,
+        structured_output: bool = False
+    ):
+        """
+        Describe a provider.
+        
+        Args:
+            name: Short provider identifier (e.g., "gemini")
+            prefixes: Model name prefixes served by this provider
+            generate: Async callable (query, model, api_key, conversation_history, image_data_list,
+                system_prompt) -> str; system_prompt is the stable, cacheable prompt prefix
+            generate_stream: Async generator callable with the same arguments, yielding text chunks
+            api_key_name: Key in the user's API key dict, or None if no key is needed
+            display_name: Human-readable provider name used in error messages
+            structured_output: If True, generate/generate_stream also accept a response_schema
+                keyword ({"name", "description", "schema"}) and return JSON following it
+        """
+        self.name = name
+        self.prefixes = prefixes
+        self.generate = generate
+        self.generate_stream = generate_stream
+        self.api_key_name = api_key_name
+        self.display_name = display_name or name
+        self.structured_output = structured_output
+    
+    def matches(self, model: str) -> bool:
+        """Check whether this provider serves the given model."""
+        return any(model.startswith(prefix) for prefix in self.prefixes)
+
+
 class AIService:
     """Service for interacting with multiple AI providers."""
     
     def __init__(self):
-        """Initialize AI service."""
-        pass
+        """Initialize AI service and register the built-in providers."""
+        from app.services.replay_provider import replay_provider
+        
+        self._providers = []
+        self.race_wins: Dict[str, int] = {}
+        self._prefix_digests: "OrderedDict[int, str]" = OrderedDict()
+        self.prefix_stats: Dict[str, int] = {"stable": 0, "changed": 0}
+        self.prompt_cache_usage: Dict[str, Dict[str, int]] = {}
+        self.register_provider(ModelProvider(
+            "gemini", ("gemini",),
+            self._generate_gemini_response, self._generate_gemini_response_stream,
+            api_key_name="google", display_name="Google", structured_output=True
+        ))
+        self.register_provider(ModelProvider(
+            "openai", ("gpt",),
+            self._generate_openai_response, self._generate_openai_response_stream,
+            api_key_name="openai", display_name="OpenAI", structured_output=True
+        ))
+        self.register_provider(ModelProvider(
+            "anthropic", ("claude",),
+            self._generate_anthropic_response, self._generate_anthropic_response_stream,
+            api_key_name="anthropic", display_name="Anthropic", structured_output=True
+        ))
+        self.register_provider(ModelProvider(
+            "deepseek", ("deepseek",),
+            self._generate_deepseek_response, self._generate_deepseek_response_stream,
+            api_key_name="deepseek", display_name="DeepSeek", structured_output=True
+        ))
+        self.register_provider(ModelProvider(
+            "replay", ("local:", "replay:"),
+            replay_provider.generate, replay_provider.generate_stream,
+            api_key_name=None, display_name="Local replay"
+        ))
+    
+    def register_provider(self, provider: ModelProvider):
+        """Register a provider; later registrations take precedence over earlier ones."""
+        self._providers.insert(0, provider)
+    
+    def get_provider(self, model: str) -> ModelProvider:
+        """Resolve the provider serving a model, raising ValueError if none does."""
+        for provider in self._providers:
+            if provider.matches(model):
+                return provider
+        raise ValueError(f"Unsupported model: {model}")
     
     async def enhance_prompt(
         self,
@@ -73,17 +199,9 @@ Please refine this prompt by:
 
 Return ONLY the refined prompt, without any explanation, preamble, or quotation marks."""
 
-        # Use the same provider routing as generate_response
-        if model.startswith("gemini"):
-            return await self._generate_gemini_response(enhancement_instruction, model, api_key, None)
-        elif model.startswith("gpt"):
-            return await self._generate_openai_response(enhancement_instruction, model, api_key, None)
-        elif model.startswith("claude"):
-            return await self._generate_anthropic_response(enhancement_instruction, model, api_key, None)
-        elif model.startswith("deepseek"):
-            return await self._generate_deepseek_response(enhancement_instruction, model, api_key, None)
-        else:
-            raise ValueError(f"Unsupported model: {model}")
+        # Use the same provider routing (and response cache) as generate_response
+        model, api_key = stage_router.resolve("enhance", model, api_key)
+        return await self._generate_with_cache(enhancement_instruction, model, api_key, stage="enhance")
     
     async def autocomplete_prompt(
         self,
@@ -127,17 +245,55 @@ IMPORTANT:
 
 Complete naturally:"""
 
-        # Use the same provider routing as generate_response
-        if model.startswith("gemini"):
-            return await self._generate_gemini_response(autocomplete_instruction, model, api_key, None)
-        elif model.startswith("gpt"):
-            return await self._generate_openai_response(autocomplete_instruction, model, api_key, None)
-        elif model.startswith("claude"):
-            return await self._generate_anthropic_response(autocomplete_instruction, model, api_key, None)
-        elif model.startswith("deepseek"):
-            return await self._generate_deepseek_response(autocomplete_instruction, model, api_key, None)
-        else:
-            raise ValueError(f"Unsupported model: {model}")
+        # Use the same provider routing as generate_response (coalesced, never cached)
+        model, api_key = stage_router.resolve("autocomplete", model, api_key)
+        return await self._generate_with_cache(autocomplete_instruction, model, api_key, cacheable=False, stage="autocomplete")
+    
+    async def summarize_conversation(
+        self,
+        previous_summary: Optional[str],
+        messages: list,
+        model: str,
+        api_key: str,
+        max_words: int = 250
+    ) -> str:
+        """
+        Fold older conversation messages into a conversation's rolling summary.
+        
+        Args:
+            previous_summary: Current summary (None for the first update)
+            messages: Messages to fold in, oldest first ('role' and 'content')
+            model: Model identifier (e.g., "gemini-2.5-flash", "gpt-4o")
+            api_key: API key for the provider
+            max_words: Approximate length limit of the new summary
+            
+        Returns:
+            Updated summary text
+        """
+        transcript = "\n\n".join(
+            f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content'][:2000]}"
+            for msg in sanitize_history(messages)
+        )
+        
+        summary_instruction = f"""You maintain a running summary of a data analysis conversation so it can be continued without the full transcript.
+
+Current summary:
+{previous_summary or "(none yet)"}
+
+New messages:
+{transcript}
+
+Write the updated summary:
+- Keep the user's goals, the datasets and columns discussed, the SQL approaches used, key results and numbers, and any preferences or corrections the user stated
+- Drop greetings, repeated content and raw result rows
+- At most {max_words} words, plain text, no preamble
+
+Updated summary:"""
+
+        # Background stage: routed to a fast model, never served from the response cache
+        model, api_key = stage_router.resolve("conversation_summary", model, api_key)
+        summary = await self._generate_with_cache(summary_instruction, model, api_key, cacheable=False, stage="conversation_summary")
+        return summary.strip()
     
     async def generate_response(
         self,
@@ -150,7 +306,11 @@ Complete naturally:"""
         is_agent_mode: bool = False,
         attachments: Optional[list] = None,
         db_session = None,
-        conversation_id: Optional[int] = None
+        conversation_id: Optional[int] = None,
+        stage: str = "default",
+        on_text: Optional[Callable[[str], None]] = None,
+        response_schema: Optional[Dict] = None,
+        examples_query: Optional[str] = None
     ) -> str:
         """
         Generate a response using the specified AI model.
@@ -166,83 +326,405 @@ Complete naturally:"""
             attachments: Optional list of file attachments (images, etc.)
             db_session: Database session for extracting SQL/chart history
             conversation_id: ID of current conversation for history extraction
+            stage: Pipeline stage ("sql", "next_step", "chart", ...) used to pick timeouts
+            on_text: Called with the text received so far while the response streams in
+                (e.g. to start executing its SQL early); not called on cache hits
+            response_schema: Structured output schema (see structured_output), applied where
+                the provider supports it; the query itself should ask for the JSON too
+            examples_query: Question used to retrieve similar past SQL examples ("sql" stage
+                only; defaults to the query)
             
         Returns:
             Generated response string
         """
-        # Process image attachments - load and encode them
-        image_data_list = []
-        if attachments:
-            import base64
-            from pathlib import Path
-            
-            for att in attachments:
-                # Handle both Pydantic models and dictionaries
-                if hasattr(att, 'file_type'):
-                    # Pydantic model
-                    file_type = att.file_type
-                    file_url = att.url
-                    filename = att.filename
-                else:
-                    # Dictionary
-                    file_type = att.get('file_type', '')
-                    file_url = att.get('url', '')
-                    filename = att.get('filename', '')
-                
-                if file_type.startswith('image/'):
-                    try:
-                        # Convert URL to file path (remove leading slash and convert to absolute path)
-                        # Remove leading slash and construct full path
-                        file_path = Path(file_url.lstrip('/'))
-                        
-                        if file_path.exists():
-                            with open(file_path, 'rb') as f:
-                                image_bytes = f.read()
-                                image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-                                image_data_list.append({
-                                    'filename': filename,
-                                    'mime_type': file_type,
-                                    'data': image_base64
-                                })
-                    except Exception as e:
-                        print(f"⚠️ Failed to load image {filename}: {str(e)}")
+        # Resolve image attachments to content-addressed references; the provider-ready
+        # (downscaled, base64) payloads are looked up in the attachment cache per provider
+        image_data_list = await asyncio.to_thread(attachment_cache.load_references, attachments)
         
         # Build attachment context for text-only models
         attachment_context = ""
         if image_data_list:
             attachment_context = f"\n\nThe user has attached {len(image_data_list)} image(s). Please analyze them and answer the user's question."
         
-        # Build enhanced query with table schema context
+        # Determine model for this stage first: the prompt is fitted to its token budget
+        model, api_key = stage_router.resolve(stage, model, api_key)
+        
+        # Build the prompt as a stable prefix (sent as the system prompt so providers can
+        # cache it) and a per-turn suffix (SQL/chart history, attachments, question)
+        question = f"{attachment_context}\n\nUser Question: {query}"
         if is_general_mode:
             # General mode: Allow general conversation
-            schema_context = "You are AskQL, a friendly data analysis assistant. The user has tagged @general, which means they want to have a general conversation with you. You can answer questions about who you are, what you can do, and provide general information. Be helpful and friendly!\n\nIMPORTANT: You have access to the conversation history. When the user asks about previous questions or refers to earlier parts of the conversation, use the conversation history to provide context-aware responses. Remember what was discussed and reference it when relevant."
-            enhanced_query = f"{schema_context}{attachment_context}\n\nUser Question: {query}"
+            general_instructions = "You are AskQL, a friendly data analysis assistant. The user has tagged @general, which means they want to have a general conversation with you. You can answer questions about who you are, what you can do, and provide general information. Be helpful and friendly!\n\nIMPORTANT: You have access to the conversation history. When the user asks about previous questions or refers to earlier parts of the conversation, use the conversation history to provide context-aware responses. Remember what was discussed and reference it when relevant."
+            system_prompt, history_context, conversation_history, prompt_tokens = self._build_budgeted_prompt(
+                model, None, False, db_session, conversation_id, conversation_history, question, system_prompt=general_instructions
+            )
         else:
             # Data analysis mode: Enforce dataset requirement
-            schema_context = self._build_schema_context(table_schemas, is_agent_mode, db_session, conversation_id)
-            enhanced_query = f"{schema_context}{attachment_context}\n\nUser Question: {query}"
-        
-        # Log the prompt
-        self._log_ai_interaction(enhanced_query)
-        
-        # Determine provider from model name
-        response = None
-        if model.startswith("gemini"):
-            response = await self._generate_gemini_response(enhanced_query, model, api_key, conversation_history, image_data_list)
-        elif model.startswith("gpt"):
-            response = await self._generate_openai_response(enhanced_query, model, api_key, conversation_history, image_data_list)
-        elif model.startswith("claude"):
-            response = await self._generate_anthropic_response(enhanced_query, model, api_key, conversation_history, image_data_list)
-        elif model.startswith("deepseek"):
-            response = await self._generate_deepseek_response(enhanced_query, model, api_key, conversation_history, image_data_list)
-        else:
-            raise ValueError(f"Unsupported model: {model}")
+            examples = []
+            if stage == "sql" and table_schemas:
+                examples = await sql_examples.retrieve(
+                    examples_query or query, [schema['table_name'] for schema in table_schemas]
+                )
+            system_prompt, history_context, conversation_history, prompt_tokens = self._build_budgeted_prompt(
+                model, table_schemas, is_agent_mode, db_session, conversation_id, conversation_history, question,
+                examples=examples
+            )
+        enhanced_query = f"{history_context}{question}"
+        self._track_prompt_prefix(conversation_id, system_prompt)
+        
+        # Call the provider (served from the response cache when enabled)
+        table_names = [schema['table_name'] for schema in table_schemas] if table_schemas and not is_general_mode else None
+        started = time.monotonic()
+        try:
+            response = await self._generate_with_cache(
+                enhanced_query, model, api_key, conversation_history, image_data_list, table_names,
+                stage=stage, system_prompt=system_prompt, on_text=on_text, response_schema=response_schema
+            )
+        except Exception as e:
+            self._log_ai_interaction(
+                _joined_prompt(system_prompt, enhanced_query), None, model, stage, conversation_id, started,
+                error=str(e), prompt_tokens=prompt_tokens
+            )
+            raise
+        
+        # Log the interaction (queued for the background writer)
+        self._log_ai_interaction(
+            _joined_prompt(system_prompt, enhanced_query), response, model, stage, conversation_id, started,
+            prompt_tokens=prompt_tokens
+        )
+        
+        return response
+    
+    async def generate_sql_response(
+        self,
+        query: str,
+        model: str,
+        api_key: str,
+        on_text: Optional[Callable[[str], None]] = None,
+        **kwargs
+    ) -> str:
+        """
+        Generate a SQL or next-step response in the text format the pipeline parses.
+        
+        With structured output enabled, the model is asked for a SqlStep JSON object
+        (JSON schema or forced tool call where the provider supports it). The object
+        is parsed while it streams, so on_text receives the SQL block as soon as the
+        "sql" field is complete, and is then rendered as explanation, MULTI_STEP_QUERY
+        marker and ```sql block. If the call fails or its output is not a valid
+        SqlStep, the free-text response is used and parsed with the regexes as before.
+        
+        Args:
+            query: User's query or next-step prompt
+            model: Model identifier (e.g., "gemini-2.5-flash", "gpt-4o")
+            api_key: API key for the provider
+            on_text: Called with the text so far (see generate_response)
+            **kwargs: Remaining generate_response arguments (history, schemas, stage, ...)
+            
+        Returns:
+            Response text
+        """
+        if not structured_output.enabled:
+            return await self.generate_response(query=query, model=model, api_key=api_key, on_text=on_text, **kwargs)
+        
+        fields = PartialJsonObject()
+        
+        def on_json(text: str):
+            sql = fields.feed(text).get("sql")
+            if on_text and isinstance(sql, str) and sql.strip():
+                on_text(f"```sql\n{sql.strip()}\n```")
+        
+        structured_output.record(SQL_STEP_SCHEMA, "request")
+        try:
+            response = await self.generate_response(
+                query=f"{query}{SQL_STEP_INSTRUCTIONS}", model=model, api_key=api_key,
+                on_text=on_json, response_schema=SQL_STEP_SCHEMA, examples_query=query, **kwargs
+            )
+        except ProviderAPIError as e:
+            print(f"⚠️ Structured output request failed, retrying as free text: {str(e)}")
+            structured_output.record(SQL_STEP_SCHEMA, "fallback")
+            return await self.generate_response(query=query, model=model, api_key=api_key, on_text=on_text, **kwargs)
+        
+        step = parse_structured(response, SqlStep)
+        if step is None:
+            # Not JSON (e.g. the model wrote a ```sql block anyway): leave it to the regex path
+            structured_output.record(SQL_STEP_SCHEMA, "fallback")
+            if on_text:
+                on_text(response)
+            return response
         
-        # Log the response
-        self._log_ai_interaction(enhanced_query, response)
+        structured_output.record(SQL_STEP_SCHEMA, "parsed")
+        return render_sql_step(step)
+    
+    def pick_race_partner(self, model: str, user_api_keys: dict) -> Optional[Tuple[str, str]]:
+        """
+        Choose a model to race against the user's model.
+        
+        Args:
+            model: The user's chosen model
+            user_api_keys: The user's API keys by provider key name
+            
+        Returns:
+            (partner_model, api_key) from another provider with a configured key, or None
+        """
+        from app.config import get_settings
+        
+        try:
+            primary = self.get_provider(model)
+        except ValueError:
+            return None
         
+        for candidate in get_settings().race_partner_models:
+            try:
+                provider = self.get_provider(candidate)
+            except ValueError:
+                continue
+            if provider.name == primary.name or not provider.api_key_name:
+                continue
+            api_key = user_api_keys.get(provider.api_key_name)
+            if api_key:
+                return candidate, api_key
+        return None
+    
+    async def race_generate_response(
+        self,
+        candidates: List[Tuple[str, str]],
+        accept: Callable,
+        **kwargs
+    ) -> Tuple[str, str]:
+        """
+        Send the same request to several models at once and keep the first usable answer.
+        
+        Args:
+            candidates: (model, api_key) pairs, the user's own model first
+            accept: Callable(response) -> bool (or awaitable bool) deciding if a response wins
+            **kwargs: Remaining generate_response arguments (query, history, schemas, ...)
+            
+        Returns:
+            (response, model) of the winner. If no response is accepted, the user's
+            model's response is preferred, then any successful one.
+        """
+        started = time.monotonic()
+        tasks = {
+            asyncio.ensure_future(self.generate_response(model=model, api_key=api_key, **kwargs)): model
+            for model, api_key in candidates
+        }
+        results: Dict[str, str] = {}
+        errors: Dict[str, Exception] = {}
+        
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    model = tasks[task]
+                    if task.exception() is not None:
+                        errors[model] = task.exception()
+                        print(f"⚠️ Race candidate {model} failed: {str(errors[model])}")
+                        continue
+                    
+                    results[model] = task.result()
+                    verdict = accept(results[model])
+                    if asyncio.iscoroutine(verdict):
+                        verdict = await verdict
+                    if verdict:
+                        self.race_wins[model] = self.race_wins.get(model, 0) + 1
+                        print(f"🏁 Race won by {model} in {time.monotonic() - started:.2f}s")
+                        return results[model], model
+        finally:
+            # Cancel the slower candidates so they stop consuming tokens
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        
+        primary_model = candidates[0][0]
+        if primary_model in results:
+            return results[primary_model], primary_model
+        if results:
+            model, response = next(iter(results.items()))
+            return response, model
+        raise errors[primary_model]
+    
+    async def _generate_with_cache(
+        self,
+        prompt: str,
+        model: str,
+        api_key: str,
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None,
+        table_names: Optional[list] = None,
+        cacheable: bool = True,
+        stage: str = "default",
+        system_prompt: Optional[str] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+        response_schema: Optional[Dict] = None
+    ) -> str:
+        """
+        Call the provider for a stage's model, consulting the response cache first.
+        
+        The caller resolves the stage's model (stage_router.resolve) once, so the
+        model called is the one it logs and budgets the prompt for.
+        
+        Identical concurrent calls that miss the cache share one provider request;
+        with on_text every caller sharing it receives the streamed text.
+        
+        Args:
+            prompt: Fully built prompt
+            model: Model identifier, already resolved for the stage
+            api_key: API key for the provider
+            conversation_history: Optional list of previous messages for context
+            image_data_list: Optional list of image attachment references (see attachment_cache)
+            table_names: Dataset tables the prompt depends on (their version is part of the key)
+            cacheable: If False, skip the response cache (single-flight still applies)
+            stage: Pipeline stage used to pick timeouts
+            system_prompt: Stable prompt prefix sent ahead of the history (cacheable by providers)
+            on_text: If set, the provider response is streamed and this is called with the text so far
+            response_schema: Structured output schema passed to providers that support it
+            
+        Returns:
+            Generated response string
+        """
+        provider = self.get_provider(model)
+        full_prompt = _joined_prompt(system_prompt, prompt)
+        
+        cache_key = None
+        if cacheable and response_cache.is_active():
+            cache_key = await asyncio.to_thread(
+                response_cache.make_key, model, full_prompt, conversation_history, table_names, image_data_list
+            )
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                print(f"⚡ Response cache hit for {model}")
+                return cached
+        
+        flight_key = single_flight.make_key(model, api_key, full_prompt, conversation_history, image_data_list)
+        started = time.monotonic()
+        
+        if on_text is None:
+            async def call_provider():
+                response = await self._invoke(
+                    provider, prompt, model, api_key, conversation_history, image_data_list, stage, system_prompt,
+                    response_schema
+                )
+                stage_router.record_latency(stage, model, time.monotonic() - started)
+                if cache_key:
+                    await response_cache.set(cache_key, model, response)
+                return response
+            
+            return await single_flight.do(flight_key, call_provider)
+        
+        # Streamed: every caller sharing the flight receives the chunks, so each one's on_text runs
+        response = ""
+        async for chunk in single_flight.stream(
+            flight_key,
+            lambda: self._invoke_stream_with_retry(
+                provider, prompt, model, api_key, conversation_history, image_data_list, stage, system_prompt,
+                response_schema
+            )
+        ):
+            response += chunk
+            on_text(response)
+        stage_router.record_latency(stage, model, time.monotonic() - started)
+        if cache_key:
+            await response_cache.set(cache_key, model, response)
         return response
     
+    async def _invoke(
+        self,
+        provider: ModelProvider,
+        prompt: str,
+        model: str,
+        api_key: str,
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None,
+        stage: str = "default",
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
+    ) -> str:
+        """
+        Run one non-streaming provider call.
+        
+        Layers, outermost first: circuit breaker and retries, concurrency/rate
+        limits, then the stage's total timeout around the provider request itself.
+        """
+        if image_data_list:
+            image_data_list = await asyncio.to_thread(attachment_cache.materialize, image_data_list, provider.name)
+        structured = {"response_schema": response_schema} if response_schema and provider.structured_output else {}
+        
+        async def attempt():
+            return await rate_limiter.call(
+                provider.name, api_key, estimate_tokens(_joined_prompt(system_prompt, prompt), conversation_history),
+                lambda: resilience.with_timeout(
+                    provider.name, stage,
+                    provider.generate(prompt, model, api_key, conversation_history, image_data_list, system_prompt, **structured)
+                )
+            )
+        
+        return await resilience.call(provider.name, attempt)
+    
+    async def _invoke_stream(
+        self,
+        provider: ModelProvider,
+        prompt: str,
+        model: str,
+        api_key: str,
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None,
+        stage: str = "default",
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
+    ):
+        """Run one streaming provider call under rate limits, stage timeouts and the circuit breaker."""
+        if image_data_list:
+            image_data_list = await asyncio.to_thread(attachment_cache.materialize, image_data_list, provider.name)
+        structured = {"response_schema": response_schema} if response_schema and provider.structured_output else {}
+        
+        async for chunk in rate_limiter.stream(
+            provider.name, api_key, estimate_tokens(_joined_prompt(system_prompt, prompt), conversation_history),
+            lambda: resilience.stream(
+                provider.name, stage,
+                lambda: provider.generate_stream(
+                    prompt, model, api_key, conversation_history, image_data_list, system_prompt, **structured
+                )
+            )
+        ):
+            yield chunk
+    
+    async def _invoke_stream_with_retry(
+        self,
+        provider: ModelProvider,
+        prompt: str,
+        model: str,
+        api_key: str,
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None,
+        stage: str = "default",
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
+    ):
+        """
+        Run a streaming provider call for a complete response (not shown to the user as it streams).
+        
+        Streams are never retried once text has been emitted, but a transient failure
+        before the first chunk (timeout, connection error, 5xx) falls back to one
+        non-streaming call with _invoke's retries and backoff, yielded as a single chunk.
+        """
+        streamed = False
+        try:
+            async for chunk in self._invoke_stream(
+                provider, prompt, model, api_key, conversation_history, image_data_list, stage, system_prompt,
+                response_schema
+            ):
+                streamed = True
+                yield chunk
+        except Exception as e:
+            if streamed or not is_transient_error(e):
+                raise
+            print(f"🔁 {provider.name} stream failed before its first chunk ({str(e)[:80]}), retrying without streaming")
+            yield await self._invoke(
+                provider, prompt, model, api_key, conversation_history, image_data_list, stage, system_prompt,
+                response_schema
+            )
+    
     async def generate_response_stream(
         self,
         query: str,
@@ -252,7 +734,8 @@ Complete naturally:"""
         table_schemas: Optional[list] = None,
         attachments: Optional[list] = None,
         db_session = None,
-        conversation_id: Optional[int] = None
+        conversation_id: Optional[int] = None,
+        stage: str = "summary"
     ):
         """
         Generate a streaming response using the specified AI model.
@@ -267,89 +750,71 @@ Complete naturally:"""
             attachments: Optional list of file attachments (images, etc.)
             db_session: Database session for extracting SQL/chart history
             conversation_id: ID of current conversation for history extraction
+            stage: Pipeline stage used to pick the first-token and total timeouts
             
         Yields:
             Text chunks as they arrive
         """
-        # Process image attachments - load and encode them
-        image_data_list = []
-        if attachments:
-            import base64
-            from pathlib import Path
-            
-            for att in attachments:
-                # Handle both Pydantic models and dictionaries
-                if hasattr(att, 'file_type'):
-                    # Pydantic model
-                    file_type = att.file_type
-                    file_url = att.url
-                    filename = att.filename
-                else:
-                    # Dictionary
-                    file_type = att.get('file_type', '')
-                    file_url = att.get('url', '')
-                    filename = att.get('filename', '')
-                
-                if file_type.startswith('image/'):
-                    try:
-                        # Convert URL to file path (remove leading slash and convert to absolute path)
-                        # Remove leading slash and construct full path
-                        file_path = Path(file_url.lstrip('/'))
-                        
-                        if file_path.exists():
-                            with open(file_path, 'rb') as f:
-                                image_bytes = f.read()
-                                image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-                                image_data_list.append({
-                                    'filename': filename,
-                                    'mime_type': file_type,
-                                    'data': image_base64
-                                })
-                    except Exception as e:
-                        print(f"⚠️ Failed to load image {filename}: {str(e)}")
-        
-        # Build enhanced query with table schema context
-        # ALWAYS build schema context (even when empty) to enforce dataset requirement
-        schema_context = self._build_schema_context(table_schemas, False, db_session, conversation_id)
+        # Resolve image attachments to content-addressed references; the provider-ready
+        # (downscaled, base64) payloads are looked up in the attachment cache per provider
+        image_data_list = await asyncio.to_thread(attachment_cache.load_references, attachments)
         
         # Build attachment context for text-only models
         attachment_context = ""
         if image_data_list:
             attachment_context = f"\n\nThe user has attached {len(image_data_list)} image(s). Please analyze them and answer the user's question."
         
-        enhanced_query = f"{schema_context}{attachment_context}\n\nUser Question: {query}"
+        # Determine model for this stage first: the prompt is fitted to its token budget
+        model, api_key = stage_router.resolve(stage, model, api_key)
         
-        # Log the prompt
-        self._log_ai_interaction(enhanced_query)
+        # Build the stable, cacheable prompt prefix and the per-turn suffix
+        # ALWAYS build schema context (even when empty) to enforce dataset requirement
+        question = f"{attachment_context}\n\nUser Question: {query}"
+        system_prompt, history_context, conversation_history, prompt_tokens = self._build_budgeted_prompt(
+            model, table_schemas, False, db_session, conversation_id, conversation_history, question
+        )
+        self._track_prompt_prefix(conversation_id, system_prompt)
+        
+        enhanced_query = f"{history_context}{question}"
+        full_prompt = _joined_prompt(system_prompt, enhanced_query)
         
         # Collect full response for logging
         full_response = ""
         
-        # Determine provider from model name and stream
-        if model.startswith("gemini"):
-            async for chunk in self._generate_gemini_response_stream(enhanced_query, model, api_key, conversation_history):
-                full_response += chunk
-                yield chunk
-        elif model.startswith("gpt"):
-            async for chunk in self._generate_openai_response_stream(enhanced_query, model, api_key, conversation_history):
-                full_response += chunk
-                yield chunk
-        elif model.startswith("claude"):
-            async for chunk in self._generate_anthropic_response_stream(enhanced_query, model, api_key, conversation_history):
-                full_response += chunk
-                yield chunk
-        elif model.startswith("deepseek"):
-            async for chunk in self._generate_deepseek_response_stream(enhanced_query, model, api_key, conversation_history, image_data_list):
+        # Stream from the stage model's provider (identical concurrent streams share one call)
+        provider = self.get_provider(model)
+        flight_key = single_flight.make_key(model, api_key, full_prompt, conversation_history, image_data_list)
+        started = time.monotonic()
+        try:
+            async for chunk in single_flight.stream(
+                flight_key,
+                lambda: self._invoke_stream(
+                    provider, enhanced_query, model, api_key, conversation_history, image_data_list, stage, system_prompt
+                )
+            ):
                 full_response += chunk
                 yield chunk
-        else:
-            raise ValueError(f"Unsupported model: {model}")
+        except Exception as e:
+            self._log_ai_interaction(
+                full_prompt, full_response, model, stage, conversation_id, started,
+                error=str(e), prompt_tokens=prompt_tokens
+            )
+            raise
+        stage_router.record_latency(stage, model, time.monotonic() - started)
         
-        # Log the complete response
-        self._log_ai_interaction(enhanced_query, full_response)
+        # Log the complete response (queued for the background writer)
+        self._log_ai_interaction(full_prompt, full_response, model, stage, conversation_id, started, prompt_tokens=prompt_tokens)
     
-    def _build_schema_context(self, table_schemas: list, is_agent_mode: bool = False, db_session = None, conversation_id: Optional[int] = None) -> str:
-        """Build a context string from table schemas for the AI."""
+    def _build_prompt_prefix(self, table_schemas: list, is_agent_mode: bool = False, sample_rows: int = 2) -> str:
+        """
+        Build the stable part of the prompt: instructions, table schemas and rules.
+        
+        The result depends only on the mode and the tables (sorted by name), so it
+        is byte-identical across the turns of a conversation and can be served
+        from the providers' prompt caches. Anything that changes per turn belongs
+        in the history context or the question. `sample_rows` rows of sample data
+        are included per table (fewer when the prompt is over its token budget).
+        """
         # Note: No-dataset case is now handled by hardcoded message in ask.py
         # This method should only be called when tables are actually selected
         
@@ -357,29 +822,6 @@ Complete naturally:"""
         if not table_schemas:
             return "You are a friendly and helpful chatbot. Answer questions clearly, provide useful explanations, and keep the conversation safe and respectful. Avoid sharing or asking for sensitive or private information."
         
-        # Extract SQL and chart history if database session is available
-        sql_history_context = ""
-        chart_history_context = ""
-        if db_session and conversation_id:
-            try:
-                from app.crud.history import get_history_context_for_ai
-                
-                history_context = get_history_context_for_ai(
-                    db_session, 
-                    conversation_id,
-                    max_sql_entries=20,
-                    max_chart_entries=20
-                )
-                
-                sql_history_context = history_context["sql_context"]
-                chart_history_context = history_context["chart_context"]
-                    
-            except Exception as e:
-                print(f"⚠️ Warning: Failed to extract history context: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                # Continue without history context
-        
         if is_agent_mode:
             # Agent Mode initial prompt - consistent with multi-step analysis format
             context_parts = [
@@ -434,7 +876,7 @@ Complete naturally:"""
                 ""
             ]
         
-        for schema in table_schemas:
+        for schema in sorted(table_schemas, key=lambda schema: schema['table_name']):
             table_name = schema['table_name']
             columns = schema['columns']
             sample_data = schema.get('sample_data', [])
@@ -447,15 +889,18 @@ Complete naturally:"""
                     col_info += " [PRIMARY KEY]"
                 context_parts.append(col_info)
             
-            if sample_data:
+            if sample_data and sample_rows:
                 context_parts.append("\nSample Data (check date/number formats):")
                 import json
                 # Apply text truncation and numerical formatting to sample data
-                formatted_sample_data = _truncate_text_fields(sample_data[:2], max_length=20)
+                formatted_sample_data = _truncate_text_fields(sample_data[:sample_rows], max_length=20)
                 context_parts.append(json.dumps(formatted_sample_data, indent=2))  # Only 2 rows instead of 3
             
             context_parts.append("")
         
+        # Structured SQL steps hold a single query, so plans are only offered as free text
+        offer_query_plan = query_planner.enabled and not is_agent_mode and not structured_output.enabled
+        
         context_parts.extend([
             "Rules:",
             "1. MULTIPLE QUERIES: If user asks to 'run X queries' or 'show me 5 queries':",
@@ -466,11 +911,18 @@ Complete naturally:"""
             "   - Continue one query at a time until all requested queries are complete",
             "   - When done, respond with 'QUERY_COMPLETE'",
             "",
-            "2. EXPLORATORY QUESTIONS: If the question is broad/vague like 'What patterns do you see?', 'Analyze this data', 'Show me something interesting', 'What trends exist?', 'Tell me about this data':",
-            "   - Start with 'MULTI_STEP_QUERY: Step 1' to get a manageable sample (e.g., SELECT * FROM table LIMIT 100)",
-            "   - After seeing results, identify 1-2 specific patterns worth exploring",
-            "   - Do NOT generate multiple complex queries upfront - let the data guide you",
-            "   - Keep analysis focused and concise (2-3 queries max)",
+        ])
+        if offer_query_plan:
+            context_parts.extend(query_planner.prompt_rules())
+        else:
+            context_parts.extend([
+                "2. EXPLORATORY QUESTIONS: If the question is broad/vague like 'What patterns do you see?', 'Analyze this data', 'Show me something interesting', 'What trends exist?', 'Tell me about this data':",
+                "   - Start with 'MULTI_STEP_QUERY: Step 1' to get a manageable sample (e.g., SELECT * FROM table LIMIT 100)",
+                "   - After seeing results, identify 1-2 specific patterns worth exploring",
+                "   - Do NOT generate multiple complex queries upfront - let the data guide you",
+                "   - Keep analysis focused and concise (2-3 queries max)",
+            ])
+        context_parts.extend([
             "",
             "3. SPECIFIC QUESTIONS: If question asks for specific data (top 10, average, where X > Y), generate targeted SQL immediately",
             "",
@@ -482,44 +934,225 @@ Complete naturally:"""
             "",
             "7. Use EXACT table names. Generate SQL in ```sql``` blocks. Keep it simple.",
             "",
-            "CRITICAL: Only provide ONE SQL query per response. Never include multiple ```sql``` blocks in a single response.",
+            "CRITICAL: Only provide ONE SQL query per response. Never include multiple ```sql``` blocks in a single response."
+            + (f" The only exception is a {QUERY_PLAN_MARKER} for an exploratory question." if offer_query_plan else ""),
             ""
         ])
         
-        # Add history context to the end of the prompt
-        context_string = "\n".join(context_parts)
-        context_string += sql_history_context + chart_history_context
-        
-        return context_string
+        return "\n".join(context_parts)
     
-    def _log_ai_interaction(self, prompt: str, response: str = None):
-        """Simple logging of AI prompts and responses."""
+    def _load_history_records(self, table_schemas: list, db_session = None, conversation_id: Optional[int] = None) -> Tuple[list, list]:
+        """Load the recent SQL and chart history records (newest first) of a conversation."""
+        if not table_schemas or not db_session or not conversation_id:
+            return [], []
+        
         try:
-            import os
-            from datetime import datetime
+            from app.crud.history import get_recent_chart_history, get_recent_sql_history
             
-            # Create debug directory if it doesn't exist
-            debug_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'debug')
-            os.makedirs(debug_dir, exist_ok=True)
+            return (
+                get_recent_sql_history(db_session, conversation_id, limit=20),
+                get_recent_chart_history(db_session, conversation_id, limit=20)
+            )
+        
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to extract history context: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            # Continue without history context
+            return [], []
+    
+    def _load_conversation_summary(self, db_session = None, conversation_id: Optional[int] = None) -> Tuple[str, int]:
+        """Load a conversation's rolling summary as prompt context and the id of the last message it covers."""
+        if not db_session or not conversation_id:
+            return "", 0
+        
+        try:
+            from app.crud.summary import get_conversation_summary
             
-            # Single log file for all interactions
-            log_file = os.path.join(debug_dir, 'ai_prompts_responses.txt')
+            summary = get_conversation_summary(db_session, conversation_id)
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to load conversation summary: {str(e)}")
+            return "", 0
+        if summary is None or not summary.summary:
+            return "", 0
+        return f"\n\n**SUMMARY OF THE EARLIER CONVERSATION:**\n{summary.summary}\n", summary.last_message_id
+    
+    def _build_budgeted_prompt(
+        self,
+        model: str,
+        table_schemas: Optional[list],
+        is_agent_mode: bool,
+        db_session,
+        conversation_id: Optional[int],
+        conversation_history: Optional[list],
+        question: str,
+        system_prompt: Optional[str] = None,
+        examples: Optional[list] = None
+    ) -> Tuple[str, str, Optional[list], Dict[str, int]]:
+        """
+        Build the prompt sections and trim them to the model's token budget.
+        
+        Result tables and charts in the conversation history are first replaced by
+        digests (see history_sanitizer), and messages already folded into the
+        conversation's rolling summary are replaced by that summary. Trimmed first to
+        last: conversation history messages (oldest first), chart history, similar past
+        SQL examples (least similar first), SQL history (oldest first), the summary, then
+        sample rows. Instructions, table columns and the question are always kept.
+        
+        Args:
+            model: Model the prompt is sent to (selects the budget)
+            table_schemas: Selected table schemas
+            is_agent_mode: Use the agent mode instructions
+            db_session: Database session for SQL/chart history and the conversation summary
+            conversation_id: Conversation for SQL/chart history and the conversation summary
+            conversation_history: Previous messages sent alongside the prompt
+            question: Per-turn text after the history (attachments note and question)
+            system_prompt: Fixed instructions to use instead of the schema prefix (general mode)
+            examples: Similar past SQL examples, retrieved beforehand (see sql_examples.retrieve)
             
-            # Write to file
-            with open(log_file, 'a', encoding='utf-8') as f:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                f.write(f"# AI PROMPT [{timestamp}]\n")
-                f.write(prompt)
-                f.write(f"\n# END PROMPT [{timestamp}]\n\n")
-                
-                if response:
-                    f.write(f"# AI RESPONSE [{timestamp}]\n")
-                    f.write(response)
-                    f.write(f"\n# END RESPONSE [{timestamp}]\n\n")
-                    
+        Returns:
+            (system_prompt, history_context, conversation_history, estimated tokens per section)
+        """
+        from app.crud.history import format_history_context_for_ai
+        
+        sql_records, chart_records = self._load_history_records(table_schemas, db_session, conversation_id)
+        summary_context, summarized_up_to = self._load_conversation_summary(db_session, conversation_id)
+        examples = examples or []
+        # Providers only see the last 10 messages not covered by the summary; earlier
+        # results go out as compact digests
+        recent = [
+            msg for msg in (conversation_history or [])
+            if not summarized_up_to or msg.get("id") is None or msg["id"] > summarized_up_to
+        ]
+        messages = sanitize_history(recent[-10:])
+        
+        fixed = {"question": question}
+        sections = [
+            PromptSection(
+                "conversation_history",
+                lambda k: "\n".join(str(msg.get("content", "")) for msg in messages[len(messages) - k:]),
+                len(messages), priority=0
+            ),
+            PromptSection(
+                "chart_history",
+                lambda k: format_history_context_for_ai([], chart_records[:k])["chart_context"],
+                len(chart_records), priority=1
+            ),
+            PromptSection(
+                "sql_examples",
+                lambda k: format_sql_examples_for_prompt(examples[:k]),
+                len(examples), priority=2
+            ),
+            PromptSection(
+                "sql_history",
+                lambda k: format_history_context_for_ai(sql_records[:k], [])["sql_context"],
+                len(sql_records), priority=3
+            ),
+            PromptSection(
+                "conversation_summary",
+                lambda k: summary_context if k else "",
+                1 if summary_context else 0, priority=4
+            )
+        ]
+        if system_prompt is not None:
+            fixed["instructions"] = system_prompt
+        else:
+            # Instructions and table columns are always sent; only sample rows can go
+            sections.append(PromptSection(
+                "schema",
+                lambda k: self._build_prompt_prefix(table_schemas, is_agent_mode, sample_rows=k),
+                2, priority=5
+            ))
+        
+        counts, tokens = token_budget.fit(model, fixed, sections)
+        
+        if system_prompt is None:
+            system_prompt = self._build_prompt_prefix(table_schemas, is_agent_mode, sample_rows=counts["schema"])
+        history = format_history_context_for_ai(sql_records[:counts["sql_history"]], chart_records[:counts["chart_history"]])
+        history_context = (
+            (summary_context if counts["conversation_summary"] else "")
+            + history["sql_context"] + history["chart_context"]
+            + format_sql_examples_for_prompt(examples[:counts["sql_examples"]])
+        )
+        if conversation_history:
+            conversation_history = messages[len(messages) - counts["conversation_history"]:]
+        
+        return system_prompt, history_context, conversation_history, tokens
+    
+    def _track_prompt_prefix(self, conversation_id: Optional[int], prefix: str):
+        """Count whether a conversation's prompt prefix stayed byte-identical since its last turn."""
+        if not conversation_id:
+            return
+        digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        previous = self._prefix_digests.pop(conversation_id, None)
+        if previous is not None:
+            self.prefix_stats["stable" if previous == digest else "changed"] += 1
+        self._prefix_digests[conversation_id] = digest
+        while len(self._prefix_digests) > 1000:
+            self._prefix_digests.popitem(last=False)
+    
+    def _record_prompt_cache_usage(self, provider: str, usage):
+        """Accumulate the input tokens a provider reported and how many were served from its prompt cache."""
+        try:
+            input_tokens, cached_tokens = _prompt_token_usage(usage)
         except Exception as e:
-            print(f"⚠️ Warning: Failed to log AI interaction: {str(e)}")
+            print(f"⚠️ Warning: Failed to read {provider} token usage: {str(e)}")
+            return
+        totals = self.prompt_cache_usage.setdefault(provider, {"calls": 0, "input_tokens": 0, "cached_tokens": 0})
+        totals["calls"] += 1
+        totals["input_tokens"] += input_tokens
+        totals["cached_tokens"] += cached_tokens
+        if cached_tokens:
+            print(f"🧊 {provider} prompt cache: {cached_tokens}/{input_tokens} input tokens cached")
+    
+    def get_prompt_cache_stats(self) -> Dict[str, object]:
+        """Return prefix stability counters and provider-reported cached input tokens."""
+        return {
+            "prefix": dict(self.prefix_stats),
+            "providers": {
+                provider: {
+                    **usage,
+                    "cached_ratio": round(usage["cached_tokens"] / usage["input_tokens"], 3) if usage["input_tokens"] else 0.0
+                }
+                for provider, usage in self.prompt_cache_usage.items()
+            }
+        }
+    
+    def _log_ai_interaction(
+        self,
+        prompt: str,
+        response: Optional[str],
+        model: str,
+        stage: str,
+        conversation_id: Optional[int],
+        started: float,
+        error: Optional[str] = None,
+        prompt_tokens: Optional[Dict[str, int]] = None
+    ):
+        """
+        Queue a structured record of an AI call; the file I/O happens on the logger's thread.
+        
+        Args:
+            prompt: Full prompt sent to the provider
+            response: Response text (partial for failed streams)
+            model: Model that served the call
+            stage: Pipeline stage
+            conversation_id: Conversation the call belongs to
+            started: time.monotonic() when the call started
+            error: Error message if the call failed
+            prompt_tokens: Estimated tokens per prompt section (see token_budget)
+        """
+        interaction_logger.log({
+            "model": model,
+            "stage": stage,
+            "conversation_id": conversation_id,
+            "latency_ms": round((time.monotonic() - started) * 1000),
+            "status": "error" if error else "ok",
+            "error": error,
+            "prompt_tokens": prompt_tokens,
+            "prompt": prompt,
+            "response": response
+        }, always=bool(error))
     
     async def _generate_gemini_response(
         self,
@@ -527,35 +1160,38 @@ Complete naturally:"""
         model: str,
         api_key: str,
         conversation_history: Optional[list] = None,
-        image_data_list: Optional[list] = None
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
     ) -> str:
         """Generate response using Google Gemini with vision support."""
         try:
-            import PIL.Image
-            import io
             import base64
             
-            # Configure with user's API key
-            genai.configure(api_key=api_key)
-            gemini_model = genai.GenerativeModel(model)
+            # Use the pooled client for this user's API key; the stable prefix goes in the
+            # system instruction, ahead of the history, where implicit caching can reuse it
+            gemini_model = provider_clients.get_gemini_model(model, api_key, system_instruction=system_prompt)
             
             # Prepare content parts (text + images)
             content_parts = []
             
-            # Add images first if provided
+            # Add images first if provided (sent as inline blobs, no PIL round-trip)
             if image_data_list:
                 for img_data in image_data_list:
                     try:
-                        # Decode base64 image
-                        image_bytes = base64.b64decode(img_data['data'])
-                        image = PIL.Image.open(io.BytesIO(image_bytes))
-                        content_parts.append(image)
+                        content_parts.append({
+                            "mime_type": img_data['mime_type'],
+                            "data": base64.b64decode(img_data['data'])
+                        })
                     except Exception as e:
                         print(f"⚠️ Failed to process image for Gemini: {str(e)}")
             
             # Add text query
             content_parts.append(query)
             
+            # Structured output: JSON constrained to the schema
+            structured = {"generation_config": gemini_generation_config(response_schema)} if response_schema else {}
+            
             if conversation_history:
                 # Build conversation context
                 context_messages = []
@@ -568,15 +1204,16 @@ Complete naturally:"""
                 
                 # Start chat with history
                 chat = gemini_model.start_chat(history=context_messages)
-                response = chat.send_message(content_parts)
+                response = await chat.send_message_async(content_parts, **structured)
             else:
                 # Simple query without history
-                response = gemini_model.generate_content(content_parts)
+                response = await gemini_model.generate_content_async(content_parts, **structured)
             
+            self._record_prompt_cache_usage("gemini", getattr(response, "usage_metadata", None))
             return response.text
         
         except Exception as e:
-            raise Exception(f"Gemini API error: {str(e)}")
+            raise ProviderAPIError("Gemini", e) from e
     
     async def _generate_openai_response(
         self,
@@ -584,16 +1221,14 @@ Complete naturally:"""
         model: str,
         api_key: str,
         conversation_history: Optional[list] = None,
-        image_data_list: Optional[list] = None
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
     ) -> str:
         """Generate response using OpenAI with vision support."""
         try:
-            import openai
-            
-            client = openai.OpenAI(api_key=api_key)
-            
-            # Build messages
-            messages = []
+            # Build messages (the stable prefix first, so it can be served from the prompt cache)
+            messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
             if conversation_history:
                 for msg in conversation_history[-10:]:
                     messages.append({
@@ -615,16 +1250,20 @@ Complete naturally:"""
             else:
                 messages.append({"role": "user", "content": query})
             
-            # Generate response
-            response = client.chat.completions.create(
+            # Generate response on the pooled async client so the event loop stays free
+            structured = {"response_format": openai_response_format(response_schema)} if response_schema else {}
+            client = provider_clients.get_openai_client(api_key)
+            response = await client.chat.completions.create(
                 model=model,
-                messages=messages
+                messages=messages,
+                **structured
             )
             
+            self._record_prompt_cache_usage("openai", response.usage)
             return response.choices[0].message.content
         
         except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+            raise ProviderAPIError("OpenAI", e) from e
     
     async def _generate_anthropic_response(
         self,
@@ -632,14 +1271,12 @@ Complete naturally:"""
         model: str,
         api_key: str,
         conversation_history: Optional[list] = None,
-        image_data_list: Optional[list] = None
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
     ) -> str:
         """Generate response using Anthropic Claude with vision support."""
         try:
-            import anthropic
-            
-            client = anthropic.Anthropic(api_key=api_key)
-            
             # Build messages
             messages = []
             if conversation_history:
@@ -666,17 +1303,32 @@ Complete naturally:"""
             else:
                 messages.append({"role": "user", "content": query})
             
-            # Generate response
-            response = client.messages.create(
+            # Generate response on the pooled async client so the event loop stays free
+            # Mark the stable prefix as a prompt cache breakpoint
+            system_blocks = {}
+            if system_prompt:
+                system_blocks["system"] = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+            
+            # Structured output: force a tool call whose input follows the schema
+            structured = anthropic_tool_args(response_schema) if response_schema else {}
+            
+            client = provider_clients.get_anthropic_client(api_key)
+            response = await client.messages.create(
                 model=model,
                 max_tokens=4096,
-                messages=messages
+                messages=messages,
+                **system_blocks,
+                **structured
             )
             
+            self._record_prompt_cache_usage("anthropic", response.usage)
+            for block in response.content:
+                if block.type == "tool_use":
+                    return json.dumps(block.input)
             return response.content[0].text
         
         except Exception as e:
-            raise Exception(f"Anthropic API error: {str(e)}")
+            raise ProviderAPIError("Anthropic", e) from e
     
     async def _generate_deepseek_response(
         self,
@@ -684,20 +1336,14 @@ Complete naturally:"""
         model: str,
         api_key: str,
         conversation_history: Optional[list] = None,
-        image_data_list: Optional[list] = None
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
     ) -> str:
         """Generate response using DeepSeek (text-only, no vision support)."""
         try:
-            from openai import OpenAI
-            
-            # DeepSeek uses OpenAI-compatible API but doesn't support vision
-            client = OpenAI(
-                api_key=api_key,
-                base_url="https://api.deepseek.com"
-            )
-            
-            # Build messages
-            messages = []
+            # Build messages (the stable prefix first, so it can be served from the prompt cache)
+            messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
             if conversation_history:
                 for msg in conversation_history[-10:]:
                     messages.append({
@@ -714,29 +1360,37 @@ Complete naturally:"""
             else:
                 messages.append({"role": "user", "content": query})
             
-            # Generate response
-            response = client.chat.completions.create(
+            # DeepSeek uses OpenAI-compatible API but doesn't support vision
+            # (and only JSON mode, not schemas: the prompt carries the field list)
+            structured = {"response_format": {"type": "json_object"}} if response_schema else {}
+            client = provider_clients.get_deepseek_client(api_key)
+            response = await client.chat.completions.create(
                 model=model,
-                messages=messages
+                messages=messages,
+                **structured
             )
             
+            self._record_prompt_cache_usage("deepseek", response.usage)
             return response.choices[0].message.content
         
         except Exception as e:
-            raise Exception(f"DeepSeek API error: {str(e)}")
+            raise ProviderAPIError("DeepSeek", e) from e
     
-    # Streaming methods
+    # Streaming methods (image_data_list is accepted by all of them for a uniform provider interface)
     async def _generate_gemini_response_stream(
         self,
         query: str,
         model: str,
         api_key: str,
-        conversation_history: Optional[list] = None
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
     ):
         """Generate streaming response using Google Gemini."""
         try:
-            genai.configure(api_key=api_key)
-            gemini_model = genai.GenerativeModel(model)
+            gemini_model = provider_clients.get_gemini_model(model, api_key, system_instruction=system_prompt)
+            structured = {"generation_config": gemini_generation_config(response_schema)} if response_schema else {}
             
             if conversation_history:
                 context_messages = []
@@ -747,31 +1401,32 @@ Complete naturally:"""
                         "parts": [msg["content"]]
                     })
                 chat = gemini_model.start_chat(history=context_messages)
-                response = chat.send_message(query, stream=True)
+                response = await chat.send_message_async(query, stream=True, **structured)
             else:
-                response = gemini_model.generate_content(query, stream=True)
+                response = await gemini_model.generate_content_async(query, stream=True, **structured)
             
-            for chunk in response:
+            async for chunk in response:
                 if chunk.text:
                     yield chunk.text
+            
+            self._record_prompt_cache_usage("gemini", getattr(response, "usage_metadata", None))
         
         except Exception as e:
-            raise Exception(f"Gemini API error: {str(e)}")
+            raise ProviderAPIError("Gemini", e) from e
     
     async def _generate_openai_response_stream(
         self,
         query: str,
         model: str,
         api_key: str,
-        conversation_history: Optional[list] = None
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
     ):
         """Generate streaming response using OpenAI."""
         try:
-            import openai
-            
-            client = openai.OpenAI(api_key=api_key)
-            
-            messages = []
+            messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
             if conversation_history:
                 for msg in conversation_history[-10:]:
                     messages.append({
@@ -781,32 +1436,38 @@ Complete naturally:"""
             
             messages.append({"role": "user", "content": query})
             
-            stream = client.chat.completions.create(
+            structured = {"response_format": openai_response_format(response_schema)} if response_schema else {}
+            client = provider_clients.get_openai_client(api_key)
+            stream = await client.chat.completions.create(
                 model=model,
                 messages=messages,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True},
+                **structured
             )
             
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    # Sent in a final chunk without choices
+                    self._record_prompt_cache_usage("openai", chunk.usage)
         
         except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+            raise ProviderAPIError("OpenAI", e) from e
     
     async def _generate_anthropic_response_stream(
         self,
         query: str,
         model: str,
         api_key: str,
-        conversation_history: Optional[list] = None
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
     ):
         """Generate streaming response using Anthropic Claude."""
         try:
-            import anthropic
-            
-            client = anthropic.Anthropic(api_key=api_key)
-            
             messages = []
             if conversation_history:
                 for msg in conversation_history[-10:]:
@@ -817,16 +1478,34 @@ Complete naturally:"""
             
             messages.append({"role": "user", "content": query})
             
-            with client.messages.stream(
+            # Mark the stable prefix as a prompt cache breakpoint
+            system_blocks = {}
+            if system_prompt:
+                system_blocks["system"] = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+            
+            # Structured output: force a tool call and stream its JSON input
+            structured = anthropic_tool_args(response_schema) if response_schema else {}
+            
+            client = provider_clients.get_anthropic_client(api_key)
+            async with client.messages.stream(
                 model=model,
                 max_tokens=4096,
-                messages=messages
+                messages=messages,
+                **system_blocks,
+                **structured
             ) as stream:
-                for text in stream.text_stream:
-                    yield text
+                if structured:
+                    async for event in stream:
+                        if event.type == "content_block_delta" and event.delta.type == "input_json_delta":
+                            yield event.delta.partial_json
+                else:
+                    async for text in stream.text_stream:
+                        yield text
+                final_message = await stream.get_final_message()
+                self._record_prompt_cache_usage("anthropic", final_message.usage)
         
         except Exception as e:
-            raise Exception(f"Anthropic API error: {str(e)}")
+            raise ProviderAPIError("Anthropic", e) from e
     
     async def _generate_deepseek_response_stream(
         self,
@@ -834,18 +1513,13 @@ Complete naturally:"""
         model: str,
         api_key: str,
         conversation_history: Optional[list] = None,
-        image_data_list: Optional[list] = None
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None,
+        response_schema: Optional[Dict] = None
     ):
         """Generate streaming response using DeepSeek (text-only, no vision support)."""
         try:
-            from openai import OpenAI
-            
-            client = OpenAI(
-                api_key=api_key,
-                base_url="https://api.deepseek.com"
-            )
-            
-            messages = []
+            messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
             if conversation_history:
                 for msg in conversation_history[-10:]:
                     messages.append({
@@ -862,18 +1536,25 @@ Complete naturally:"""
             else:
                 messages.append({"role": "user", "content": query})
             
-            stream = client.chat.completions.create(
+            structured = {"response_format": {"type": "json_object"}} if response_schema else {}
+            client = provider_clients.get_deepseek_client(api_key)
+            stream = await client.chat.completions.create(
                 model=model,
                 messages=messages,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True},
+                **structured
             )
             
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    # Sent in a final chunk without choices
+                    self._record_prompt_cache_usage("deepseek", chunk.usage)
         
         except Exception as e:
-            raise Exception(f"DeepSeek API error: {str(e)}")
+            raise ProviderAPIError("DeepSeek", e) from e
 
 
 # Singleton instance
@@ -1,14 +1,26 @@
 """Ask Mode service for handling data analysis queries with SQL execution and visualization."""
+import asyncio
 import json
 import re
-from typing import Optional, AsyncGenerator
+from typing import Optional, AsyncGenerator, Tuple
 from sqlalchemy.orm import Session
 
 from app import crud, schemas
 from app.services.ai_service import ai_service
+from app.services.dataset_executor import dataset_executor
 from app.services.dataset_service import get_dataset_service
+from app.services.event_pipeline import EventMerger
 from app.services.sql_executor import extract_sql_from_response
 from app.services.query_executor import execute_select_query_with_chart, build_result_content_for_storage
+from app.services.query_planner import query_planner
+from app.services.intent_classifier import intent_classifier
+from app.services.speculative_sql import speculative_sql
+from app.services.stop_rules import stop_rules
+from app.services.sql_examples import sql_examples
+
+
+# Shown when a question tagged with a dataset is not about the data
+UNRELATED_QUESTION_MESSAGE = "I notice you've tagged a dataset, but your question doesn't seem to be about querying or analyzing data. I'm designed to help you explore and analyze your datasets using SQL queries.\n\nIf you want to ask general questions, please use @general instead.\n\nIf you'd like to analyze the data, try asking questions like:\n- 'Show me the top 10 records'\n- 'What's the average sales?'\n- 'Find records where...'"
 
 
 def _truncate_text_fields(data, max_length: int = 20):
@@ -68,13 +80,25 @@ def escape_table_names_in_response(response: str, table_names: list) -> str:
     return response
 
 
+async def _is_usable_first_response(ai_response: str) -> bool:
+    """Race acceptance: a valid SQL query, or a definitive rejection the loop would act on."""
+    if 'UNRELATED_QUERY' in ai_response or 'MISSING_DATASET' in ai_response:
+        return True
+    
+    sql_query = extract_sql_from_response(ai_response)
+    if not sql_query:
+        return False
+    return await dataset_executor.read(get_dataset_service().validate_query, sql_query)
+
+
 async def process_ask_mode_stream(
     request_data: schemas.AskRequest,
     conversation_id: int,
     user_message_id: int,
     model: str,
     api_key: str,
-    db: Session
+    db: Session,
+    race_partner: Optional[Tuple[str, str]] = None
 ) -> AsyncGenerator[str, None]:
     """
     Process an Ask Mode query with streaming response.
@@ -86,10 +110,37 @@ async def process_ask_mode_stream(
         model: AI model to use
         api_key: API key for the AI provider
         db: Database session
+        race_partner: Optional (model, api_key) raced against `model` for the first SQL call
         
     Yields:
         Server-sent events with query results, charts, and answers
     """
+    # Chart decisions run in the background; they are cancelled when the stream
+    # ends early (client disconnected) instead of outliving the request, and
+    # speculative queries nobody took are cancelled when it ends
+    charts = EventMerger()
+    events = _ask_mode_events(
+        request_data, conversation_id, user_message_id, model, api_key, db, race_partner, charts
+    )
+    try:
+        async for event in events:
+            yield event
+    finally:
+        await events.aclose()
+        charts.cancel()
+
+
+async def _ask_mode_events(
+    request_data: schemas.AskRequest,
+    conversation_id: int,
+    user_message_id: int,
+    model: str,
+    api_key: str,
+    db: Session,
+    race_partner: Optional[Tuple[str, str]],
+    charts: EventMerger
+) -> AsyncGenerator[str, None]:
+    """Produce the Ask Mode events (see process_ask_mode_stream), deciding charts in the background in `charts`."""
     # Check if @general tag is used
     is_general_mode = request_data.selected_tables and 'general' in [t.lower() for t in request_data.selected_tables]
     
@@ -103,6 +154,7 @@ async def process_ask_mode_stream(
             for msg in all_messages:
                 if msg.id != user_message_id:  # Exclude current message
                     conversation_history.append({
+                        "id": msg.id,
                         "role": msg.role,
                         "content": msg.content
                     })
@@ -118,7 +170,7 @@ async def process_ask_mode_stream(
         actual_tables = [t for t in request_data.selected_tables if t.lower() != 'general']
         for table_name in actual_tables:
             try:
-                schema = dataset_service.get_table_schema(table_name)
+                schema = await dataset_executor.read(dataset_service.get_table_schema, table_name)
                 table_schemas.append(schema)
             except Exception as e:
                 print(f"Warning: Failed to get schema for table {table_name}: {str(e)}")
@@ -135,18 +187,38 @@ async def process_ask_mode_stream(
                 "file_type": attachment.file_type
             })
     
-    ai_response = await ai_service.generate_response(
+    generation_args = dict(
         query=request_data.query,
-        model=model,
-        api_key=api_key,
         conversation_history=conversation_history,
         table_schemas=table_schemas,
         is_general_mode=is_general_mode,
         attachments=attachments_data if attachments_data else None,
         db_session=db,
-        conversation_id=conversation_id
+        conversation_id=conversation_id,
+        stage="sql"
     )
     
+    speculation = None
+    if not is_general_mode and not attachments_data and intent_classifier.is_unrelated(request_data.query):
+        # Confidently not a data question: answer locally instead of asking the model
+        ai_response = f"UNRELATED_QUERY {UNRELATED_QUESTION_MESSAGE}"
+    elif race_partner and not is_general_mode:
+        # Race mode: first response with valid SQL wins, the slower model is cancelled
+        ai_response, _ = await ai_service.race_generate_response(
+            candidates=[(model, api_key), race_partner],
+            accept=_is_usable_first_response,
+            **generation_args
+        )
+    else:
+        # Start running the SQL as soon as its block is complete, while the model keeps writing
+        speculation = speculative_sql.begin() if not is_general_mode else None
+        if speculation:
+            charts.on_cancel(speculation.cancel)
+        generate = ai_service.generate_response if is_general_mode else ai_service.generate_sql_response
+        ai_response = await generate(
+            model=model, api_key=api_key, on_text=speculation.feed if speculation else None, **generation_args
+        )
+    
     # STEP 2: Check if general mode, unrelated query, missing dataset, or SQL execution needed
     is_unrelated_query = 'UNRELATED_QUERY' in ai_response
     is_missing_dataset = 'MISSING_DATASET' in ai_response
@@ -191,7 +263,7 @@ async def process_ask_mode_stream(
                 yield f"data: {json.dumps({'type': 'final_answer', 'content': escaped_response})}\n\n"
             else:
                 # Short response or UNRELATED_QUERY - show rejection message
-                final_answer = "I notice you've tagged a dataset, but your question doesn't seem to be about querying or analyzing data. I'm designed to help you explore and analyze your datasets using SQL queries.\n\nIf you want to ask general questions, please use @general instead.\n\nIf you'd like to analyze the data, try asking questions like:\n- 'Show me the top 10 records'\n- 'What's the average sales?'\n- 'Find records where...'"
+                final_answer = UNRELATED_QUESTION_MESSAGE
                 yield f"data: {json.dumps({'type': 'final_answer', 'content': final_answer})}\n\n"
         else:
             yield f"data: {json.dumps({'type': 'ai_response', 'content': ai_response})}\n\n"
@@ -199,38 +271,77 @@ async def process_ask_mode_stream(
         max_iterations = 10  # Limit to prevent infinite loops
         iteration = 0
         dataset_service = get_dataset_service()
+        # Chart decisions run in the background, concurrently with the next-step and conclusion calls
+        chart_storages = []
         
-        # Multi-step query loop
-        while sql_query and iteration < max_iterations:
-            iteration += 1            # Execute query and generate chart using shared function
+        async def run_query_step(step_query: str, step: int, **query_args) -> AsyncGenerator[str, None]:
+            """Execute one query step (with chart) and store its result."""
+            for event in charts.ready():
+                yield event
             result_storage = {}
-            async for event in execute_select_query_with_chart(
-                sql_query=sql_query,
+            query_events = execute_select_query_with_chart(
+                sql_query=step_query,
                 user_query=request_data.query,
                 model=model,
                 api_key=api_key,
                 result_storage=result_storage,
                 db_session=db,
-                conversation_id=conversation_id
-            ):
+                conversation_id=conversation_id,
+                step=step,
+                **query_args
+            )
+            async for event in query_events:
                 yield event
+                if 'result' in result_storage:
+                    # The result is out: the chart only depends on it, so decide it in the background
+                    break
+            charts.spawn(query_events)
             
-            # Get result from storage
-            result = result_storage.get('result')
-            chart_config = result_storage.get('chart_config')
+            # Get result from storage (its chart_config is attached once the charts are drained)
+            step_result = result_storage.get('result')
             
-            # Store result and chart_config
-            all_sql_queries.append(sql_query)
-            if result:
-                # Add chart_config to result for consistency
-                if chart_config:
-                    result['chart_config'] = chart_config
-                all_results.append(result)
+            # Store result
+            all_sql_queries.append(step_query)
+            if step_result:
+                all_results.append(step_result)
+                chart_storages.append((step_result, result_storage))
+        
+        # Query plan: independent queries planned upfront run in parallel and are summarized
+        # by the conclusion call, without a next-step call after each of them
+        plan = query_planner.parse(ai_response)
+        if plan:
+            yield f"data: {json.dumps({'type': 'loading', 'content': f'AI is running {len(plan)} queries in parallel...'})}\n\n"
+            executions = await query_planner.execute(plan, speculation)
+            for step, ((purpose, planned_query), execution) in enumerate(zip(plan, executions), 1):
+                if step > 1:
+                    # Shown and stored like the reasoning between serial steps
+                    if purpose:
+                        yield f"data: {json.dumps({'type': 'brief_reasoning', 'content': purpose})}\n\n"
+                    all_reasoning.append(purpose or None)
+                async for event in run_query_step(planned_query, step, prefetched=execution):
+                    yield event
+            # Nothing left for the serial loop
+            sql_query = None
+        
+        # Multi-step query loop (dependent steps, or a single query)
+        while sql_query and iteration < max_iterations:
+            iteration += 1            # Execute query and generate chart using shared function
+            async for event in run_query_step(sql_query, iteration, speculation=speculation):
+                yield event
             
             # Check if we've reached max iterations
             if iteration >= max_iterations:
                 break
             
+            # Stop without a next-step call when the question's shape and the result show it is answered
+            if stop_rules.check(
+                request_data.query,
+                all_results[-1] if len(all_results) == len(all_sql_queries) else None,
+                len(all_sql_queries),
+                multi_step='MULTI_STEP_QUERY' in ai_response
+            ):
+                break
+            
             # STEP 5: Ask AI if another query is needed
             # Build detailed result summary including errors
             result_summary = []
@@ -306,15 +417,29 @@ RESPONSE FORMAT:
 
 Your decision:"""
             
-            next_step_response = await ai_service.generate_response(
+            speculation = speculative_sql.begin()
+            if speculation:
+                charts.on_cancel(speculation.cancel)
+            next_step_task = asyncio.ensure_future(ai_service.generate_sql_response(
                 query=next_step_prompt,
                 model=model,
                 api_key=api_key,
                 conversation_history=conversation_history,
                 table_schemas=table_schemas,
                 db_session=db,
-                conversation_id=conversation_id
-            )
+                conversation_id=conversation_id,
+                stage="next_step",
+                on_text=speculation.feed if speculation else None
+            ))
+            try:
+                async for event in charts.until(next_step_task):
+                    yield event
+            finally:
+                if not next_step_task.done():
+                    # The stream was closed: stop the call before the request's session goes away
+                    next_step_task.cancel()
+                    await asyncio.wait({next_step_task})
+            next_step_response = next_step_task.result()
             
             # Extract and show AI's brief reasoning
             reasoning = next_step_response.split('MULTI_STEP_QUERY')[0].split('QUERY_COMPLETE')[0].strip()
@@ -343,9 +468,19 @@ Your decision:"""
             
             ai_response = next_step_response  # Update for multi-step detection
         
+        if iteration > 0:
+            stop_rules.record_turn()
+        
         # Use the last successful result for conclusion
         result = all_results[-1] if all_results else None
         sql_query = all_sql_queries[-1] if all_sql_queries else None
+        if plan:
+            # Planned queries are independent: any one with rows is enough for a conclusion
+            result = next((r for r in reversed(all_results) if r['success'] and r['row_count'] > 0), result)
+        
+        # Remember questions answered by a single query as few-shot examples for similar questions
+        if len(all_sql_queries) == 1 and result and result['success'] and result['row_count'] > 0:
+            sql_examples.record(db, request_data.query, sql_query, result['row_count'])
         
         if result and result['success'] and result['row_count'] > 0:
             # Send loading status before generating conclusion
@@ -434,7 +569,9 @@ Suggestion Guidelines (create diverse, visualization-friendly queries):
 - Make suggestions specific to the actual columns in the dataset
 - Avoid vague suggestions like "analyze more" - be concrete and actionable"""
             
-            # Stream the final answer chunk by chunk
+            # Stream the final answer chunk by chunk (charts still arriving are inserted at their
+            # step, but their loading statuses must not interrupt the answer)
+            charts.mute_status()
             final_answer = ""
             async for chunk in ai_service.generate_response_stream(
                 query=conclusion_prompt,
@@ -445,9 +582,18 @@ Suggestion Guidelines (create diverse, visualization-friendly queries):
                 conversation_id=conversation_id
             ):
                 final_answer += chunk
+                for event in charts.ready():
+                    yield event
                 yield f"data: {json.dumps({'type': 'final_answer_chunk', 'content': chunk})}\n\n"
             
             yield f"data: {json.dumps({'type': 'final_answer_complete', 'content': final_answer})}\n\n"
+        
+        # Wait for the remaining chart decisions and attach the charts to their results for storage
+        async for event in charts.drain():
+            yield event
+        for stored_result, storage in chart_storages:
+            if storage.get('chart_config'):
+                stored_result['chart_config'] = storage['chart_config']
     
     # Build the complete assistant message content for database storage
     assistant_content = ""
@@ -0,0 +1,239 @@
+"""Content-addressed cache of provider-ready (downscaled, base64-encoded) image attachments."""
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+
+# Longest image edge each provider actually uses; larger images are downscaled
+# by the provider anyway, so sending more pixels only costs bytes and time.
+PROVIDER_IMAGE_LIMITS: Dict[str, int] = {
+    "openai": 2048,
+    "anthropic": 1568,
+    "gemini": 3072
+}
+
+# Profile used for providers without a known limit (original image, base64 only)
+ORIGINAL_PROFILE = "original"
+
+# Formats that are re-encoded after resizing (GIFs may be animated and are sent as-is)
+_RESIZABLE_FORMATS = {"image/jpeg": "JPEG", "image/jpg": "JPEG", "image/png": "PNG", "image/webp": "WEBP"}
+
+
+def _profile_for(provider: str) -> str:
+    """Map a provider name to its payload profile."""
+    return provider if provider in PROVIDER_IMAGE_LIMITS else ORIGINAL_PROFILE
+
+
+def _resize(image_bytes: bytes, mime_type: str, max_edge: int) -> bytes:
+    """Downscale an image so its longest edge is at most max_edge (no-op if already small)."""
+    image_format = _RESIZABLE_FORMATS.get(mime_type)
+    if not image_format:
+        return image_bytes
+
+    import PIL.Image
+
+    with PIL.Image.open(io.BytesIO(image_bytes)) as image:
+        if max(image.size) <= max_edge:
+            return image_bytes
+
+        image.thumbnail((max_edge, max_edge), PIL.Image.LANCZOS)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        output = io.BytesIO()
+        save_options = {"quality": 90} if image_format in ("JPEG", "WEBP") else {"optimize": True}
+        image.save(output, format=image_format, **save_options)
+        resized = output.getvalue()
+
+    # Keep the original if re-encoding did not actually make it smaller
+    return resized if len(resized) < len(image_bytes) else image_bytes
+
+
+class AttachmentCache:
+    """
+    Pre-encoded image payloads keyed by content hash and provider profile.
+
+    Payloads are computed once when an image is uploaded and written next to the
+    uploads as `<sha256>.<profile>.b64`; a `<upload name>.sha256` link maps the
+    upload back to its content hash. Recently used payloads are also kept in an
+    in-memory LRU, so multi-step turns never touch the disk again. Images uploaded
+    before the cache existed are prepared lazily on first use.
+    """
+
+    def __init__(self, cache_dir: str, max_memory_entries: int = 64):
+        """Initialize the cache (the directory is created on first write)."""
+        self.cache_dir = Path(cache_dir)
+        self.max_memory_entries = max_memory_entries
+        self._memory: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._digests: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.encoded = 0
+        self.bytes_saved = 0
+
+    def _payload_path(self, digest: str, profile: str) -> Path:
+        return self.cache_dir / f"{digest}.{profile}.b64"
+
+    def _link_path(self, file_path: Path) -> Path:
+        return self.cache_dir / f"{file_path.name}.sha256"
+
+    def _remember(self, digest: str, profile: str, payload: str):
+        """Put a payload in the memory LRU."""
+        with self._lock:
+            self._memory[(digest, profile)] = payload
+            self._memory.move_to_end((digest, profile))
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def prepare(self, file_path: Path, image_bytes: bytes, mime_type: str) -> str:
+        """
+        Encode every provider profile of an image and link the upload to it.
+
+        Args:
+            file_path: Where the original upload is stored
+            image_bytes: Original image content
+            mime_type: Image MIME type
+
+        Returns:
+            SHA-256 digest of the image content
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        for profile in list(PROVIDER_IMAGE_LIMITS) + [ORIGINAL_PROFILE]:
+            payload_path = self._payload_path(digest, profile)
+            if payload_path.exists():
+                continue
+
+            payload_bytes = image_bytes
+            if profile in PROVIDER_IMAGE_LIMITS:
+                try:
+                    payload_bytes = _resize(image_bytes, mime_type, PROVIDER_IMAGE_LIMITS[profile])
+                except Exception as e:
+                    print(f"⚠️ Warning: Failed to resize image for {profile}: {str(e)}")
+
+            payload = base64.b64encode(payload_bytes).decode("utf-8")
+            payload_path.write_text(payload, encoding="utf-8")
+            self.encoded += 1
+            self.bytes_saved += len(image_bytes) - len(payload_bytes)
+
+        self._link_path(file_path).write_text(digest, encoding="utf-8")
+        with self._lock:
+            self._digests[str(file_path)] = digest
+        return digest
+
+    def digest_for(self, file_path: Path, mime_type: str) -> Optional[str]:
+        """Resolve the content hash of an upload, preparing it if it was never cached."""
+        with self._lock:
+            digest = self._digests.get(str(file_path))
+        if digest:
+            return digest
+
+        link_path = self._link_path(file_path)
+        if link_path.exists():
+            digest = link_path.read_text(encoding="utf-8").strip()
+            with self._lock:
+                self._digests[str(file_path)] = digest
+            return digest
+
+        if not file_path.exists():
+            return None
+        return self.prepare(file_path, file_path.read_bytes(), mime_type)
+
+    def payload_for(self, digest: str, profile: str) -> Optional[str]:
+        """Get the base64 payload of an image for a profile (memory, then disk)."""
+        with self._lock:
+            payload = self._memory.get((digest, profile))
+            if payload is not None:
+                self._memory.move_to_end((digest, profile))
+                self.memory_hits += 1
+                return payload
+
+        payload_path = self._payload_path(digest, profile)
+        if not payload_path.exists():
+            return None
+
+        payload = payload_path.read_text(encoding="utf-8")
+        self.disk_hits += 1
+        self._remember(digest, profile, payload)
+        return payload
+
+    def load_references(self, attachments: Optional[list]) -> List[Dict[str, str]]:
+        """
+        Resolve the image attachments of a message to content-addressed references.
+
+        Args:
+            attachments: Attachment models or dicts with url, filename and file_type
+
+        Returns:
+            List of {'filename', 'mime_type', 'digest'} for images that could be resolved
+        """
+        references = []
+        for att in attachments or []:
+            # Handle both Pydantic models and dictionaries
+            if hasattr(att, 'file_type'):
+                file_type, file_url, filename = att.file_type, att.url, att.filename
+            else:
+                file_type = att.get('file_type', '')
+                file_url = att.get('url', '')
+                filename = att.get('filename', '')
+
+            if not file_type.startswith('image/'):
+                continue
+
+            try:
+                # Convert URL to file path (remove leading slash)
+                digest = self.digest_for(Path(file_url.lstrip('/')), file_type)
+                if digest:
+                    references.append({'filename': filename, 'mime_type': file_type, 'digest': digest})
+            except Exception as e:
+                print(f"⚠️ Failed to load image {filename}: {str(e)}")
+        return references
+
+    def materialize(self, references: Optional[list], provider: str) -> List[Dict[str, str]]:
+        """
+        Turn image references into provider-ready payloads.
+
+        Args:
+            references: Output of load_references
+            provider: Provider name (selects the resolution profile)
+
+        Returns:
+            List of {'filename', 'mime_type', 'digest', 'data'} with base64 data
+        """
+        profile = _profile_for(provider)
+        images = []
+        for reference in references or []:
+            payload = self.payload_for(reference['digest'], profile)
+            if payload is None:
+                payload = self.payload_for(reference['digest'], ORIGINAL_PROFILE)
+            if payload is None:
+                print(f"⚠️ Cached image payload missing for {reference['filename']}")
+                continue
+            images.append({**reference, 'data': payload})
+        return images
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return cache counters."""
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "payloads_encoded": self.encoded,
+            "bytes_saved_by_resizing": self.bytes_saved
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+attachment_cache = AttachmentCache(
+    cache_dir=_settings.attachment_cache_dir,
+    max_memory_entries=_settings.attachment_cache_memory_entries
+)
@@ -0,0 +1,299 @@
+"""Low-latency prompt autocomplete: local history completer, prefix cache and in-flight cancellation."""
+import asyncio
+import bisect
+import re
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+
+# Prompts shorter than this are neither learned nor completed (matches the UI threshold)
+MIN_PROMPT_LENGTH = 5
+
+# Longest continuation the n-gram completer proposes, in words
+MAX_NGRAM_WORDS = 8
+
+_TOKEN_PATTERN = re.compile(r'\S+')
+
+
+class PrefixCompleter:
+    """
+    Instant completions learned from one user's past prompts.
+
+    Two lookups, tried in order:
+    - a sorted prefix index over whole past prompts (case-insensitive), so a
+      prompt the user has typed before is completed in full;
+    - a word trigram/bigram model that extends the current text greedily with
+      the words that most often followed the last one or two words.
+    """
+
+    def __init__(self):
+        """Initialize an empty completer."""
+        self._prompts: List[str] = []
+        self._originals: Dict[str, str] = {}
+        self._counts: Counter = Counter()
+        self._next_words: Dict[Tuple[str, ...], Counter] = {}
+
+    def __len__(self) -> int:
+        return len(self._prompts)
+
+    def add(self, prompt: str):
+        """Learn a prompt the user sent."""
+        prompt = " ".join(prompt.split())
+        if len(prompt) < MIN_PROMPT_LENGTH:
+            return
+
+        key = prompt.lower()
+        if key not in self._originals:
+            bisect.insort(self._prompts, key)
+        # The latest spelling wins
+        self._originals[key] = prompt
+        self._counts[key] += 1
+
+        words = prompt.split(" ")
+        lowered = [word.lower() for word in words]
+        for i, word in enumerate(words):
+            self._next_words.setdefault(tuple(lowered[max(0, i - 1):i]), Counter())[word] += 1
+            if i >= 2:
+                self._next_words.setdefault(tuple(lowered[i - 2:i]), Counter())[word] += 1
+
+    def complete(self, text: str) -> Optional[str]:
+        """
+        Complete partial text.
+
+        Args:
+            text: What the user has typed so far
+
+        Returns:
+            The full completed text (starting with `text`), or None
+        """
+        if len(text.strip()) < MIN_PROMPT_LENGTH:
+            return None
+        return self._complete_from_prompts(text) or self._complete_from_ngrams(text)
+
+    def _complete_from_prompts(self, text: str) -> Optional[str]:
+        """Complete with the most frequently sent past prompt starting with the text."""
+        prefix = " ".join(text.split()).lower()
+        if text[-1:].isspace():
+            prefix += " "
+
+        start = bisect.bisect_left(self._prompts, prefix)
+        best = None
+        for key in self._prompts[start:start + 50]:
+            if not key.startswith(prefix):
+                break
+            if len(key) > len(prefix) and (best is None or self._counts[key] > self._counts[best]):
+                best = key
+        if best is None:
+            return None
+        return text + self._originals[best][len(prefix):]
+
+    def _complete_from_ngrams(self, text: str) -> Optional[str]:
+        """Extend the text word by word with the most likely next word."""
+        tokens = _TOKEN_PATTERN.findall(text)
+        partial = "" if text[-1:].isspace() else tokens.pop()
+        context = [token.lower() for token in tokens]
+
+        suffix = ""
+        for _ in range(MAX_NGRAM_WORDS):
+            word = self._predict(context, partial)
+            if word is None:
+                break
+            suffix += (" " if suffix else "") + word[len(partial):]
+            context.append(word.lower())
+            partial = ""
+            if word[-1:] in ".?!":
+                break
+
+        return text + suffix if suffix.strip() else None
+
+    def _predict(self, context: List[str], partial: str) -> Optional[str]:
+        """Most frequent next word after the context (trigram, then bigram) that extends `partial`."""
+        partial_lower = partial.lower()
+        for key in (tuple(context[-2:]), tuple(context[-1:])) if len(context) >= 2 else (tuple(context),):
+            candidates = self._next_words.get(key)
+            if not candidates:
+                continue
+            for word, _ in candidates.most_common():
+                if word.lower().startswith(partial_lower) and len(word) > len(partial):
+                    return partial + word[len(partial):]
+        return None
+
+
+class AutocompleteService:
+    """
+    Per-user autocomplete state.
+
+    - A PrefixCompleter per user (loaded lazily from their past prompts and
+      updated as they send new ones) answers in well under a millisecond.
+    - Recent LLM completions are kept per user; a later request whose text is
+      still a prefix of a cached completion reuses it, so continuing to type
+      along a suggestion never calls the model again.
+    - Only the newest LLM request of a user is allowed to run: starting one
+      cancels the user's previous, superseded request.
+    """
+
+    def __init__(self, history_size: int = 500, cache_entries: int = 32, max_users: int = 256):
+        """
+        Initialize the service.
+
+        Args:
+            history_size: Past prompts loaded per user to train the local completer
+            cache_entries: LLM completions remembered per user
+            max_users: Users whose completers and caches are kept in memory
+        """
+        self.history_size = history_size
+        self.cache_entries = cache_entries
+        self.max_users = max_users
+        self._completers: "OrderedDict[int, PrefixCompleter]" = OrderedDict()
+        self._caches: "OrderedDict[int, OrderedDict[Tuple[str, str], str]]" = OrderedDict()
+        self._in_flight: Dict[int, asyncio.Task] = {}
+        self.local_hits = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.superseded = 0
+
+    def _touch(self, store: OrderedDict, user_id: int):
+        """Mark a user as recently active and evict the least recent users."""
+        store.move_to_end(user_id)
+        while len(store) > self.max_users:
+            store.popitem(last=False)
+
+    def _completer_for(self, user_id: int, load_prompts: Callable[[int, int], List[str]]) -> PrefixCompleter:
+        """Get the user's completer, training it from their history on first use."""
+        completer = self._completers.get(user_id)
+        if completer is None:
+            completer = PrefixCompleter()
+            try:
+                for prompt in load_prompts(user_id, self.history_size):
+                    completer.add(prompt)
+            except Exception as e:
+                print(f"⚠️ Warning: Failed to load prompt history for autocomplete: {str(e)}")
+            self._completers[user_id] = completer
+        self._touch(self._completers, user_id)
+        return completer
+
+    def record_prompt(self, user_id: int, prompt: str):
+        """Teach a sent prompt to the user's completer (if it is loaded)."""
+        completer = self._completers.get(user_id)
+        if completer is not None:
+            completer.add(prompt)
+
+    def complete_locally(
+        self,
+        user_id: int,
+        prompt: str,
+        load_prompts: Callable[[int, int], List[str]]
+    ) -> Optional[str]:
+        """
+        Instant completion from the user's own history.
+
+        Args:
+            user_id: User typing the prompt
+            prompt: Partial prompt
+            load_prompts: (user_id, limit) -> past prompts, used on first use
+
+        Returns:
+            Full completed text, or None
+        """
+        completion = self._completer_for(user_id, load_prompts).complete(prompt)
+        if completion:
+            self.local_hits += 1
+        return completion
+
+    def cached_completion(self, user_id: int, model: str, prompt: str) -> Optional[str]:
+        """Find a recent LLM completion for this prompt or one the user is typing along."""
+        cache = self._caches.get(user_id)
+        if not cache:
+            return None
+
+        exact = cache.get((model, prompt))
+        if exact is not None:
+            self.cache_hits += 1
+            return exact
+
+        for (cached_model, cached_prompt), completion in reversed(cache.items()):
+            if (
+                cached_model == model
+                and prompt.startswith(cached_prompt)
+                and completion.startswith(prompt)
+                and len(completion) > len(prompt)
+            ):
+                self.cache_hits += 1
+                return completion
+        return None
+
+    def _remember(self, user_id: int, model: str, prompt: str, completion: str):
+        """Store an LLM completion in the user's prefix cache."""
+        cache = self._caches.setdefault(user_id, OrderedDict())
+        cache[(model, prompt)] = completion
+        cache.move_to_end((model, prompt))
+        while len(cache) > self.cache_entries:
+            cache.popitem(last=False)
+        self._touch(self._caches, user_id)
+
+    async def complete_with_model(
+        self,
+        user_id: int,
+        model: str,
+        prompt: str,
+        generate: Callable[[], Awaitable[str]]
+    ) -> Optional[str]:
+        """
+        Run the LLM completion, superseding the user's previous in-flight request.
+
+        Args:
+            user_id: User typing the prompt
+            model: Model used for the completion (part of the cache key)
+            prompt: Partial prompt
+            generate: Starts the model call
+
+        Returns:
+            The completion, or None if a newer request from the same user replaced this one
+        """
+        previous = self._in_flight.get(user_id)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+
+        self.llm_calls += 1
+        task = asyncio.ensure_future(generate())
+        self._in_flight[user_id] = task
+        try:
+            await asyncio.wait({task})
+        finally:
+            if self._in_flight.get(user_id) is task:
+                del self._in_flight[user_id]
+            if not task.done():
+                # The client went away - stop paying for the completion
+                task.cancel()
+
+        if task.cancelled():
+            return None
+
+        completion = task.result().strip()
+        if completion:
+            self._remember(user_id, model, prompt, completion)
+        return completion
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return autocomplete counters."""
+        return {
+            "users_loaded": len(self._completers),
+            "prompts_indexed": sum(len(completer) for completer in self._completers.values()),
+            "local_hits": self.local_hits,
+            "cache_hits": self.cache_hits,
+            "llm_calls": self.llm_calls,
+            "superseded": self.superseded,
+            "in_flight": len(self._in_flight)
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+autocomplete_service = AutocompleteService(
+    history_size=_settings.autocomplete_history_size,
+    cache_entries=_settings.autocomplete_cache_entries,
+    max_users=_settings.autocomplete_max_users
+)
@@ -126,14 +126,41 @@ JSON Response:
 Return {{"should_chart": false}} if data is unsuitable for visualization."""
 
     try:
-        # Ask AI for chart decision
-        response = await ai_service.generate_response(
-            query=prompt,
-            model=model,
-            api_key=api_key,
-            conversation_history=None,
-            table_schemas=None
-        )
+        from app.services.provider_clients import ProviderAPIError
+        from app.services.structured_output import CHART_DECISION_SCHEMA, ChartDecision, parse_structured, structured_output
+        
+        # Ask AI for chart decision (constrained to the ChartDecision schema when structured output is on)
+        response = None
+        if structured_output.enabled:
+            structured_output.record(CHART_DECISION_SCHEMA, "request")
+            try:
+                response = await ai_service.generate_response(
+                    query=prompt,
+                    model=model,
+                    api_key=api_key,
+                    conversation_history=None,
+                    table_schemas=None,
+                    stage="chart",
+                    response_schema=CHART_DECISION_SCHEMA
+                )
+            except ProviderAPIError as e:
+                print(f"⚠️ Structured chart decision failed, retrying as free text: {str(e)}")
+            
+            decision = parse_structured(response, ChartDecision) if response is not None else None
+            if decision is not None:
+                structured_output.record(CHART_DECISION_SCHEMA, "parsed")
+                return decision.model_dump(exclude_none=True) if decision.should_chart else None
+            structured_output.record(CHART_DECISION_SCHEMA, "fallback")
+        
+        if response is None:
+            response = await ai_service.generate_response(
+                query=prompt,
+                model=model,
+                api_key=api_key,
+                conversation_history=None,
+                table_schemas=None,
+                stage="chart"
+            )
         
         # Extract JSON from response
         # Try to find JSON object in response
@@ -0,0 +1,160 @@
+"""Rolling per-conversation summaries, maintained in the background after each turn."""
+import asyncio
+import time
+from typing import Dict, Optional, Set
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.services.ai_service import ai_service
+
+
+class ConversationSummarizer:
+    """
+    Keep a summary of each conversation's older messages up to date.
+
+    After a turn, the route calls schedule(); the update runs as a background
+    task with its own database session, so no summarization ever happens on the
+    request path. Messages older than the newest `keep_messages` that are not
+    yet covered by the summary are folded into it once at least
+    `batch_messages` of them are pending. Prompts then send the summary in
+    place of the messages it covers (see AIService._build_budgeted_prompt).
+
+    At most one update runs per conversation; a turn finishing while one is
+    running makes it check again when it is done.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        keep_messages: int = 6,
+        batch_messages: int = 4,
+        max_words: int = 250,
+        max_fold_messages: int = 20
+    ):
+        """
+        Initialize the summarizer.
+
+        Args:
+            enabled: If False schedule() does nothing
+            keep_messages: Newest messages that are always sent verbatim
+            batch_messages: Pending older messages needed before an update is made
+            max_words: Approximate length limit of a summary
+            max_fold_messages: Messages folded in per model call (long backlogs take several)
+        """
+        self.enabled = enabled
+        self.keep_messages = keep_messages
+        self.batch_messages = max(1, batch_messages)
+        self.max_words = max_words
+        self.max_fold_messages = max(self.batch_messages, max_fold_messages)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._rerun: Set[int] = set()
+        self.scheduled = 0
+        self.updates = 0
+        self.messages_folded = 0
+        self.failures = 0
+        self._update_seconds = 0.0
+
+    def schedule(self, conversation_id: Optional[int], model: str, api_key: str):
+        """
+        Start a background summary update for a conversation after a turn.
+
+        Args:
+            conversation_id: Conversation whose turn just finished
+            model: The user's model (the stage router may pick a faster one)
+            api_key: API key for the model
+        """
+        if not self.enabled or not conversation_id:
+            return
+        self.scheduled += 1
+
+        running = self._tasks.get(conversation_id)
+        if running is not None and not running.done():
+            self._rerun.add(conversation_id)
+            return
+        self._tasks[conversation_id] = asyncio.get_running_loop().create_task(
+            self._run(conversation_id, model, api_key)
+        )
+
+    async def _run(self, conversation_id: int, model: str, api_key: str):
+        """Update the summary until nothing foldable is left."""
+        try:
+            while True:
+                self._rerun.discard(conversation_id)
+                try:
+                    folded = await self._update(conversation_id, model, api_key)
+                except Exception as e:
+                    self.failures += 1
+                    print(f"⚠️ Warning: Failed to update summary of conversation {conversation_id}: {str(e)}")
+                    return
+                if not folded and conversation_id not in self._rerun:
+                    return
+        finally:
+            self._tasks.pop(conversation_id, None)
+            self._rerun.discard(conversation_id)
+
+    async def _update(self, conversation_id: int, model: str, api_key: str) -> bool:
+        """
+        Fold the pending older messages of a conversation into its summary.
+
+        Returns:
+            True if messages were folded and more may be pending
+        """
+        from app import crud
+
+        with SessionLocal() as db:
+            current = crud.get_conversation_summary(db, conversation_id)
+            last_message_id = current.last_message_id if current else 0
+            pending = crud.get_messages_after(db, conversation_id, last_message_id)
+            foldable = pending[:max(0, len(pending) - self.keep_messages)]
+            if len(foldable) < self.batch_messages:
+                return False
+
+            foldable = foldable[:self.max_fold_messages]
+            previous_summary = current.summary if current else None
+            message_count = current.message_count if current else 0
+            messages = [{"role": msg.role, "content": msg.content} for msg in foldable]
+            new_last_message_id = foldable[-1].id
+
+        started = time.perf_counter()
+        summary = await ai_service.summarize_conversation(previous_summary, messages, model, api_key, self.max_words)
+        if not summary:
+            return False
+
+        with SessionLocal() as db:
+            if crud.get_conversation(db, conversation_id) is None:
+                # Deleted while the summary was being written
+                return False
+            crud.upsert_conversation_summary(
+                db, conversation_id, summary, new_last_message_id, message_count + len(messages), model
+            )
+
+        elapsed = time.perf_counter() - started
+        self.updates += 1
+        self.messages_folded += len(messages)
+        self._update_seconds += elapsed
+        print(f"📝 Summarized {len(messages)} messages of conversation {conversation_id} in {elapsed:.1f}s")
+        return True
+
+    def get_stats(self) -> Dict[str, object]:
+        """Return summarizer settings and counters."""
+        return {
+            "enabled": self.enabled,
+            "keep_messages": self.keep_messages,
+            "batch_messages": self.batch_messages,
+            "scheduled": self.scheduled,
+            "running": sum(1 for task in self._tasks.values() if not task.done()),
+            "updates": self.updates,
+            "messages_folded": self.messages_folded,
+            "failures": self.failures,
+            "avg_update_seconds": round(self._update_seconds / self.updates, 2) if self.updates else 0
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+conversation_summarizer = ConversationSummarizer(
+    enabled=_settings.conversation_summary_enabled,
+    keep_messages=_settings.conversation_summary_keep_messages,
+    batch_messages=_settings.conversation_summary_batch_messages,
+    max_words=_settings.conversation_summary_max_words
+)
@@ -0,0 +1,119 @@
+"""Bounded thread pools that run dataset database I/O off the event loop."""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.config import get_settings
+
+
+class _Lane:
+    """A thread pool plus an admission limit and wait/run time metrics."""
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"dataset-{name}")
+        self._admission: Optional[asyncio.Semaphore] = None
+        self.queued = 0
+        self.running = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.run_ms_total = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func in the lane's pool; waits for a slot when workers and queue are full."""
+        if self._admission is None:
+            self._admission = asyncio.Semaphore(self.workers + self.max_queue)
+
+        submitted = time.perf_counter()
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        started = None
+
+        def call():
+            nonlocal started
+            started = time.perf_counter()
+            return func(*args, **kwargs)
+
+        try:
+            async with self._admission:
+                future = asyncio.get_running_loop().run_in_executor(self._pool, call)
+                # The wait ends when a worker picks the call up, not when it is admitted
+                try:
+                    return await future
+                except Exception:
+                    self.failed += 1
+                    raise
+        finally:
+            self.queued -= 1
+            if started is not None:
+                wait_ms = (started - submitted) * 1000
+                self.wait_ms_total += wait_ms
+                self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+                self.run_ms_total += (time.perf_counter() - started) * 1000
+                self.completed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return lane size, queue depth and timing metrics."""
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self.queued,
+            "peak_queue_depth": self.peak_queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.wait_ms_total / self.completed, 1) if self.completed else 0,
+            "max_wait_ms": round(self.wait_ms_max, 1),
+            "avg_run_ms": round(self.run_ms_total / self.completed, 1) if self.completed else 0
+        }
+
+
+class DatasetExecutor:
+    """
+    Run DatasetService calls in dedicated, bounded thread pools.
+
+    Reads (SELECTs, schemas, validation, file parsing) and writes (INSERT/
+    UPDATE/DELETE, uploads) use separate lanes, so a long aggregate never
+    delays a write and writes are serialized in a single-worker lane the way
+    SQLite applies them anyway. When a lane's workers are busy and its queue is
+    full, further calls wait their turn on the event loop instead of piling up
+    threads. queue_depth counts calls admitted or waiting that have not finished.
+    """
+
+    def __init__(self, read_workers: int = 4, write_workers: int = 1, max_queue: int = 64):
+        """
+        Initialize the lanes.
+
+        Args:
+            read_workers: Threads running read-only dataset calls
+            write_workers: Threads running dataset writes
+            max_queue: Calls per lane that may wait for a free worker
+        """
+        self._read = _Lane("read", read_workers, max_queue)
+        self._write = _Lane("write", write_workers, max_queue)
+
+    async def read(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a read-only dataset call off the event loop."""
+        return await self._read.run(func, *args, **kwargs)
+
+    async def write(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a dataset write off the event loop."""
+        return await self._write.run(func, *args, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return metrics of both lanes."""
+        return {"read": self._read.get_stats(), "write": self._write.get_stats()}
+
+
+# Singleton instance
+_settings = get_settings()
+dataset_executor = DatasetExecutor(
+    read_workers=_settings.dataset_read_workers,
+    write_workers=_settings.dataset_write_workers,
+    max_queue=_settings.dataset_executor_max_queue
+)
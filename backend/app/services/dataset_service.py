@@ -1,18 +1,29 @@
 """Dataset service for parsing and storing uploaded files."""
 import pandas as pd
 import json
+import re
 import sqlite3
 import os
 from typing import Dict, List, Tuple
 from pathlib import Path
 
 
+# Internal bookkeeping table recording a version number per dataset table.
+# The version is bumped on every write so caches can tell when data changed.
+VERSION_TABLE = "_askql_table_versions"
+
+# Table targeted by an INSERT/UPDATE/DELETE statement
+_WRITE_TARGET_PATTERN = re.compile(r'(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+[`"\[]?(\w+)', re.IGNORECASE)
+
+
 class DatasetService:
     """Service for handling dataset uploads and parsing."""
     
     def __init__(self, db_path: str):
         """Initialize dataset service with database path."""
         self.db_path = db_path
+        # table name -> ((schema cookie, data version), schema) for get_cached_table_schema
+        self._schema_cache: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
     
     def parse_csv(self, file_path: str) -> Tuple[pd.DataFrame, Dict]:
         """Parse CSV file and return DataFrame and metadata."""
@@ -114,6 +125,8 @@ class DatasetService:
             
             # Save DataFrame to SQLite
             df.to_sql(safe_table_name, conn, if_exists='replace', index=False)
+            self._bump_table_versions(conn, [safe_table_name])
+            conn.commit()
             
             conn.close()
             return True
@@ -150,6 +163,7 @@ class DatasetService:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+            self._bump_table_versions(conn, [table_name])
             conn.commit()
             conn.close()
             return True
@@ -201,10 +215,56 @@ class DatasetService:
         except Exception as e:
             raise ValueError(f"Failed to get table schema: {str(e)}")
     
-    def execute_sql_query(self, query: str, limit: int = 100) -> Dict:
+    def get_cached_table_schema(self, table_name: str) -> Dict:
+        """
+        Get a table schema, reusing the last result while the table is unchanged.
+        
+        The cached schema is revalidated against SQLite's schema cookie (bumped on
+        any CREATE/ALTER/DROP) and the table's data version (bumped on writes made
+        through this service, which also change the sample rows).
+        
+        Args:
+            table_name: Table to describe
+            
+        Returns:
+            Same structure as get_table_schema (shared - do not modify)
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA schema_version")
+            schema_version = cursor.fetchone()[0]
+            data_version = 0
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name = ?",
+                (VERSION_TABLE,)
+            )
+            if cursor.fetchone():
+                cursor.execute(f"SELECT version FROM {VERSION_TABLE} WHERE table_name = ?", (table_name,))
+                row = cursor.fetchone()
+                data_version = row[0] if row else 0
+            conn.close()
+        except Exception:
+            return self.get_table_schema(table_name)
+        
+        stamp = (schema_version, data_version)
+        cached = self._schema_cache.get(table_name)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        
+        schema = self.get_table_schema(table_name)
+        self._schema_cache[table_name] = (stamp, schema)
+        return schema
+    
+    def _connect_read_only(self) -> sqlite3.Connection:
+        """Open the dataset database read-only (SQLite rejects any write on the connection)."""
+        return sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True)
+    
+    def execute_sql_query(self, query: str, limit: int = 100, read_only: bool = False) -> Dict:
         """
         Execute a SQL query and return results.
         Only allows SELECT queries for safety.
+        With read_only the query runs on a read-only connection (used for queries run in parallel).
         """
         try:
             # Security check: only allow SELECT queries
@@ -218,7 +278,7 @@ class DatasetService:
                 if keyword in query_upper:
                     raise ValueError(f"Query contains forbidden keyword: {keyword}")
             
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect_read_only() if read_only else sqlite3.connect(self.db_path)
             conn.row_factory = sqlite3.Row  # This allows us to access columns by name
             cursor = conn.cursor()
             
@@ -298,7 +358,8 @@ class DatasetService:
                 cursor.execute(query)
                 rows_affected = cursor.rowcount
             
-            # Commit the transaction
+            # Record the data change, then commit the transaction
+            self._bump_table_versions(conn, _WRITE_TARGET_PATTERN.findall(query))
             conn.commit()
             conn.close()
             
@@ -314,6 +375,79 @@ class DatasetService:
                 'row_count': 0
             }
     
+    def validate_query(self, query: str) -> bool:
+        """
+        Check that a SELECT query compiles against the current tables without running it.
+        
+        Args:
+            query: SQL query to check
+            
+        Returns:
+            True if SQLite can prepare the query (tables and columns exist, syntax is valid)
+        """
+        if not query.strip().upper().startswith(('SELECT', 'WITH')):
+            return False
+        
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                conn.execute(f"EXPLAIN {query}")
+            finally:
+                conn.close()
+            return True
+        except Exception:
+            return False
+    
+    def _bump_table_versions(self, conn: sqlite3.Connection, table_names: List[str]):
+        """Increment the data version of the given tables (caller commits)."""
+        if not table_names:
+            return
+        
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (table_name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+        )
+        for table_name in set(table_names):
+            conn.execute(
+                f"INSERT INTO {VERSION_TABLE} (table_name, version) VALUES (?, 1) "
+                f"ON CONFLICT(table_name) DO UPDATE SET version = version + 1",
+                (table_name,)
+            )
+    
+    def get_table_versions(self, table_names: List[str]) -> Dict[str, int]:
+        """
+        Get the data version of each table (0 if never written through this service).
+        
+        Args:
+            table_names: Tables to look up
+            
+        Returns:
+            Dictionary of table name -> version
+        """
+        versions = {table_name: 0 for table_name in table_names}
+        if not table_names:
+            return versions
+        
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name = ?",
+                (VERSION_TABLE,)
+            )
+            if cursor.fetchone():
+                placeholders = ", ".join("?" for _ in table_names)
+                cursor.execute(
+                    f"SELECT table_name, version FROM {VERSION_TABLE} WHERE table_name IN ({placeholders})",
+                    list(table_names)
+                )
+                for table_name, version in cursor.fetchall():
+                    versions[table_name] = version
+            conn.close()
+        except Exception as e:
+            print(f"Warning: Failed to get table versions: {str(e)}")
+        
+        return versions
+    
     def get_all_table_names(self) -> List[str]:
         """Get all table names from the database."""
         try:
@@ -326,8 +460,8 @@ class DatasetService:
             
             conn.close()
             
-            # Extract table names from tuples
-            table_names = [table[0] for table in tables]
+            # Extract table names from tuples (skipping internal bookkeeping tables)
+            table_names = [table[0] for table in tables if table[0] != VERSION_TABLE]
             return table_names
         except Exception as e:
             print(f"Warning: Failed to get table names: {str(e)}")
@@ -0,0 +1,95 @@
+"""Concurrent SSE event producers merged into one stream."""
+import asyncio
+from typing import AsyncGenerator, Callable, List, Set
+
+
+# Status events from background producers, dropped once the stream is muted
+_STATUS_PREFIX = 'data: {"type": "loading"'
+
+
+class EventMerger:
+    """
+    Run event generators in the background and merge their events into a stream.
+
+    spawn() drains a generator in its own task (e.g. the chart decision of a
+    query) while the caller continues with other work (e.g. the next-step call).
+    The caller yields the background events at its own await points through
+    until(), ready() and finally drain(). Events that belong to a query step
+    carry its `step`, so clients can place them although they arrive late.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: Set[asyncio.Task] = set()
+        self._cleanups: List[Callable[[], None]] = []
+        self._muted = False
+
+    def spawn(self, events: AsyncGenerator[str, None]):
+        """Start draining a generator in the background."""
+        async def pump():
+            try:
+                async for event in events:
+                    await self._queue.put(event)
+            except Exception as e:
+                # A failed side step (e.g. the chart) must not abort the answer
+                print(f"⚠️ Warning: Background event producer failed: {str(e)}")
+            finally:
+                # Also runs when cancelled, so the producer stops using the request's resources
+                await events.aclose()
+
+        task = asyncio.get_running_loop().create_task(pump())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def on_cancel(self, cleanup: Callable[[], None]):
+        """Run `cleanup` in cancel() (e.g. stop a speculative query nobody took)."""
+        self._cleanups.append(cleanup)
+
+    def mute_status(self):
+        """Drop the producers' loading statuses from now on (e.g. while the answer streams)."""
+        self._muted = True
+
+    def _deliverable(self, event: str) -> bool:
+        """Whether a background event is still forwarded."""
+        return not (self._muted and event.startswith(_STATUS_PREFIX))
+
+    def ready(self) -> List[str]:
+        """Events produced so far (does not wait)."""
+        events = []
+        while not self._queue.empty():
+            event = self._queue.get_nowait()
+            if self._deliverable(event):
+                events.append(event)
+        return events
+
+    async def until(self, task: asyncio.Future) -> AsyncGenerator[str, None]:
+        """Yield background events as they arrive until `task` is done."""
+        while not task.done():
+            getter = asyncio.ensure_future(self._queue.get())
+            try:
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                received = getter.done()
+                if not received:
+                    getter.cancel()
+            if received and self._deliverable(getter.result()):
+                yield getter.result()
+        for event in self.ready():
+            yield event
+
+    async def drain(self) -> AsyncGenerator[str, None]:
+        """Yield the remaining background events, waiting for every producer to finish."""
+        while self._tasks:
+            waiter = asyncio.ensure_future(asyncio.wait(set(self._tasks)))
+            async for event in self.until(waiter):
+                yield event
+        for event in self.ready():
+            yield event
+
+    def cancel(self):
+        """Cancel the producers still running and run the cleanups (the stream ended or the client went away)."""
+        for task in list(self._tasks):
+            task.cancel()
+        for cleanup in self._cleanups:
+            cleanup()
+        self._cleanups.clear()
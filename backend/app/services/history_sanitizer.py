@@ -0,0 +1,145 @@
+"""Compact stored result tables and chart blocks in the conversation history sent to providers."""
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+
+# Blocks written by build_result_content_for_storage and format_chart_block
+_TABLE_BLOCK_PATTERN = re.compile(r'```table\n(.*?)\n```', re.DOTALL)
+_CHART_BLOCK_PATTERN = re.compile(r'```chart\n(.*?)\n```', re.DOTALL)
+
+# Longest cell text kept in digest rows
+_MAX_CELL_LENGTH = 40
+
+# Sanitized content by (content hash, sample rows); keyed by hash so large stored
+# results are not kept alive by the cache
+_MAX_CACHED_MESSAGES = 512
+_cache: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+_settings = get_settings()
+
+
+def _shorten(value: Any) -> Any:
+    """Truncate long text cells so a digest row stays small."""
+    if isinstance(value, str) and len(value) > _MAX_CELL_LENGTH:
+        return value[:_MAX_CELL_LENGTH - 3] + "..."
+    return value
+
+
+def digest_table_block(block: str, sample_rows: int = 3) -> str:
+    """
+    Summarize a ```table block as its row count, columns and first rows.
+
+    Args:
+        block: JSON array of row objects (the inside of the block)
+        sample_rows: Rows kept verbatim
+
+    Returns:
+        One-line digest
+    """
+    try:
+        rows = json.loads(block)
+    except ValueError:
+        return f"[Result table omitted ({len(block)} characters)]"
+    if not isinstance(rows, list) or not rows:
+        return "[Result table: 0 rows]"
+
+    columns = list(rows[0].keys()) if isinstance(rows[0], dict) else []
+    first_rows = [
+        {key: _shorten(value) for key, value in row.items()} if isinstance(row, dict) else _shorten(row)
+        for row in rows[:sample_rows]
+    ]
+    digest = f"[Result table: {len(rows)} row{'s' if len(rows) != 1 else ''}"
+    if columns:
+        digest += f", columns: {', '.join(str(column) for column in columns)}"
+    digest += f"; first {len(first_rows)}: {json.dumps(first_rows, ensure_ascii=False, default=str)}"
+    if len(rows) > len(first_rows):
+        digest += f" ... +{len(rows) - len(first_rows)} more"
+    return digest + "]"
+
+
+def digest_chart_block(block: str) -> str:
+    """
+    Summarize a ```chart block as its type, title, axes and series.
+
+    Args:
+        block: Chart configuration JSON (the inside of the block)
+
+    Returns:
+        One-line digest
+    """
+    try:
+        config = json.loads(block)
+    except ValueError:
+        return f"[Chart omitted ({len(block)} characters)]"
+    if not isinstance(config, dict):
+        return "[Chart]"
+
+    data = config.get("data") or {}
+    series = [dataset.get("label", "") for dataset in data.get("datasets", []) if isinstance(dataset, dict)]
+    digest = f"[Chart: {str(config.get('type', 'chart')).upper()} \"{config.get('title', '')}\""
+    if config.get("x_axis_label"):
+        digest += f", x: {config['x_axis_label']}"
+    if series:
+        digest += f", series: {', '.join(str(label) for label in series)}"
+    if data.get("labels"):
+        digest += f", {len(data['labels'])} categories"
+    return digest + "]"
+
+
+def sanitize_message_content(content: str, sample_rows: int = 3) -> str:
+    """
+    Replace the result tables and charts in a stored message with compact digests.
+
+    The SQL and any text around the blocks are kept as they are; results are
+    cached by content since the same messages are resent on every turn.
+
+    Args:
+        content: Stored message content
+        sample_rows: Rows kept verbatim per result table
+
+    Returns:
+        Content with ```table and ```chart blocks replaced by one-line digests
+    """
+    if "```table" not in content and "```chart" not in content:
+        return content
+
+    key = (hashlib.sha256(content.encode("utf-8")).hexdigest(), sample_rows)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    sanitized = _TABLE_BLOCK_PATTERN.sub(lambda match: digest_table_block(match.group(1), sample_rows), content)
+    sanitized = _CHART_BLOCK_PATTERN.sub(lambda match: digest_chart_block(match.group(1)), sanitized)
+
+    with _cache_lock:
+        _cache[key] = sanitized
+        while len(_cache) > _MAX_CACHED_MESSAGES:
+            _cache.popitem(last=False)
+    return sanitized
+
+
+def sanitize_history(conversation_history: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Compact the result blocks of every message in a conversation history.
+
+    Args:
+        conversation_history: Messages with 'role' and 'content'
+
+    Returns:
+        New list of messages with sanitized content (None stays None)
+    """
+    if not conversation_history or not _settings.history_compact_results:
+        return conversation_history
+    return [
+        {**msg, "content": sanitize_message_content(str(msg.get("content", "")), _settings.history_result_rows)}
+        for msg in conversation_history
+    ]
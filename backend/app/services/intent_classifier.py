@@ -0,0 +1,226 @@
+"""Local intent pre-classifier: answer obviously unrelated questions without an LLM call."""
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+
+# Intents learned from stored replies
+INTENT_DATA = "data"
+INTENT_UNRELATED = "unrelated"
+
+# Replies that never reached the model (no dataset selected) say nothing about the question
+_NO_DATASET_REPLY = "I'd be happy to help you analyze your data! However, I notice you haven't selected a dataset."
+
+_MENTION_PATTERN = re.compile(r'@\S+')
+
+
+def label_reply(reply: str) -> Optional[str]:
+    """
+    Derive the intent of a stored question from the assistant's reply to it.
+
+    Args:
+        reply: Stored assistant message content
+
+    Returns:
+        "data" if the reply ran or proposed SQL, "unrelated" if it answered
+        without any, None if the reply carries no signal
+    """
+    if not reply or reply.startswith(_NO_DATASET_REPLY):
+        return None
+    if "```sql" in reply or "```table" in reply or "<confirmation" in reply:
+        return INTENT_DATA
+    return INTENT_UNRELATED
+
+
+def _normalize(question: str) -> str:
+    """Drop @dataset mentions so the model learns the wording, not the table names."""
+    return " ".join(_MENTION_PATTERN.sub(" ", question).lower().split())
+
+
+class IntentClassifier:
+    """
+    TF-IDF + logistic regression classifier of "data" vs "unrelated" questions.
+
+    Trained offline from stored (question, reply) pairs of the users given to
+    `python -m app.services.intent_classifier` (see train()) and saved with
+    joblib; there is no HTTP endpoint for training. At request time only
+    questions classified "unrelated" with at least `threshold` probability
+    are short-circuited; everything else goes to the model as before. Without a trained model (or scikit-learn) it never fires.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        enabled: bool = True,
+        threshold: float = 0.9,
+        min_examples: int = 20
+    ):
+        """
+        Initialize the classifier (the model file is loaded on first use).
+
+        Args:
+            model_path: joblib file holding the trained pipeline
+            enabled: If False no question is short-circuited
+            threshold: Minimum "unrelated" probability to skip the LLM
+            min_examples: Examples of each intent required to train
+        """
+        self.model_path = model_path
+        self.enabled = enabled
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self._pipeline = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.trained_at: Optional[float] = None
+        self.training_report: Dict[str, Any] = {}
+        self.predictions = 0
+        self.short_circuits = 0
+
+    def _load(self):
+        """Load the trained pipeline from disk once."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.model_path):
+                return
+            try:
+                import joblib
+
+                saved = joblib.load(self.model_path)
+                self._pipeline = saved["pipeline"]
+                self.trained_at = saved.get("trained_at")
+                self.training_report = saved.get("report", {})
+                print(f"🧭 Intent classifier loaded from {self.model_path}")
+            except Exception as e:
+                print(f"⚠️ Warning: Failed to load intent classifier: {str(e)}")
+
+    def predict(self, question: str) -> Optional[Tuple[str, float]]:
+        """
+        Classify a question.
+
+        Returns:
+            (intent, probability), or None without a trained model
+        """
+        if not self._loaded:
+            self._load()
+        pipeline = self._pipeline
+        if pipeline is None:
+            return None
+
+        probabilities = pipeline.predict_proba([_normalize(question)])[0]
+        best = probabilities.argmax()
+        self.predictions += 1
+        return str(pipeline.classes_[best]), float(probabilities[best])
+
+    def is_unrelated(self, question: str) -> bool:
+        """True if the question is confidently not about the data (the LLM call can be skipped)."""
+        if not self.enabled:
+            return False
+        prediction = self.predict(question)
+        if prediction is None:
+            return False
+
+        intent, probability = prediction
+        if intent != INTENT_UNRELATED or probability < self.threshold:
+            return False
+        self.short_circuits += 1
+        print(f"🧭 Question classified as unrelated ({probability:.2f}) - skipping SQL generation")
+        return True
+
+    def train(self, pairs: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """
+        Fit the classifier on (question, reply) pairs, save it and start using it.
+
+        Args:
+            pairs: Stored user questions and the assistant replies to them
+
+        Returns:
+            Training report (examples per intent, held-out accuracy), or the reason nothing was trained
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.model_selection import train_test_split
+        from sklearn.pipeline import make_pipeline
+        import joblib
+
+        examples = [(_normalize(question), label_reply(reply)) for question, reply in pairs]
+        examples = [(text, label) for text, label in examples if text and label]
+        counts = Counter(label for _, label in examples)
+        if min(counts.get(INTENT_DATA, 0), counts.get(INTENT_UNRELATED, 0)) < self.min_examples:
+            return {"trained": False, "reason": f"need {self.min_examples} examples of each intent", "examples": dict(counts)}
+
+        texts = [text for text, _ in examples]
+        labels = [label for _, label in examples]
+
+        def build():
+            return make_pipeline(
+                TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=1),
+                LogisticRegression(class_weight="balanced", max_iter=1000)
+            )
+
+        # Held-out accuracy first, then the final model on every example
+        train_texts, test_texts, train_labels, test_labels = train_test_split(
+            texts, labels, test_size=0.2, stratify=labels, random_state=0
+        )
+        accuracy = build().fit(train_texts, train_labels).score(test_texts, test_labels)
+        pipeline = build().fit(texts, labels)
+
+        report = {"trained": True, "examples": dict(counts), "holdout_accuracy": round(accuracy, 3)}
+        trained_at = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(self.model_path)), exist_ok=True)
+        joblib.dump({"pipeline": pipeline, "trained_at": trained_at, "report": report}, self.model_path)
+
+        with self._lock:
+            self._pipeline = pipeline
+            self._loaded = True
+            self.trained_at = trained_at
+            self.training_report = report
+        print(f"🧭 Intent classifier trained on {len(examples)} examples (held-out accuracy {accuracy:.2f})")
+        return report
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return classifier state and how many LLM calls it avoided."""
+        return {
+            "enabled": self.enabled,
+            "model_loaded": self._pipeline is not None,
+            "model_path": os.path.abspath(self.model_path),
+            "threshold": self.threshold,
+            "trained_at": self.trained_at,
+            "training": self.training_report,
+            "predictions": self.predictions,
+            "llm_calls_avoided": self.short_circuits
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+intent_classifier = IntentClassifier(
+    model_path=_settings.intent_classifier_path,
+    enabled=_settings.intent_classifier_enabled,
+    threshold=_settings.intent_classifier_threshold,
+    min_examples=_settings.intent_classifier_min_examples
+)
+
+
+if __name__ == "__main__":
+    # Offline training: python -m app.services.intent_classifier --user-id 1 [--user-id 2 ...] | --all-users
+    import argparse
+
+    from app import crud
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Train the intent classifier on stored questions and replies")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--user-id", type=int, action="append", dest="user_ids", help="Train on this user's conversations (repeatable)")
+    scope.add_argument("--all-users", action="store_true", help="Train on every user's conversations")
+    parser.add_argument("--limit", type=int, default=20000, help="Most recent messages to train on")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        print(intent_classifier.train(crud.get_prompt_replies(db, user_ids=args.user_ids, limit=args.limit)))
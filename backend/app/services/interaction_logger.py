@@ -0,0 +1,222 @@
+"""Background, batched JSONL logger for AI interactions with rotation and compression."""
+import atexit
+import gzip
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.config import get_settings
+
+
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'debug')
+LOG_FILE_NAME = "ai_interactions.jsonl"
+
+
+class InteractionLogger:
+    """
+    Queue-backed writer of one JSON record per AI interaction.
+
+    log() only enqueues, so request handlers never touch the disk. A daemon
+    thread drains the queue in batches, appends them to ai_interactions.jsonl
+    and rotates the file by size or age (optionally gzip-compressing rotated
+    files and keeping only the newest `backup_count`). Records can be sampled,
+    and prompt/response text can be left out to keep only sizes and timings.
+    """
+
+    def __init__(
+        self,
+        log_dir: str = DEFAULT_LOG_DIR,
+        enabled: bool = True,
+        sample_rate: float = 1.0,
+        include_text: bool = True,
+        max_bytes: int = 50 * 1024 * 1024,
+        rotate_seconds: int = 86400,
+        backup_count: int = 10,
+        compress: bool = True,
+        batch_size: int = 100,
+        flush_interval_seconds: float = 1.0,
+        max_queue_size: int = 10000
+    ):
+        """Initialize the logger (the writer thread starts on the first record)."""
+        self.log_dir = log_dir
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.include_text = include_text
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._file_opened_at = time.time()
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.rotations = 0
+
+    @property
+    def log_path(self) -> str:
+        return os.path.join(self.log_dir, LOG_FILE_NAME)
+
+    def log(self, record: Dict[str, Any], always: bool = False):
+        """
+        Enqueue a record without blocking.
+
+        Args:
+            record: JSON-serializable fields; "prompt"/"response" text is dropped
+                unless include_text is set (their sizes are always recorded)
+            always: Bypass sampling (e.g. for errors)
+        """
+        if not self.enabled:
+            return
+        if not always and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+
+        entry = {"timestamp": datetime.now().isoformat(timespec="milliseconds")}
+        for field in ("prompt", "response"):
+            if field in record:
+                text = record[field] or ""
+                entry[f"{field}_chars"] = len(text)
+                if self.include_text:
+                    entry[field] = text
+        entry.update({key: value for key, value in record.items() if key not in ("prompt", "response")})
+
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        """Start the writer thread once."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ai-interaction-logger", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        """Writer loop: collect a batch, write it, rotate if needed."""
+        running = True
+        while running:
+            batch: List[Dict[str, Any]] = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval_seconds)
+                if item is None:
+                    running = False
+                else:
+                    batch.append(item)
+                    while len(batch) < self.batch_size:
+                        item = self._queue.get_nowait()
+                        if item is None:
+                            running = False
+                            break
+                        batch.append(item)
+            except queue.Empty:
+                pass
+
+            if batch:
+                self._write(batch)
+            self._maybe_rotate()
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        """Append a batch of records to the active log file."""
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            if not os.path.exists(self.log_path):
+                self._file_opened_at = time.time()
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in batch))
+            self.written += len(batch)
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to write AI interaction log: {str(e)}")
+
+    def _maybe_rotate(self):
+        """Rotate the active file when it is too large or too old."""
+        try:
+            if not os.path.exists(self.log_path):
+                return
+            too_big = self.max_bytes and os.path.getsize(self.log_path) >= self.max_bytes
+            too_old = self.rotate_seconds and time.time() - self._file_opened_at >= self.rotate_seconds
+            if not (too_big or too_old):
+                return
+
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            rotated = os.path.join(self.log_dir, f"ai_interactions-{stamp}.jsonl")
+            suffix = 1
+            while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+                rotated = os.path.join(self.log_dir, f"ai_interactions-{stamp}-{suffix}.jsonl")
+                suffix += 1
+            os.replace(self.log_path, rotated)
+            self._file_opened_at = time.time()
+            self.rotations += 1
+
+            if self.compress:
+                with open(rotated, 'rb') as source, gzip.open(rotated + ".gz", 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(rotated)
+
+            self._prune_backups()
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to rotate AI interaction log: {str(e)}")
+
+    def _prune_backups(self):
+        """Keep only the newest backup_count rotated files."""
+        if not self.backup_count:
+            return
+        backups = sorted(
+            name for name in os.listdir(self.log_dir)
+            if name.startswith("ai_interactions-") and (name.endswith(".jsonl") or name.endswith(".jsonl.gz"))
+        )
+        for name in backups[:-self.backup_count]:
+            os.remove(os.path.join(self.log_dir, name))
+
+    def close(self, timeout: float = 5.0):
+        """Flush pending records and stop the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return writer counters."""
+        return {
+            "enabled": self.enabled,
+            "log_path": os.path.abspath(self.log_path),
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "rotations": self.rotations,
+            "sample_rate": self.sample_rate,
+            "include_text": self.include_text
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+interaction_logger = InteractionLogger(
+    log_dir=_settings.ai_log_dir or DEFAULT_LOG_DIR,
+    enabled=_settings.ai_log_enabled,
+    sample_rate=_settings.ai_log_sample_rate,
+    include_text=_settings.ai_log_include_text,
+    max_bytes=_settings.ai_log_max_bytes,
+    rotate_seconds=_settings.ai_log_rotate_seconds,
+    backup_count=_settings.ai_log_backup_count,
+    compress=_settings.ai_log_compress
+)
@@ -0,0 +1,79 @@
+"""Pacing profiles: optional artificial pauses between streamed pipeline steps."""
+import asyncio
+import contextvars
+from typing import Dict, Optional
+
+from app.config import get_settings
+
+
+# Pause lengths in seconds per profile. "demo" keeps the loading states on screen long
+# enough to read (the pipeline's original fixed delays); "none" streams as fast as it can.
+PACING_PROFILES: Dict[str, Dict[str, float]] = {
+    "none": {},
+    "demo": {
+        "after_query": 1.0,
+        "before_chart_decision": 2.0,
+        "before_chart": 5.0,
+        "agent_planning": 1.0,
+        "agent_writing_sql": 0.5,
+        "agent_before_read": 1.5,
+        "agent_next_step": 0.5
+    }
+}
+
+# Per-request override; set by the routes from AskRequest.pacing
+_request_profile: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("pacing_profile", default=None)
+
+
+def set_pacing_profile(profile: Optional[str]):
+    """Use a pacing profile for the rest of the current request (None = the configured default)."""
+    _request_profile.set(profile if profile in PACING_PROFILES else None)
+
+
+class Pacer:
+    """
+    Named pauses in the streaming pipeline, sized by the active pacing profile.
+
+    Pauses are always asyncio sleeps, so a paced stream never blocks the event
+    loop for other requests. With the default "none" profile pause() returns
+    immediately.
+    """
+
+    def __init__(self, default_profile: str = "none"):
+        """
+        Initialize the pacer.
+
+        Args:
+            default_profile: Profile used when the request does not choose one
+        """
+        self.default_profile = default_profile if default_profile in PACING_PROFILES else "none"
+        self.pauses = 0
+        self.paused_seconds = 0.0
+
+    def delay(self, name: str) -> float:
+        """Seconds the named pause lasts under the current request's profile."""
+        profile = _request_profile.get() or self.default_profile
+        return PACING_PROFILES[profile].get(name, 0.0)
+
+    async def pause(self, name: str):
+        """Pause the current stream for the named step (no-op without pacing)."""
+        seconds = self.delay(name)
+        if seconds <= 0:
+            return
+        self.pauses += 1
+        self.paused_seconds += seconds
+        await asyncio.sleep(seconds)
+
+    def get_stats(self) -> Dict[str, object]:
+        """Return the default profile and the artificial delay added so far."""
+        return {
+            "default_profile": self.default_profile,
+            "profiles": sorted(PACING_PROFILES),
+            "pauses": self.pauses,
+            "paused_seconds": round(self.paused_seconds, 1)
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+pacer = Pacer(default_profile=_settings.pacing_profile)
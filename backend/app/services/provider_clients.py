@@ -0,0 +1,240 @@
+"""Pooled registry of AI provider clients, keyed by provider and hashed API key."""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.config import get_settings
+
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+
+
+def hash_api_key(api_key: str) -> str:
+    """Hash an API key so raw keys are never used as dictionary keys or logged."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class ProviderAPIError(Exception):
+    """
+    Error raised by a provider call.
+
+    Keeps the message format of the original generic errors
+    ("OpenAI API error: ...") but also carries the HTTP status code and the
+    Retry-After hint so callers can tell rate limiting apart from real failures.
+    """
+
+    def __init__(self, provider_label: str, error: Exception):
+        """Wrap a provider SDK exception."""
+        super().__init__(f"{provider_label} API error: {str(error)}")
+        self.provider_label = provider_label
+        self.status_code = _status_code_of(error)
+        self.retry_after = _retry_after_of(error)
+
+    @property
+    def is_rate_limited(self) -> bool:
+        """Whether the provider rejected the call with HTTP 429."""
+        return self.status_code == 429
+
+
+def _status_code_of(error: Exception) -> Optional[int]:
+    """Extract the HTTP status from OpenAI/Anthropic (status_code) or Google (code) errors."""
+    for attribute in ("status_code", "code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return int(value)
+    return None
+
+
+def _retry_after_of(error: Exception) -> Optional[float]:
+    """Read the Retry-After header (seconds) from an SDK error's HTTP response."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers.get("retry-after-ms")) / 1000
+        if headers.get("retry-after"):
+            return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class ProviderClientRegistry:
+    """
+    Keep one long-lived async client per (provider, API key).
+
+    Reusing a client keeps its HTTP keep-alive pool and TLS sessions warm, so the
+    4-6 provider calls of a multi-step turn pay the connection setup only once.
+    Clients are evicted when idle for too long or when the pool is full (LRU).
+    """
+
+    def __init__(self, max_clients: int = 64, idle_timeout_seconds: float = 600, connect_timeout_seconds: float = 10):
+        """Initialize an empty registry."""
+        self.max_clients = max_clients
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.connect_timeout_seconds = connect_timeout_seconds
+        self._clients: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _http_timeout(self):
+        """
+        HTTP timeout for SDK clients: only the connect phase is bounded here.
+
+        Read/total timeouts depend on the pipeline stage and are enforced per call
+        by the resilience layer, which also owns retries (SDK retries are disabled).
+        """
+        import httpx
+        return httpx.Timeout(None, connect=self.connect_timeout_seconds)
+
+    def get_openai_client(self, api_key: str):
+        """Get a pooled AsyncOpenAI client for the given key."""
+        def factory():
+            import openai
+            return openai.AsyncOpenAI(api_key=api_key, timeout=self._http_timeout(), max_retries=0)
+        return self._get("openai", api_key, factory)
+
+    def get_deepseek_client(self, api_key: str):
+        """Get a pooled OpenAI-compatible client pointed at DeepSeek."""
+        def factory():
+            from openai import AsyncOpenAI
+            return AsyncOpenAI(
+                api_key=api_key, base_url=DEEPSEEK_BASE_URL, timeout=self._http_timeout(), max_retries=0
+            )
+        return self._get("deepseek", api_key, factory)
+
+    def get_anthropic_client(self, api_key: str):
+        """Get a pooled AsyncAnthropic client for the given key."""
+        def factory():
+            import anthropic
+            return anthropic.AsyncAnthropic(api_key=api_key, timeout=self._http_timeout(), max_retries=0)
+        return self._get("anthropic", api_key, factory)
+
+    def get_gemini_client(self, api_key: str):
+        """
+        Get a pooled Gemini async client configured with this key only.
+
+        Unlike genai.configure(), this does not touch process-global state, so
+        concurrent users with different keys can no longer race each other.
+        """
+        def factory():
+            from google.ai import generativelanguage as glm
+            from google.api_core.client_options import ClientOptions
+            return glm.GenerativeServiceAsyncClient(client_options=ClientOptions(api_key=api_key))
+        return self._get("gemini", api_key, factory)
+
+    def get_gemini_model(self, model: str, api_key: str, **kwargs):
+        """
+        Build a GenerativeModel bound to the pooled client for this key.
+
+        google-generativeai (pinned to 0.8.3 in requirements.txt) has no public
+        way to give a GenerativeModel its own client: unset, it falls back to the
+        client of the process-global genai.configure(). The pooled client is
+        therefore assigned to the private `_async_client` attribute the SDK
+        reads. If an upgraded SDK no longer has that attribute this raises
+        instead of silently sending the call with another user's key.
+        """
+        import google.generativeai as genai
+
+        gemini_model = genai.GenerativeModel(model, **kwargs)
+        if not hasattr(gemini_model, "_async_client"):
+            raise RuntimeError(
+                f"google-generativeai {getattr(genai, '__version__', '?')} does not support per-key "
+                "clients (GenerativeModel._async_client is gone); pin google-generativeai==0.8.3"
+            )
+        gemini_model._async_client = self.get_gemini_client(api_key)
+        return gemini_model
+
+    def _get(self, provider: str, api_key: str, factory: Callable[[], Any]):
+        """Return a cached client or create one, evicting stale entries first."""
+        key = (provider, hash_api_key(api_key))
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._clients.get(key)
+            if entry is not None:
+                self.hits += 1
+                entry["last_used"] = now
+                self._clients.move_to_end(key)
+                return entry["client"]
+
+            self.misses += 1
+            client = factory()
+            self._clients[key] = {"client": client, "created": now, "last_used": now}
+
+            while len(self._clients) > self.max_clients:
+                _, evicted = self._clients.popitem(last=False)
+                self.evictions += 1
+                self._close_client(evicted["client"])
+
+            return client
+
+    def _evict_idle(self, now: float):
+        """Drop clients that have not been used within the idle timeout."""
+        if not self.idle_timeout_seconds:
+            return
+
+        stale_keys = [
+            key for key, entry in self._clients.items()
+            if now - entry["last_used"] > self.idle_timeout_seconds
+        ]
+        for key in stale_keys:
+            entry = self._clients.pop(key)
+            self.evictions += 1
+            self._close_client(entry["client"])
+
+    def _close_client(self, client):
+        """Close an evicted client's connection pool in the background."""
+        close = getattr(client, "close", None)
+        if close is None and hasattr(client, "transport"):
+            close = getattr(client.transport, "close", None)
+        if close is None:
+            return
+
+        try:
+            result = close()
+            if asyncio.iscoroutine(result):
+                try:
+                    asyncio.get_running_loop().create_task(result)
+                except RuntimeError:
+                    # No running loop - let garbage collection release the pool
+                    result.close()
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to close evicted provider client: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return pool hit/miss counters and current pool contents."""
+        with self._lock:
+            total = self.hits + self.misses
+            per_provider: Dict[str, int] = {}
+            for provider, _ in self._clients.keys():
+                per_provider[provider] = per_provider.get(provider, 0) + 1
+
+            return {
+                "size": len(self._clients),
+                "max_clients": self.max_clients,
+                "idle_timeout_seconds": self.idle_timeout_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "clients_per_provider": per_provider
+            }
+
+
+# Singleton instance
+_settings = get_settings()
+provider_clients = ProviderClientRegistry(
+    max_clients=_settings.provider_client_pool_size,
+    idle_timeout_seconds=_settings.provider_client_idle_seconds,
+    connect_timeout_seconds=_settings.provider_connect_timeout_seconds
+)
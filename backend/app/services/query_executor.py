@@ -1,10 +1,12 @@
 """Shared query execution service for SELECT queries with chart generation."""
 import json
 import time
-from typing import AsyncGenerator, Optional, Dict, Any
+from typing import AsyncGenerator, Optional, Dict, Any, Tuple
 
 from app.services.dataset_service import get_dataset_service
+from app.services.dataset_executor import dataset_executor
 from app.services.ai_service import ai_service
+from app.services.pacing import pacer
 
 
 async def execute_select_query_with_chart(
@@ -14,7 +16,10 @@ async def execute_select_query_with_chart(
     api_key: str,
     result_storage: Optional[Dict[str, Any]] = None,
     db_session = None,
-    conversation_id: Optional[int] = None
+    conversation_id: Optional[int] = None,
+    speculation = None,
+    step: Optional[int] = None,
+    prefetched: Optional[Tuple[Dict[str, Any], int]] = None
 ) -> AsyncGenerator[str, None]:
     """
     Execute a SELECT query and generate chart if applicable.
@@ -34,21 +39,33 @@ async def execute_select_query_with_chart(
         result_storage: Optional dict to store the result and chart_config for database storage
         db_session: Database session for storing execution history
         conversation_id: ID of conversation for history tracking
+        speculation: SpeculativeQuery fed while the SQL was generated; its result is
+            reused when it ran this same query
+        step: Query step number added to the query, result and chart events, so a chart
+            delivered after later steps' events can be placed with its result
+        prefetched: (result, execution_time_ms) of the query when it already ran (e.g. as
+            part of a query plan executed in parallel)
         
     Yields:
         Server-sent events with query results and chart configuration
     """
+    step_field = {'step': step} if step is not None else {}
+    
     # Send SQL query to frontend
-    yield f"data: {json.dumps({'type': 'sql_query', 'content': sql_query})}\n\n"
+    yield f"data: {json.dumps({'type': 'sql_query', 'content': sql_query, **step_field})}\n\n"
     
     # Send loading status BEFORE execution
     yield f"data: {json.dumps({'type': 'loading', 'content': 'AI is executing query...'})}\n\n"
     
-    # Execute query and measure execution time
-    start_time = time.time()
-    dataset_service = get_dataset_service()
-    result = dataset_service.execute_sql_query(sql_query)
-    execution_time_ms = int((time.time() - start_time) * 1000)
+    # Execute query and measure execution time (unless it already ran while the response streamed)
+    speculated = prefetched or (await speculation.take(sql_query) if speculation else None)
+    if speculated:
+        result, execution_time_ms = speculated
+    else:
+        start_time = time.time()
+        dataset_service = get_dataset_service()
+        result = await dataset_executor.read(dataset_service.execute_sql_query, sql_query)
+        execution_time_ms = int((time.time() - start_time) * 1000)
     
     # Store SQL execution history in database
     if db_session and conversation_id:
@@ -72,11 +89,11 @@ async def execute_select_query_with_chart(
     if result_storage is not None:
         result_storage['result'] = result
     
-    # Pause for 1 second after query execution
-    time.sleep(1)
+    # Optional pause after query execution (pacing profile)
+    await pacer.pause("after_query")
     
     # Send results to frontend
-    yield f"data: {json.dumps({'type': 'sql_result', 'content': result})}\n\n"
+    yield f"data: {json.dumps({'type': 'sql_result', 'content': result, **step_field})}\n\n"
     
     # Decide on graph generation
     graph_decision_json = None
@@ -97,9 +114,8 @@ async def execute_select_query_with_chart(
         # Send loading status for chart decision
         yield f"data: {json.dumps({'type': 'loading', 'content': 'AI is deciding whether to generate charts...'})}\n\n"
         
-        # Add 1 second delay so users can see the loading state
-        import asyncio
-        await asyncio.sleep(2)
+        # Optional pause so users can see the loading state (pacing profile)
+        await pacer.pause("before_chart_decision")
         
         # Ask AI to decide what to chart
         chart_decision = await ask_ai_for_chart_config(
@@ -114,8 +130,8 @@ async def execute_select_query_with_chart(
             # Send loading status for chart generation
             yield f"data: {json.dumps({'type': 'loading', 'content': 'AI is generating charts...'})}\n\n"
             
-            # Add another brief delay for chart generation
-            await asyncio.sleep(5)
+            # Optional pause for chart generation (pacing profile)
+            await pacer.pause("before_chart")
             
             chart_config = structure_chart_data(result, chart_decision)
             
@@ -143,19 +159,19 @@ async def execute_select_query_with_chart(
             }
             
             # Send graph decision first
-            yield f"data: {json.dumps({'type': 'graph_decision', 'content': graph_decision_json})}\n\n"
+            yield f"data: {json.dumps({'type': 'graph_decision', 'content': graph_decision_json, **step_field})}\n\n"
             
             # Then send chart config
-            yield f"data: {json.dumps({'type': 'chart_config', 'content': chart_config})}\n\n"
+            yield f"data: {json.dumps({'type': 'chart_config', 'content': chart_config, **step_field})}\n\n"
             
             # Clear loading status after chart is sent
             yield f"data: {json.dumps({'type': 'loading', 'content': 'AI is analyzing results...'})}\n\n"
         else:
             graph_decision_json = {'should_generate_graph': False}
-            yield f"data: {json.dumps({'type': 'graph_decision', 'content': graph_decision_json})}\n\n"
+            yield f"data: {json.dumps({'type': 'graph_decision', 'content': graph_decision_json, **step_field})}\n\n"
     else:
         graph_decision_json = {'should_generate_graph': False}
-        yield f"data: {json.dumps({'type': 'graph_decision', 'content': graph_decision_json})}\n\n"
+        yield f"data: {json.dumps({'type': 'graph_decision', 'content': graph_decision_json, **step_field})}\n\n"
 
 
 def build_result_content_for_storage(
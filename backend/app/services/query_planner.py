@@ -0,0 +1,146 @@
+"""Query plans: independent SELECTs planned in one response and executed in parallel."""
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+from app.services.dataset_executor import dataset_executor
+from app.services.dataset_service import get_dataset_service
+
+
+# Marks a response that plans several independent queries at once
+QUERY_PLAN_MARKER = "QUERY_PLAN"
+
+_SQL_BLOCK_PATTERN = re.compile(r'```sql\s*(.*?)\s*```', re.DOTALL | re.IGNORECASE)
+
+
+class QueryPlanner:
+    """
+    Plan exploratory questions as a batch of independent queries.
+
+    Instead of the serial loop (one query, then a next-step call deciding the
+    next one), the first SQL call may answer a broad question with a
+    QUERY_PLAN: up to `max_queries` SELECTs that do not depend on each other.
+    They run at the same time on read-only connections in the dataset read
+    lane and a single conclusion call summarizes them. Questions whose steps
+    depend on earlier results keep using MULTI_STEP_QUERY and the serial loop.
+    """
+
+    def __init__(self, enabled: bool = True, max_queries: int = 4):
+        """
+        Initialize the planner.
+
+        Args:
+            enabled: If False the SQL prompt does not offer plans and responses are never parsed as one
+            max_queries: Queries of a plan that are executed (extra ones are dropped)
+        """
+        self.enabled = enabled
+        self.max_queries = max(2, max_queries)
+        self.plans = 0
+        self.planned_queries = 0
+        self.failed_queries = 0
+        self.rejected = 0
+        self.execution_ms_total = 0.0
+        self.sequential_ms_total = 0.0
+
+    def prompt_rules(self) -> List[str]:
+        """SQL prompt rule for exploratory questions, offering a query plan."""
+        return [
+            "2. EXPLORATORY QUESTIONS: If the question is broad/vague like 'What patterns do you see?', 'Analyze this data', 'Show me something interesting', 'What trends exist?', 'Tell me about this data':",
+            f"   - Respond with '{QUERY_PLAN_MARKER}' followed by 2-{self.max_queries} INDEPENDENT SELECT queries, each looking at a different angle (overview, distribution, top/bottom, trend)",
+            "   - Before each query write one line saying what it shows, then the query in its own ```sql``` block",
+            "   - The queries run at the same time: none may depend on another query's result",
+            "   - If a query needs an earlier result, use 'MULTI_STEP_QUERY: Step 1' and provide only the first query instead",
+        ]
+
+    def parse(self, response: str) -> Optional[List[Tuple[str, str]]]:
+        """
+        Extract a query plan from a SQL response.
+
+        Args:
+            response: Complete response of the first SQL call
+
+        Returns:
+            (purpose, sql) pairs of the planned SELECTs, or None when the response
+            is not a plan with at least two of them (it then runs as a single query)
+        """
+        if not self.enabled or QUERY_PLAN_MARKER not in response:
+            return None
+
+        text = response.split(QUERY_PLAN_MARKER, 1)[1]
+        plan = []
+        seen = set()
+        position = 0
+        for match in _SQL_BLOCK_PATTERN.finditer(text):
+            preceding = [line for line in text[position:match.start()].splitlines() if line.strip()]
+            position = match.end()
+            sql = match.group(1).strip()
+            # Only plain SELECTs run in parallel; anything else is not a valid plan step
+            if not sql.upper().startswith("SELECT") or sql in seen:
+                continue
+            seen.add(sql)
+            purpose = preceding[-1].strip().lstrip("-*0123456789.) ").rstrip(":*").strip() if preceding else ""
+            plan.append((purpose, sql))
+
+        if len(plan) < 2:
+            self.rejected += 1
+            return None
+        return plan[:self.max_queries]
+
+    async def execute(self, plan: List[Tuple[str, str]], speculation=None) -> List[Tuple[Dict[str, Any], int]]:
+        """
+        Run a plan's queries in parallel on read-only connections.
+
+        Args:
+            plan: (purpose, sql) pairs from parse()
+            speculation: SpeculativeQuery of the planning response; it can only
+                have started the first query, whose result is reused
+
+        Returns:
+            (result, execution_time_ms) per query, in plan order
+        """
+        dataset_service = get_dataset_service()
+
+        async def run(sql: str, speculation=None) -> Tuple[Dict[str, Any], int]:
+            speculated = await speculation.take(sql) if speculation else None
+            if speculated:
+                return speculated
+            started = time.time()
+            result = await dataset_executor.read(dataset_service.execute_sql_query, sql, read_only=True)
+            return result, int((time.time() - started) * 1000)
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(
+            run(sql, speculation if i == 0 else None) for i, (_, sql) in enumerate(plan)
+        ))
+
+        self.plans += 1
+        self.planned_queries += len(plan)
+        self.failed_queries += sum(1 for result, _ in outcomes if not result.get("success"))
+        self.execution_ms_total += (time.perf_counter() - started) * 1000
+        self.sequential_ms_total += sum(ms for _, ms in outcomes)
+        return outcomes
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return plan counters and parallel vs. sequential execution time."""
+        return {
+            "enabled": self.enabled,
+            "max_queries": self.max_queries,
+            "plans": self.plans,
+            "planned_queries": self.planned_queries,
+            "failed_queries": self.failed_queries,
+            "rejected_plans": self.rejected,
+            # The serial loop makes one next-step call after every query
+            "next_step_calls_avoided": self.planned_queries,
+            "execution_ms": round(self.execution_ms_total, 1),
+            "sequential_execution_ms": round(self.sequential_ms_total, 1)
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+query_planner = QueryPlanner(
+    enabled=_settings.query_planning_enabled,
+    max_queries=_settings.query_plan_max_queries
+)
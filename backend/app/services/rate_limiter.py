@@ -0,0 +1,312 @@
+"""Per-provider and per-API-key concurrency limits and token-bucket rate limiting."""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.config import get_settings
+from app.services.provider_clients import ProviderAPIError, hash_api_key
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call could not get a provider slot within the bounded wait."""
+
+    def __init__(self, provider: str, waited_seconds: float):
+        """Describe the rejected call."""
+        super().__init__(
+            f"{provider} is busy: no request slot became available within {waited_seconds:.1f}s. Please try again shortly."
+        )
+        self.provider = provider
+
+
+def estimate_tokens(text: str, conversation_history: Optional[list] = None) -> int:
+    """Rough input token estimate (~4 characters per token) used for tokens/min budgeting."""
+    characters = len(text or "")
+    for msg in (conversation_history or [])[-10:]:
+        characters += len(str(msg.get("content", "")))
+    return max(1, characters // 4)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute: float):
+        """Start with a full bucket (capacity = one minute of budget)."""
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        """Add the tokens accrued since the last update."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens would be available (without consuming)."""
+        if not self.per_minute:
+            return 0.0
+        self._refill(time.monotonic())
+        # Requests larger than the whole bucket only need a full bucket
+        deficit = min(amount, self.capacity) - self.tokens
+        return max(0.0, deficit * 60 / self.per_minute)
+
+    def consume(self, amount: float):
+        """Take tokens (callers check wait_time() first)."""
+        if not self.per_minute:
+            return
+        self._refill(time.monotonic())
+        self.tokens -= min(amount, self.capacity)
+
+
+class _LimitState:
+    """Semaphore, buckets and counters for one provider or one (provider, key) pair."""
+
+    def __init__(self, max_concurrency: int, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.cooldown_until = 0.0
+
+
+class RateLimiter:
+    """
+    Bound concurrent provider calls and pace them to the provider quotas.
+
+    Every call first waits for its API key's request and token buckets (and any
+    Retry-After cooldown), then takes a slot in the per-key and per-provider
+    semaphores. Waiting is bounded: a call that cannot start within
+    `max_wait_seconds` fails with RateLimitTimeout instead of queueing forever.
+    When a provider still answers 429, the key is put on cooldown for the
+    Retry-After period (or an exponential backoff) and the call is retried.
+    """
+
+    def __init__(
+        self,
+        defaults: Dict[str, float],
+        overrides: Optional[Dict[str, Dict[str, float]]] = None,
+        max_wait_seconds: float = 30,
+        max_retries: int = 3
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            defaults: max_concurrency, key_max_concurrency, requests_per_minute, tokens_per_minute
+            overrides: Per-provider values replacing the defaults (e.g. {"openai": {"requests_per_minute": 500}})
+            max_wait_seconds: Longest a call may queue before being rejected
+            max_retries: Retries after a 429 response
+        """
+        self.defaults = defaults
+        self.overrides = overrides or {}
+        self.max_wait_seconds = max_wait_seconds
+        self.max_retries = max_retries
+        self._providers: Dict[str, _LimitState] = {}
+        self._keys: Dict[Tuple[str, str], _LimitState] = {}
+        self._metrics: Dict[str, Dict[str, float]] = {}
+
+    def _limit(self, provider: str, name: str) -> float:
+        """Resolve a limit for a provider (override first, then default)."""
+        return self.overrides.get(provider, {}).get(name, self.defaults.get(name, 0))
+
+    def _provider_state(self, provider: str) -> _LimitState:
+        """Get or create the provider-wide state."""
+        if provider not in self._providers:
+            self._providers[provider] = _LimitState(int(self._limit(provider, "max_concurrency")))
+        return self._providers[provider]
+
+    def _key_state(self, provider: str, api_key: str) -> _LimitState:
+        """Get or create the state for one API key of a provider."""
+        key = (provider, hash_api_key(api_key))
+        if key not in self._keys:
+            self._keys[key] = _LimitState(
+                int(self._limit(provider, "key_max_concurrency")),
+                self._limit(provider, "requests_per_minute"),
+                self._limit(provider, "tokens_per_minute")
+            )
+        return self._keys[key]
+
+    def _provider_metrics(self, provider: str) -> Dict[str, float]:
+        """Get or create the counters for a provider."""
+        if provider not in self._metrics:
+            self._metrics[provider] = {
+                "in_flight": 0, "queued": 0, "max_queued": 0, "acquired": 0,
+                "total_wait_ms": 0.0, "max_wait_ms": 0.0,
+                "rejected": 0, "throttled": 0, "retries": 0
+            }
+        return self._metrics[provider]
+
+    @asynccontextmanager
+    async def slot(self, provider: str, api_key: str, estimated_tokens: int = 1):
+        """
+        Hold a request slot for the duration of a provider call.
+
+        Args:
+            provider: Provider name (ModelProvider.name)
+            api_key: API key the call uses
+            estimated_tokens: Input tokens charged against the tokens/min bucket
+        """
+        provider_state = self._provider_state(provider)
+        key_state = self._key_state(provider, api_key)
+        metrics = self._provider_metrics(provider)
+        started = time.monotonic()
+        deadline = started + self.max_wait_seconds
+        acquired = []
+
+        metrics["queued"] += 1
+        metrics["max_queued"] = max(metrics["max_queued"], metrics["queued"])
+        try:
+            # Pace to the per-key quotas (and any Retry-After cooldown) before taking a slot
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    key_state.cooldown_until - now,
+                    key_state.requests.wait_time(1),
+                    key_state.tokens.wait_time(estimated_tokens)
+                )
+                if wait <= 0:
+                    key_state.requests.consume(1)
+                    key_state.tokens.consume(estimated_tokens)
+                    break
+                if now + wait > deadline:
+                    metrics["rejected"] += 1
+                    raise RateLimitTimeout(provider, now - started)
+                await asyncio.sleep(wait)
+
+            for state in (key_state, provider_state):
+                if state.semaphore is None:
+                    continue
+                try:
+                    await asyncio.wait_for(state.semaphore.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    metrics["rejected"] += 1
+                    raise RateLimitTimeout(provider, time.monotonic() - started)
+                acquired.append(state.semaphore)
+        except BaseException:
+            metrics["queued"] -= 1
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+
+        waited_ms = (time.monotonic() - started) * 1000
+        metrics["queued"] -= 1
+        metrics["in_flight"] += 1
+        metrics["acquired"] += 1
+        metrics["total_wait_ms"] += waited_ms
+        metrics["max_wait_ms"] = max(metrics["max_wait_ms"], waited_ms)
+        try:
+            yield
+        finally:
+            metrics["in_flight"] -= 1
+            for semaphore in acquired:
+                semaphore.release()
+
+    def _backoff_delay(self, error: ProviderAPIError, attempt: int) -> float:
+        """Delay before retrying a 429: Retry-After if given, else jittered exponential."""
+        if error.retry_after:
+            return error.retry_after
+        return min(self.max_wait_seconds, (2 ** attempt) * (0.5 + random.random()))
+
+    def _throttled(self, provider: str, api_key: str, error: ProviderAPIError, attempt: int) -> Optional[float]:
+        """Record a 429 and return the backoff delay, or None if the call should fail."""
+        metrics = self._provider_metrics(provider)
+        metrics["throttled"] += 1
+        delay = self._backoff_delay(error, attempt)
+        if attempt >= self.max_retries or delay > self.max_wait_seconds:
+            return None
+
+        # Make every caller on this key wait out the cooldown, not just this one
+        key_state = self._key_state(provider, api_key)
+        key_state.cooldown_until = max(key_state.cooldown_until, time.monotonic() + delay)
+        metrics["retries"] += 1
+        print(f"⏳ {provider} rate limited (429), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+        return delay
+
+    async def call(
+        self,
+        provider: str,
+        api_key: str,
+        estimated_tokens: int,
+        factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Run a non-streaming provider call inside a slot, retrying on 429.
+
+        Args:
+            provider: Provider name
+            api_key: API key the call uses
+            estimated_tokens: Input tokens charged against the tokens/min bucket
+            factory: Creates the awaitable that performs the call
+
+        Returns:
+            The provider response
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(provider, api_key, estimated_tokens):
+                    return await factory()
+            except ProviderAPIError as e:
+                if not e.is_rate_limited:
+                    raise
+                if self._throttled(provider, api_key, e, attempt) is None:
+                    raise
+                attempt += 1
+
+    async def stream(
+        self,
+        provider: str,
+        api_key: str,
+        estimated_tokens: int,
+        factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """
+        Run a streaming provider call inside a slot held until the stream ends.
+
+        A 429 is only retried before the first chunk; after that the error propagates.
+        """
+        attempt = 0
+        while True:
+            started_streaming = False
+            try:
+                async with self.slot(provider, api_key, estimated_tokens):
+                    async for chunk in factory():
+                        started_streaming = True
+                        yield chunk
+                return
+            except ProviderAPIError as e:
+                if started_streaming or not e.is_rate_limited:
+                    raise
+                if self._throttled(provider, api_key, e, attempt) is None:
+                    raise
+                attempt += 1
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return queue depth, wait time and throttling counters per provider."""
+        stats = {}
+        for provider, metrics in self._metrics.items():
+            stats[provider] = {
+                **{name: round(value, 1) if isinstance(value, float) else value for name, value in metrics.items()},
+                "avg_wait_ms": round(metrics["total_wait_ms"] / metrics["acquired"], 1) if metrics["acquired"] else 0.0,
+                "max_concurrency": self._limit(provider, "max_concurrency"),
+                "key_max_concurrency": self._limit(provider, "key_max_concurrency"),
+                "requests_per_minute": self._limit(provider, "requests_per_minute"),
+                "tokens_per_minute": self._limit(provider, "tokens_per_minute")
+            }
+        return stats
+
+
+# Singleton instance
+_settings = get_settings()
+rate_limiter = RateLimiter(
+    defaults={
+        "max_concurrency": _settings.provider_max_concurrency,
+        "key_max_concurrency": _settings.provider_key_max_concurrency,
+        "requests_per_minute": _settings.provider_requests_per_minute,
+        "tokens_per_minute": _settings.provider_tokens_per_minute
+    },
+    overrides=_settings.provider_limits,
+    max_wait_seconds=_settings.rate_limit_max_wait_seconds,
+    max_retries=_settings.rate_limit_max_retries
+)
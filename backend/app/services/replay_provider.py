@@ -0,0 +1,216 @@
+"""Local replay provider - answers from recorded prompt/response pairs without any network access."""
+import asyncio
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+
+DEBUG_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'debug')
+
+# Legacy plain-text log written before the JSONL interaction logger
+LEGACY_LOG_PATH = os.path.join(DEBUG_DIR, 'ai_prompts_responses.txt')
+
+# Matches one prompt+response entry written by AIService._log_ai_interaction
+_LOG_ENTRY_PATTERN = re.compile(
+    r'# AI PROMPT \[(?P<ts>[^\]]+)\]\n(?P<prompt>.*?)\n# END PROMPT \[(?P=ts)\]\n\n'
+    r'# AI RESPONSE \[(?P=ts)\]\n(?P<response>.*?)\n# END RESPONSE \[(?P=ts)\]',
+    re.DOTALL
+)
+
+
+def _digest(text: str) -> str:
+    """Hash prompt text for lookup."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _question_of(prompt: str) -> str:
+    """Return the trailing user question of a prompt (falls back to the whole prompt)."""
+    marker = "User Question: "
+    index = prompt.rfind(marker)
+    return prompt[index + len(marker):].strip() if index != -1 else prompt.strip()
+
+
+def parse_recorded_interactions(log_text: str) -> Dict[str, str]:
+    """
+    Parse a debug interaction log into a {prompt: response} mapping.
+
+    Args:
+        log_text: Contents of debug/ai_prompts_responses.txt
+
+    Returns:
+        Dictionary of recorded prompt -> response (latest recording wins)
+    """
+    recordings = {}
+    for match in _LOG_ENTRY_PATTERN.finditer(log_text):
+        recordings[match.group('prompt')] = match.group('response')
+    return recordings
+
+
+def parse_jsonl_interactions(lines) -> Dict[str, str]:
+    """
+    Parse JSONL interaction records (see interaction_logger) into a {prompt: response} mapping.
+
+    Args:
+        lines: Iterable of JSON lines
+
+    Returns:
+        Dictionary of recorded prompt -> response for successful calls that kept their text
+    """
+    recordings = {}
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status", "ok") == "ok" and record.get("prompt") and record.get("response"):
+            recordings[record["prompt"]] = record["response"]
+    return recordings
+
+
+def _default_log_paths() -> List[str]:
+    """Legacy text log, rotated JSONL logs (oldest first), then the active JSONL log."""
+    rotated = sorted(glob.glob(os.path.join(DEBUG_DIR, 'ai_interactions-*.jsonl*')))
+    return [LEGACY_LOG_PATH] + rotated + [os.path.join(DEBUG_DIR, 'ai_interactions.jsonl')]
+
+
+def _read_recordings(path: str) -> Dict[str, str]:
+    """Read one log file in either format."""
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return parse_jsonl_interactions(f)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            return parse_jsonl_interactions(f)
+        return parse_recorded_interactions(f.read())
+
+
+class ReplayProvider:
+    """
+    Offline provider for the `local:` and `replay:` model families.
+
+    Looks up the exact prompt in the recorded interactions, then the trailing
+    user question, and finally falls back to a small synthetic responder so the
+    full ask/agent pipeline can still run end to end. Latency and streaming rate
+    are configurable to mimic a real provider during load tests.
+    """
+
+    def __init__(
+        self,
+        log_path: Optional[str] = None,
+        latency_ms: int = 0,
+        tokens_per_second: float = 0
+    ):
+        """Initialize the replay provider (recordings are loaded lazily)."""
+        self.log_path = log_path
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self._by_prompt: Optional[Dict[str, str]] = None
+        self._by_question: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        """Load and index the recordings on first use."""
+        if self._by_prompt is not None:
+            return
+
+        recordings = {}
+        # Later files win, so the newest recording of a prompt is replayed
+        for path in [self.log_path] if self.log_path else _default_log_paths():
+            try:
+                if os.path.exists(path):
+                    recordings.update(_read_recordings(path))
+            except Exception as e:
+                print(f"⚠️ Warning: Failed to load replay recordings from {path}: {str(e)}")
+
+        self._by_prompt = {_digest(prompt): response for prompt, response in recordings.items()}
+        self._by_question = {_digest(_question_of(prompt)): response for prompt, response in recordings.items()}
+        print(f"🔁 Replay provider loaded {len(self._by_prompt)} recorded interaction(s)")
+
+    def lookup(self, prompt: str) -> Tuple[str, bool]:
+        """Return (response, was_recorded) for a prompt."""
+        self._load()
+
+        response = self._by_prompt.get(_digest(prompt))
+        if response is None:
+            response = self._by_question.get(_digest(_question_of(prompt)))
+
+        if response is not None:
+            self.hits += 1
+            return response, True
+
+        self.misses += 1
+        return self._synthesize(prompt), False
+
+    def _synthesize(self, prompt: str) -> str:
+        """Produce a plausible response for prompts that were never recorded."""
+        if "COMPLETION DECISION" in prompt or "Multi-Step Analysis" in prompt:
+            return "QUERY_COMPLETE"
+        if '"should_chart"' in prompt:
+            return '{"should_chart": false}'
+
+        table_match = re.search(r'^Table: (\w+)$', prompt, re.MULTILINE)
+        if table_match and "User Question:" in prompt and "Based on the" not in _question_of(prompt):
+            return f"Here are the first rows of the table.\n\n```sql\nSELECT * FROM {table_match.group(1)} LIMIT 10\n```"
+
+        return "This is a locally generated response from the replay provider."
+
+    async def generate(
+        self,
+        query: str,
+        model: str,
+        api_key: str,
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None
+    ) -> str:
+        """Return the recorded response after the configured latency."""
+        # Recordings hold the full prompt (system prefix followed by the per-turn prompt)
+        response, _ = self.lookup(f"{system_prompt or ''}{query}")
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return response
+
+    async def generate_stream(
+        self,
+        query: str,
+        model: str,
+        api_key: str,
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None,
+        system_prompt: Optional[str] = None
+    ):
+        """Stream the recorded response token by token at the configured rate."""
+        # Recordings hold the full prompt (system prefix followed by the per-turn prompt)
+        response, _ = self.lookup(f"{system_prompt or ''}{query}")
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        delay = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        for token in re.findall(r'\S+\s*|\s+', response):
+            if delay:
+                await asyncio.sleep(delay)
+            yield token
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return lookup counters."""
+        return {
+            "recordings": len(self._by_prompt or {}),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+replay_provider = ReplayProvider(
+    log_path=_settings.replay_log_path,
+    latency_ms=_settings.replay_latency_ms,
+    tokens_per_second=_settings.replay_tokens_per_second
+)
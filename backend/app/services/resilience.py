@@ -0,0 +1,297 @@
+"""Timeouts, retries with jittered backoff and per-provider circuit breakers for AI calls."""
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from app.config import get_settings
+from app.services.provider_clients import ProviderAPIError
+
+
+# Per-stage (first_token, total) timeouts in seconds; PROVIDER_TIMEOUTS overrides them.
+# Stages: sql (main answer), next_step (multi-step decision), summary (final answer
+# stream), chart (chart decision), enhance, autocomplete, default (everything else).
+DEFAULT_STAGE_TIMEOUTS: Dict[str, Dict[str, float]] = {
+    "default": {"first_token": 60, "total": 180},
+    "sql": {"first_token": 60, "total": 180},
+    "next_step": {"first_token": 45, "total": 90},
+    "summary": {"first_token": 45, "total": 180},
+    "chart": {"first_token": 30, "total": 60},
+    "enhance": {"first_token": 20, "total": 45},
+    "autocomplete": {"first_token": 8, "total": 15}
+}
+
+# HTTP statuses worth retrying (529 = Anthropic "overloaded")
+RETRYABLE_STATUS_CODES = {408, 500, 502, 503, 504, 529}
+
+
+class ProviderTimeoutError(Exception):
+    """Raised when a provider call exceeds its stage timeout."""
+
+    def __init__(self, provider: str, stage: str, kind: str, seconds: float):
+        """Describe which timeout fired."""
+        super().__init__(f"{provider} did not respond in time ({kind} timeout of {seconds:g}s for {stage})")
+        self.provider = provider
+        self.stage = stage
+        self.kind = kind
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+    def __init__(self, provider: str, retry_in: float):
+        """Describe the open circuit."""
+        super().__init__(
+            f"{provider} is temporarily unavailable after repeated failures. Retrying automatically in {retry_in:.0f}s."
+        )
+        self.provider = provider
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether an error is a provider outage symptom (timeout, connection failure, 5xx)."""
+    if isinstance(error, ProviderTimeoutError):
+        return True
+    if isinstance(error, ProviderAPIError):
+        if error.status_code in RETRYABLE_STATUS_CODES:
+            return True
+        cause_name = type(error.__cause__).__name__ if error.__cause__ else ""
+        return "Connection" in cause_name or "Timeout" in cause_name or cause_name == "ServiceUnavailable"
+    return False
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive transient failures.
+
+    While open every call fails fast. After `reset_seconds` one probe call is let
+    through (half-open); its success closes the circuit, its failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30):
+        """Start closed."""
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.total_failures = 0
+        self.total_rejected = 0
+        self.times_opened = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not reach the provider."""
+        if self.state == "closed" or not self.failure_threshold:
+            return
+
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == "open" and elapsed >= self.reset_seconds:
+            self.state = "half_open"
+            self.probe_in_flight = False
+
+        if self.state == "half_open" and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return
+
+        self.total_rejected += 1
+        raise CircuitOpenError(self.name, max(0.0, self.reset_seconds - elapsed))
+
+    def record_success(self):
+        """Close the circuit after a successful call."""
+        if self.state != "closed":
+            print(f"✅ Circuit for {self.name} closed again")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def release_probe(self):
+        """Free a half-open probe that ended without a result (cancelled or abandoned)."""
+        self.probe_in_flight = False
+
+    def record_failure(self, error: Exception):
+        """Count a failure; only transient errors move the breaker."""
+        if not is_transient_error(error):
+            # A bad key or prompt says nothing about provider health; free a half-open probe
+            self.probe_in_flight = False
+            return
+
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        if self.state == "half_open" or (
+            self.failure_threshold and self.consecutive_failures >= self.failure_threshold
+        ):
+            if self.state != "open":
+                self.times_opened += 1
+                print(f"🔌 Circuit for {self.name} opened after {self.consecutive_failures} consecutive failure(s)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return breaker state and counters."""
+        retry_in = 0.0
+        if self.state == "open":
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_seconds": self.reset_seconds,
+            "retry_in_seconds": round(retry_in, 1),
+            "total_failures": self.total_failures,
+            "total_rejected": self.total_rejected,
+            "times_opened": self.times_opened
+        }
+
+
+class ProviderResilience:
+    """Apply stage timeouts, retries and circuit breakers around provider calls."""
+
+    def __init__(
+        self,
+        stage_timeouts: Optional[Dict[str, Dict[str, float]]] = None,
+        retry_attempts: int = 2,
+        retry_base_delay: float = 0.5,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30
+    ):
+        """
+        Initialize the policy.
+
+        Args:
+            stage_timeouts: Overrides merged over DEFAULT_STAGE_TIMEOUTS
+            retry_attempts: Extra attempts for transient failures of non-streaming calls
+            retry_base_delay: Base of the exponential backoff in seconds
+            failure_threshold: Consecutive transient failures that open a provider's circuit
+            reset_seconds: How long a circuit stays open before a probe call
+        """
+        self.stage_timeouts = {stage: dict(values) for stage, values in DEFAULT_STAGE_TIMEOUTS.items()}
+        for stage, values in (stage_timeouts or {}).items():
+            self.stage_timeouts.setdefault(stage, dict(self.stage_timeouts["default"])).update(values)
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        """Get or create the circuit breaker of a provider."""
+        if provider not in self._breakers:
+            self._breakers[provider] = CircuitBreaker(provider, self.failure_threshold, self.reset_seconds)
+        return self._breakers[provider]
+
+    def timeouts_for(self, stage: str) -> Dict[str, float]:
+        """Resolve the first-token and total timeouts of a stage."""
+        return self.stage_timeouts.get(stage, self.stage_timeouts["default"])
+
+    async def with_timeout(self, provider: str, stage: str, awaitable: Awaitable[Any]) -> Any:
+        """Await a single provider attempt under the stage's total timeout."""
+        seconds = self.timeouts_for(stage)["total"]
+        try:
+            return await asyncio.wait_for(awaitable, timeout=seconds)
+        except asyncio.TimeoutError:
+            raise ProviderTimeoutError(provider, stage, "total", seconds)
+
+    async def call(self, provider: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a non-streaming (idempotent) call with retries and the provider's breaker.
+
+        The attempt is expected to apply with_timeout() itself, inside any rate
+        limiter slot, so that queueing time does not count against the provider.
+
+        Args:
+            provider: Provider name
+            attempt: Creates the awaitable for one attempt
+
+        Returns:
+            The provider response
+        """
+        breaker = self.breaker(provider)
+        for attempt_number in range(self.retry_attempts + 1):
+            breaker.before_call()
+            try:
+                result = await attempt()
+            except Exception as e:
+                breaker.record_failure(e)
+                if not is_transient_error(e) or attempt_number >= self.retry_attempts or breaker.state == "open":
+                    raise
+                delay = self.retry_base_delay * (2 ** attempt_number) * (0.5 + random.random())
+                self.retries += 1
+                print(f"🔁 {provider} call failed ({str(e)[:80]}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: the call says nothing about provider health
+                breaker.release_probe()
+                raise
+            breaker.record_success()
+            return result
+
+    async def stream(self, provider: str, stage: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Run a streaming call under first-token and total timeouts (never retried).
+
+        Args:
+            provider: Provider name
+            stage: Pipeline stage (selects the timeouts)
+            factory: Creates the async chunk iterator
+
+        Yields:
+            Text chunks
+        """
+        breaker = self.breaker(provider)
+        breaker.before_call()
+
+        timeouts = self.timeouts_for(stage)
+        deadline = time.monotonic() + timeouts["total"]
+        iterator = factory().__aiter__()
+        first_chunk = True
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                kind, limit = ("first_token", timeouts["first_token"]) if first_chunk else ("total", timeouts["total"])
+                try:
+                    # Each step runs in the consumer's task (SDK streams tie cancel scopes to it)
+                    async with asyncio.timeout(min(limit, max(0.0, remaining))):
+                        chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise ProviderTimeoutError(provider, stage, kind, limit)
+                first_chunk = False
+                yield chunk
+        except Exception as e:
+            breaker.record_failure(e)
+            raise
+        except BaseException:
+            # Cancelled, or closed by the consumer before the end of the stream
+            breaker.release_probe()
+            raise
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        breaker.record_success()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return breaker states and retry counters."""
+        return {
+            "breakers": {provider: breaker.get_stats() for provider, breaker in self._breakers.items()},
+            "retries": self.retries,
+            "retry_attempts": self.retry_attempts,
+            "stage_timeouts": self.stage_timeouts
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+resilience = ProviderResilience(
+    stage_timeouts=_settings.provider_timeouts,
+    retry_attempts=_settings.provider_retry_attempts,
+    retry_base_delay=_settings.provider_retry_base_delay_seconds,
+    failure_threshold=_settings.circuit_breaker_failure_threshold,
+    reset_seconds=_settings.circuit_breaker_reset_seconds
+)
@@ -0,0 +1,253 @@
+"""Persistent LLM response cache backed by SQLite."""
+import asyncio
+import contextvars
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.config import get_settings
+
+
+# Per-request opt-out; set by the routes from AskRequest.bypass_cache
+_bypass_cache: contextvars.ContextVar[bool] = contextvars.ContextVar("bypass_llm_cache", default=False)
+
+
+def set_cache_bypass(bypass: bool):
+    """Skip (or re-enable) the response cache for the rest of the current request."""
+    _bypass_cache.set(bool(bypass))
+
+
+def history_digest(conversation_history: Optional[list]) -> str:
+    """Hash the part of the history that providers actually receive."""
+    if not conversation_history:
+        return ""
+    recent = [
+        {"role": msg.get("role"), "content": msg.get("content")}
+        for msg in conversation_history[-10:]
+    ]
+    return hashlib.sha256(json.dumps(recent, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache of provider responses keyed by model, full prompt, history and dataset version.
+
+    The dataset version is the per-table write counter kept by DatasetService, so
+    an INSERT/UPDATE/DELETE or re-upload of a table automatically invalidates every
+    cached answer that was built on it. Entries expire after a TTL and the least
+    recently used ones are evicted when the stored bytes exceed the budget.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        enabled: bool = False,
+        ttl_seconds: int = 86400,
+        max_bytes: int = 50 * 1024 * 1024
+    ):
+        """Initialize the cache (the SQLite file is opened on first use)."""
+        self.db_path = db_path
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bypassed = 0
+
+    def is_active(self) -> bool:
+        """Whether the cache should be consulted for the current request."""
+        if not self.enabled:
+            return False
+        if _bypass_cache.get():
+            self.bypassed += 1
+            return False
+        return True
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the cache database and create the table if needed (caller holds the lock)."""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access ON llm_responses(last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def make_key(
+        self,
+        model: str,
+        prompt: str,
+        conversation_history: Optional[list] = None,
+        table_names: Optional[List[str]] = None,
+        image_data_list: Optional[list] = None
+    ) -> str:
+        """
+        Build the cache key for a provider call.
+
+        Args:
+            model: Model name
+            prompt: Fully built prompt sent to the provider
+            conversation_history: Previous messages sent alongside the prompt
+            table_names: Dataset tables the prompt was built from
+            image_data_list: Attached images (identified by content digest)
+
+        Returns:
+            Hex digest identifying the request
+        """
+        dataset_version = ""
+        if table_names:
+            from app.services.dataset_service import get_dataset_service
+            versions = get_dataset_service().get_table_versions(sorted(table_names))
+            dataset_version = ",".join(f"{name}:{version}" for name, version in sorted(versions.items()))
+
+        images_digest = ""
+        if image_data_list:
+            images_digest = hashlib.sha256(
+                "".join(img.get("digest") or img.get("data", "") for img in image_data_list).encode("utf-8")
+            ).hexdigest()
+
+        material = "\x1f".join([model, prompt, history_digest(conversation_history), dataset_version, images_digest])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _get_sync(self, key: str) -> Optional[str]:
+        """Read an entry, dropping it if expired."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            response, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (key,))
+                conn.commit()
+                self.evictions += 1
+                return None
+
+            conn.execute("UPDATE llm_responses SET last_access = ? WHERE cache_key = ?", (now, key))
+            conn.commit()
+            return response
+
+    def _set_sync(self, key: str, model: str, response: str):
+        """Store an entry and enforce the TTL and byte budget."""
+        now = time.time()
+        size_bytes = len(response.encode("utf-8"))
+        if self.max_bytes and size_bytes > self.max_bytes:
+            return
+
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (cache_key, model, response, size_bytes, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size_bytes, now, now)
+            )
+            self.stores += 1
+
+            if self.ttl_seconds:
+                expired = conn.execute(
+                    "DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,)
+                ).rowcount
+                self.evictions += max(expired, 0)
+
+            if self.max_bytes:
+                total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM llm_responses").fetchone()[0]
+                if total > self.max_bytes:
+                    # Walk from least recently used until we are back under budget
+                    for victim_key, victim_size in conn.execute(
+                        "SELECT cache_key, size_bytes FROM llm_responses ORDER BY last_access ASC"
+                    ).fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (victim_key,))
+                        total -= victim_size
+                        self.evictions += 1
+
+            conn.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a cached response (SQLite I/O runs off the event loop)."""
+        try:
+            response = await asyncio.to_thread(self._get_sync, key)
+        except Exception as e:
+            print(f"⚠️ Warning: Response cache read failed: {str(e)}")
+            response = None
+
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def set(self, key: str, model: str, response: str):
+        """Store a response (empty responses are never cached)."""
+        if not response or not response.strip():
+            return
+        try:
+            await asyncio.to_thread(self._set_sync, key, model, response)
+        except Exception as e:
+            print(f"⚠️ Warning: Response cache write failed: {str(e)}")
+
+    def clear(self) -> int:
+        """Delete every cached response and return how many were removed."""
+        with self._lock:
+            conn = self._connection()
+            removed = conn.execute("DELETE FROM llm_responses").rowcount
+            conn.commit()
+            return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current cache size."""
+        entries, total_bytes = 0, 0
+        if self.enabled:
+            try:
+                with self._lock:
+                    entries, total_bytes = self._connection().execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_responses"
+                    ).fetchone()
+            except Exception as e:
+                print(f"⚠️ Warning: Failed to read response cache stats: {str(e)}")
+
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+response_cache = ResponseCache(
+    db_path=_settings.llm_cache_path,
+    enabled=_settings.llm_cache_enabled,
+    ttl_seconds=_settings.llm_cache_ttl_seconds,
+    max_bytes=_settings.llm_cache_max_bytes
+)
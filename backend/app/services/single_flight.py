@@ -0,0 +1,193 @@
+"""Single-flight coalescing of identical concurrent provider calls."""
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.services.provider_clients import hash_api_key
+from app.services.response_cache import history_digest
+
+
+class _StreamFlight:
+    """One in-flight stream whose chunks are replayed to every subscriber."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """
+    Share one provider call between concurrent identical requests.
+
+    The first caller for a key starts the call in its own task; callers that
+    arrive while it is running await the same result instead of hitting the
+    provider again. Streaming subscribers receive the full chunk sequence,
+    including chunks produced before they joined. Once a call finishes the key
+    is released, so later requests start fresh (the response cache covers those).
+    A call is cancelled only when every caller waiting on it has gone away.
+    """
+
+    def __init__(self):
+        """Initialize with no calls in flight."""
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.stream_calls = 0
+        self.stream_coalesced = 0
+
+    @staticmethod
+    def make_key(
+        model: str,
+        api_key: str,
+        prompt: str,
+        conversation_history: Optional[list] = None,
+        image_data_list: Optional[list] = None
+    ) -> str:
+        """
+        Identify a provider request.
+
+        The (hashed) API key is part of the identity: a shared call is made and
+        billed with one key, and its errors (e.g. a revoked key) are shared too,
+        so only requests of the same key may share it.
+
+        Args:
+            model: Model name
+            api_key: API key the call is made with
+            prompt: Fully built prompt
+            conversation_history: Previous messages sent alongside the prompt
+            image_data_list: Attached images
+
+        Returns:
+            Hex digest of the request
+        """
+        images = "".join(img.get("digest") or img.get("data", "") for img in image_data_list or [])
+        material = "\x1f".join([model, hash_api_key(api_key), prompt, history_digest(conversation_history), images])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run factory() once for all concurrent callers with the same key.
+
+        Args:
+            key: Request identity (see make_key)
+            factory: Creates the awaitable that performs the call
+
+        Returns:
+            The shared result (exceptions are shared too)
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _: (self._calls.pop(key, None), self._waiters.pop(key, None)))
+
+        # Shield so one cancelled waiter (e.g. a disconnected client) does not
+        # cancel the call for everyone else
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if key in self._waiters:
+                self._waiters[key] -= 1
+                if self._waiters[key] <= 0 and not task.done():
+                    task.cancel()
+            raise
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Subscribe to a shared stream, starting it if nobody else has.
+
+        Args:
+            key: Request identity (see make_key)
+            factory: Creates the provider's async chunk iterator
+
+        Yields:
+            Every chunk of the shared stream, in order
+        """
+        flight = self._streams.get(key)
+        if flight is not None:
+            self.stream_coalesced += 1
+        else:
+            self.stream_calls += 1
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, factory))
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with flight.condition:
+                    await flight.condition.wait_for(lambda: index < len(flight.chunks) or flight.done)
+                    pending = flight.chunks[index:]
+                    finished = flight.done
+
+                for chunk in pending:
+                    yield chunk
+                index += len(pending)
+
+                if finished and index >= len(flight.chunks):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers <= 0 and not flight.done and flight.task is not None:
+                # Nobody is listening any more - stop paying for the stream. Released
+                # right away, so a caller arriving now starts a new stream instead of
+                # joining this truncated one
+                self._release(key, flight)
+                flight.task.cancel()
+
+    async def _pump(self, key: str, flight: _StreamFlight, factory: Callable[[], AsyncIterator[str]]):
+        """Drain the provider stream into the shared buffer."""
+        iterator = factory()
+        try:
+            async for chunk in iterator:
+                async with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+        except Exception as e:
+            flight.error = e
+        except asyncio.CancelledError as e:
+            # Never let the chunks so far pass as a complete response
+            flight.error = e
+            raise
+        finally:
+            self._release(key, flight)
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            async with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+    def _release(self, key: str, flight: _StreamFlight):
+        """Stop offering a stream to new subscribers (a newer stream may already use the key)."""
+        if self._streams.get(key) is flight:
+            del self._streams[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Return coalescing counters."""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "stream_calls": self.stream_calls,
+            "stream_coalesced": self.stream_coalesced,
+            "in_flight": len(self._calls),
+            "streams_in_flight": len(self._streams)
+        }
+
+
+# Singleton instance
+single_flight = SingleFlight()
@@ -0,0 +1,127 @@
+"""Speculative SQL execution: run a query as soon as the model has written it."""
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import get_settings
+from app.services.dataset_executor import dataset_executor
+from app.services.dataset_service import get_dataset_service
+from app.services.sql_executor import extract_sql_from_response
+
+
+class SpeculativeQuery:
+    """
+    Speculation for one model response.
+
+    feed() is called with the response text received so far. Once the first
+    SQL block is closed, the query is validated and executed in a worker
+    thread while the model keeps writing its explanation. take() then hands
+    the result to the executor if the final response's query is the same one.
+    Only SELECT queries are ever run (execute_sql_query rejects anything else).
+    """
+
+    def __init__(self, executor: "SpeculativeSqlExecutor"):
+        self._executor = executor
+        self.sql: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._started_at = 0.0
+
+    def feed(self, text: str):
+        """Start the query once the response so far contains a complete SQL block."""
+        if self.sql is not None or text.count("```") < 2:
+            return
+        sql = extract_sql_from_response(text)
+        if not sql or not sql.upper().startswith("SELECT"):
+            return
+
+        self.sql = sql
+        self._started_at = time.perf_counter()
+        self._task = asyncio.get_running_loop().create_task(dataset_executor.read(self._run, sql))
+        self._executor.started += 1
+        print("🔮 Speculatively executing SQL while the response streams")
+
+    @staticmethod
+    def _run(sql: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Validate and execute the query (worker thread)."""
+        dataset_service = get_dataset_service()
+        if not dataset_service.validate_query(sql):
+            return None
+        started = time.time()
+        result = dataset_service.execute_sql_query(sql)
+        return result, int((time.time() - started) * 1000)
+
+    async def take(self, sql: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """
+        Claim the speculative result for the query the pipeline is about to run.
+
+        Args:
+            sql: Query extracted from the complete response
+
+        Returns:
+            (result, execution_time_ms) if the same query was already started
+            and passed validation, else None (the caller executes normally)
+        """
+        if self._task is None:
+            return None
+        if sql != self.sql:
+            self._executor.mismatched += 1
+            self.cancel()
+            return None
+
+        head_start_ms = (time.perf_counter() - self._started_at) * 1000
+        try:
+            outcome = await self._task
+        except Exception as e:
+            print(f"⚠️ Warning: Speculative SQL execution failed: {str(e)}")
+            return None
+        if outcome is None:
+            self._executor.invalid += 1
+            return None
+
+        self._executor.hits += 1
+        self._executor.saved_ms += min(head_start_ms, outcome[1])
+        return outcome
+
+
+    def cancel(self):
+        """Stop waiting for a result nobody will take (a query already running finishes in its worker)."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+class SpeculativeSqlExecutor:
+    """Create speculations for SQL-generating model calls and count how they pay off."""
+
+    def __init__(self, enabled: bool = True):
+        """
+        Initialize the executor.
+
+        Args:
+            enabled: If False begin() returns None and queries only run after the response is complete
+        """
+        self.enabled = enabled
+        self.started = 0
+        self.hits = 0
+        self.mismatched = 0
+        self.invalid = 0
+        self.saved_ms = 0.0
+
+    def begin(self) -> Optional[SpeculativeQuery]:
+        """Start tracking a new model response (None when speculation is disabled)."""
+        return SpeculativeQuery(self) if self.enabled else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return speculation counters."""
+        return {
+            "enabled": self.enabled,
+            "started": self.started,
+            "hits": self.hits,
+            "mismatched": self.mismatched,
+            "invalid": self.invalid,
+            "saved_ms": round(self.saved_ms)
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+speculative_sql = SpeculativeSqlExecutor(enabled=_settings.speculative_sql_enabled)
@@ -0,0 +1,144 @@
+"""Offline evaluation of few-shot SQL examples.
+
+Replays the newest stored example questions of each table through the Ask
+mode pipeline twice, without and with retrieved examples, and compares failed
+queries and queries per answered question. The replayed questions themselves
+are held out of retrieval, and nothing the runs produce is kept.
+
+Usage:
+    python -m app.services.sql_example_eval --model gemini-2.5-flash --api-key KEY --per-table 10
+
+Each question costs two full Ask mode runs (SQL, next-step, chart and
+conclusion calls); `local:` replay models evaluate without network access.
+"""
+import argparse
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+from app import crud, schemas
+from app.crud.history import delete_execution_history, get_sql_example_tables, get_sql_examples
+from app.services.ask_mode_service import process_ask_mode_stream
+from app.services.response_cache import set_cache_bypass
+from app.services.sql_examples import referenced_tables, sql_examples
+
+
+def select_questions(db, per_table: int = 10) -> List[Tuple[str, List[str]]]:
+    """
+    Pick the evaluation questions: the newest examples of each table.
+
+    Args:
+        db: Database session
+        per_table: Questions taken per table
+
+    Returns:
+        (question, tables its stored query reads) pairs, each question once
+    """
+    questions: Dict[str, List[str]] = {}
+    for table_name in sorted(get_sql_example_tables(db)):
+        examples = get_sql_examples(db, table_name)
+        if len(examples) < 2:
+            # Nothing left to retrieve once the question is held out
+            continue
+        for example in examples[-per_table:]:
+            questions.setdefault(example.question, sorted(referenced_tables(example.sql_query)))
+    return list(questions.items())
+
+
+async def run_question(db, question: str, table_names: List[str], model: str, api_key: str) -> Dict[str, Any]:
+    """
+    Answer a question in a throwaway conversation and count its queries.
+
+    Returns:
+        Queries executed, failed queries and whether a query returned rows
+    """
+    conversation = crud.create_conversation(db, title="SQL example evaluation", mode="ask")
+    user_message = crud.create_message(db=db, conversation_id=conversation.id, role="user", content=question)
+    request_data = schemas.AskRequest(query=question, model=model, selected_tables=table_names)
+
+    outcome = {"queries": 0, "failed": 0, "answered": False}
+    try:
+        async for event in process_ask_mode_stream(request_data, conversation.id, user_message.id, model, api_key, db):
+            if not event.startswith("data: "):
+                continue
+            data = json.loads(event[len("data: "):])
+            if data.get("type") != "sql_result":
+                continue
+            outcome["queries"] += 1
+            if not data["content"].get("success"):
+                outcome["failed"] += 1
+            elif data["content"].get("row_count", 0) > 0:
+                outcome["answered"] = True
+    except Exception as e:
+        print(f"⚠️ Warning: Evaluation of \"{question}\" failed: {str(e)}")
+        outcome["error"] = str(e)
+    finally:
+        delete_execution_history(db, conversation.id)
+        crud.delete_conversation(db, conversation.id)
+    return outcome
+
+
+def _summarize(outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate the outcomes of one evaluation pass."""
+    answered = [outcome for outcome in outcomes if outcome["answered"]]
+    failed = sum(outcome["failed"] for outcome in outcomes)
+    return {
+        "questions": len(outcomes),
+        "answered": len(answered),
+        "errors": sum(1 for outcome in outcomes if "error" in outcome),
+        "failed_queries": failed,
+        "failed_queries_per_question": round(failed / len(outcomes), 3) if outcomes else 0,
+        "queries_per_answered_question": (
+            round(sum(outcome["queries"] for outcome in answered) / len(answered), 3) if answered else 0
+        )
+    }
+
+
+async def evaluate(db, model: str, api_key: str, per_table: int = 10) -> Dict[str, Any]:
+    """
+    Compare the Ask mode pipeline without and with few-shot SQL examples.
+
+    Args:
+        db: Database session
+        model: Model answering the questions
+        api_key: API key for the model
+        per_table: Questions taken per table
+
+    Returns:
+        Report with the metrics of both passes
+    """
+    questions = select_questions(db, per_table)
+    if not questions:
+        return {"questions": 0, "reason": "no table has at least 2 stored SQL examples"}
+
+    enabled, recording, holdout = sql_examples.enabled, sql_examples.recording, sql_examples.holdout
+    sql_examples.recording = False
+    sql_examples.holdout = {question for question, _ in questions}
+    set_cache_bypass(True)
+    report: Dict[str, Any] = {"model": model, "questions": len(questions)}
+    try:
+        for name, use_examples in (("without_examples", False), ("with_examples", True)):
+            sql_examples.enabled = use_examples
+            outcomes = []
+            for i, (question, table_names) in enumerate(questions, 1):
+                print(f"🧪 [{name} {i}/{len(questions)}] {question}")
+                outcomes.append(await run_question(db, question, table_names, model, api_key))
+            report[name] = _summarize(outcomes)
+    finally:
+        sql_examples.enabled, sql_examples.recording, sql_examples.holdout = enabled, recording, holdout
+        set_cache_bypass(False)
+    return report
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Evaluate few-shot SQL examples on stored questions")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--api-key", default=os.environ.get("ASKQL_EVAL_API_KEY", ""))
+    parser.add_argument("--per-table", type=int, default=10)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        print(json.dumps(asyncio.run(evaluate(db, args.model, args.api_key, args.per_table)), indent=2))
@@ -0,0 +1,276 @@
+"""Few-shot SQL examples: past questions and the SQL that answered them, retrieved per dataset with BM25."""
+import asyncio
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Set, Tuple
+
+from app.config import get_settings
+
+
+_MENTION_PATTERN = re.compile(r'@\S+')
+_TOKEN_PATTERN = re.compile(r'[a-z0-9_]+')
+# Words that say nothing about which query answers a question
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from give i in is it list me my of on or per please "
+    "show tell the their them there these this to was what which with".split()
+)
+# Tables a query reads (quoted or bare names after FROM/JOIN)
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+[`"\[]?([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of a question (@dataset mentions and stopwords dropped)."""
+    return [
+        token for token in _TOKEN_PATTERN.findall(_MENTION_PATTERN.sub(" ", text).lower())
+        if token not in _STOPWORDS
+    ]
+
+
+def referenced_tables(sql: str) -> Set[str]:
+    """Names of the tables a SQL query reads."""
+    return {name.lower() for name in _TABLE_PATTERN.findall(sql)}
+
+
+class SqlExample:
+    """A past question and the SQL that answered it."""
+
+    __slots__ = ("id", "question", "sql", "row_count", "tables", "tokens")
+
+    def __init__(self, id: int, question: str, sql: str, row_count: int = 0):
+        self.id = id
+        self.question = question
+        self.sql = sql
+        self.row_count = row_count
+        self.tables = referenced_tables(sql)
+        self.tokens = Counter(tokenize(question))
+
+
+class _Bm25Index:
+    """Okapi BM25 over the questions of one table's examples."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.examples: List[SqlExample] = []
+        self._document_frequency: Counter = Counter()
+        self._total_length = 0
+
+    def add(self, example: SqlExample):
+        """Index an example."""
+        self.examples.append(example)
+        self._document_frequency.update(example.tokens.keys())
+        self._total_length += sum(example.tokens.values())
+
+    def search(self, tokens: List[str], limit: int, accept) -> List[Tuple[float, SqlExample]]:
+        """Return up to `limit` accepted examples sharing terms with the query, best first."""
+        # Snapshot: record() may add examples from the event loop while this runs in a worker thread
+        examples = list(self.examples)
+        if not examples or not tokens:
+            return []
+        total = len(examples)
+        average_length = self._total_length / total or 1
+        query_terms = set(tokens)
+        idf = {
+            term: math.log(1 + (total - self._document_frequency[term] + 0.5) / (self._document_frequency[term] + 0.5))
+            for term in query_terms if self._document_frequency[term]
+        }
+
+        scored = []
+        for example in examples:
+            length = sum(example.tokens.values())
+            score = 0.0
+            for term, weight in idf.items():
+                frequency = example.tokens.get(term, 0)
+                if frequency:
+                    score += weight * frequency * (self.k1 + 1) / (
+                        frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                    )
+            if score > 0 and accept(example):
+                scored.append((score, example))
+        scored.sort(key=lambda item: (-item[0], -item[1].id))
+        return scored[:limit]
+
+
+def format_sql_examples_for_prompt(examples: List[SqlExample]) -> str:
+    """Format retrieved examples for inclusion in AI prompts."""
+    if not examples:
+        return ""
+    entries = [f"{i}. \"{example.question}\" → `{example.sql}`" for i, example in enumerate(examples, 1)]
+    return (
+        f"\n\n**SIMILAR PAST QUESTIONS ON THESE TABLES (answered by one successful query each):**\n"
+        + "\n".join(entries) + "\n"
+    )
+
+
+class SqlExampleIndex:
+    """
+    Retrieve past (question, successful SQL) pairs similar to a new question.
+
+    Questions answered in a single step by a successful query that returned
+    rows are stored per table the query reads (see record()), independently of
+    the per-conversation SQL history, which keeps only 20 rows. Each table's
+    examples are indexed with BM25 on first use. Only examples whose query
+    reads nothing but the currently selected tables are retrieved, so the SQL
+    shown is valid for the schemas in the prompt.
+
+    Loading and scoring run in a worker thread (see retrieve()) on their own
+    database session, never on the request's session or the event loop.
+    """
+
+    def __init__(self, enabled: bool = True, top_k: int = 3, max_per_dataset: int = 500):
+        """
+        Initialize the index.
+
+        Args:
+            enabled: If False retrieve() returns nothing (examples are still recorded)
+            top_k: Examples added to a prompt
+            max_per_dataset: Examples kept per table (newest)
+        """
+        self.enabled = enabled
+        self.top_k = top_k
+        self.max_per_dataset = max_per_dataset
+        self.recording = True
+        # Questions whose examples are never retrieved (held out by an evaluation run)
+        self.holdout: Set[str] = set()
+        self._indexes: Dict[str, _Bm25Index] = {}
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.lookups = 0
+        self.lookups_with_examples = 0
+        self.examples_served = 0
+
+    def _index_for(self, table_name: str) -> _Bm25Index:
+        """Get a table's index, loading its stored examples on first use."""
+        with self._lock:
+            index = self._indexes.get(table_name)
+        if index is not None:
+            return index
+
+        from app.crud.history import get_sql_examples
+        from app.database import SessionLocal
+
+        index = _Bm25Index()
+        db = SessionLocal()
+        try:
+            for record in get_sql_examples(db, table_name):
+                index.add(SqlExample(record.id, record.question, record.sql_query, record.row_count))
+        finally:
+            db.close()
+        with self._lock:
+            return self._indexes.setdefault(table_name, index)
+
+    def record(self, db, question: str, sql: str, row_count: int = 0):
+        """
+        Store a question answered by one successful query.
+
+        Args:
+            db: Database session
+            question: The user's question
+            sql: The query that answered it
+            row_count: Rows the query returned
+        """
+        if not self.recording or not question.strip() or not sql.upper().startswith("SELECT"):
+            return
+
+        from app.crud.history import create_sql_example
+
+        try:
+            for table_name in sorted(referenced_tables(sql)):
+                record = create_sql_example(db, table_name, question, sql, row_count, keep_count=self.max_per_dataset)
+                if record is None:
+                    continue
+                self.recorded += 1
+                with self._lock:
+                    index = self._indexes.get(table_name)
+                    if index is not None and len(index.examples) >= self.max_per_dataset:
+                        # Pruned in the database: reload on next use
+                        del self._indexes[table_name]
+                    elif index is not None:
+                        index.add(SqlExample(record.id, question, sql, row_count))
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to store SQL example: {str(e)}")
+
+    def _retrieve_sync(self, question: str, selected: Set[str]) -> List[SqlExample]:
+        """Search the selected tables' indexes (loading them as needed)."""
+        tokens = tokenize(question)
+
+        def accept(example: SqlExample) -> bool:
+            return example.question not in self.holdout and example.tables <= selected
+
+        candidates = []
+        for table_name in sorted(selected):
+            candidates.extend(self._index_for(table_name).search(tokens, self.top_k, accept))
+
+        examples = []
+        seen: Set[Tuple[str, str]] = set()
+        for _, example in sorted(candidates, key=lambda item: (-item[0], -item[1].id)):
+            key = (example.question, example.sql)
+            if key not in seen:
+                seen.add(key)
+                examples.append(example)
+        return examples[:self.top_k]
+
+    async def retrieve(self, question: str, table_names: List[str]) -> List[SqlExample]:
+        """
+        Find the stored examples most similar to a question (off the event loop).
+
+        Args:
+            question: The user's question
+            table_names: Selected tables
+
+        Returns:
+            Up to top_k examples, most similar first
+        """
+        if not self.enabled or not table_names or self.top_k <= 0:
+            return []
+        self.lookups += 1
+
+        try:
+            examples = await asyncio.to_thread(
+                self._retrieve_sync, question, {name.lower() for name in table_names}
+            )
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to retrieve SQL examples: {str(e)}")
+            return []
+
+        if examples:
+            self.lookups_with_examples += 1
+            self.examples_served += len(examples)
+        return examples
+
+    def forget(self, db, table_name: str):
+        """Delete a table's examples (the dataset was deleted)."""
+        from app.crud.history import delete_sql_examples
+
+        table_name = table_name.lower()
+        try:
+            delete_sql_examples(db, table_name)
+        except Exception as e:
+            print(f"⚠️ Warning: Failed to delete SQL examples of {table_name}: {str(e)}")
+        with self._lock:
+            self._indexes.pop(table_name.lower(), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return index sizes and retrieval counters."""
+        with self._lock:
+            indexed = {name: len(index.examples) for name, index in self._indexes.items()}
+        return {
+            "enabled": self.enabled,
+            "top_k": self.top_k,
+            "indexed_tables": indexed,
+            "recorded": self.recorded,
+            "lookups": self.lookups,
+            "lookups_with_examples": self.lookups_with_examples,
+            "examples_served": self.examples_served
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+sql_examples = SqlExampleIndex(
+    enabled=_settings.sql_examples_enabled,
+    top_k=_settings.sql_examples_top_k,
+    max_per_dataset=_settings.sql_examples_max_per_dataset
+)
@@ -3,6 +3,7 @@ import re
 import json
 from typing import Optional, Dict, Tuple
 from app.services.chart_generator import ask_ai_for_chart_config, structure_chart_data, format_chart_block
+from app.services.dataset_executor import dataset_executor
 
 
 def extract_sql_from_response(ai_response: str) -> Optional[str]:
@@ -167,7 +168,7 @@ async def process_ai_response_with_sql(
         return ai_response, None, None
     
     # Execute the query
-    result = dataset_service.execute_sql_query(sql_query)
+    result = await dataset_executor.read(dataset_service.execute_sql_query, sql_query)
     
     # Format the response with results (now async with chart generation)
     formatted_response = await format_query_result(
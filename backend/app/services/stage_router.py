@@ -0,0 +1,130 @@
+"""Per-stage model routing: send lightweight pipeline stages to a fast, cheap model."""
+import contextvars
+import statistics
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+
+# API keys of the user making the current request; set by the routes
+_request_api_keys: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_api_keys", default=None)
+
+
+def set_request_api_keys(user_api_keys: Optional[dict]):
+    """Make the user's configured API keys available to stage routing for this request."""
+    _request_api_keys.set(dict(user_api_keys or {}))
+
+
+class StageRouter:
+    """
+    Pick the model for each pipeline stage.
+
+    SQL generation and the final answer ("sql", "summary") always use the user's
+    model. Classification-style stages listed in the routing table ("chart",
+    "next_step", "autocomplete", "enhance", "conversation_summary") go to the first candidate model from
+    the user's own provider, otherwise to the first candidate whose provider the
+    user has a key for, otherwise stay on the user's model.
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, List[str]],
+        enabled: bool = True,
+        latency_window: int = 200,
+        slow_call_seconds: float = 30.0
+    ):
+        """
+        Initialize the router.
+
+        Args:
+            routes: Stage -> candidate models in order of preference
+            enabled: If False every stage uses the user's model
+            latency_window: Number of recent latencies kept per (stage, model)
+            slow_call_seconds: Calls taking at least this long are logged
+        """
+        self.routes = routes
+        self.enabled = enabled
+        self.latency_window = latency_window
+        self.slow_call_seconds = slow_call_seconds
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self.rerouted = 0
+
+    def resolve(self, stage: str, model: str, api_key: str) -> Tuple[str, str]:
+        """
+        Resolve the (model, api_key) to use for a stage.
+
+        Args:
+            stage: Pipeline stage
+            model: The user's chosen model
+            api_key: API key for the user's model
+
+        Returns:
+            (model, api_key) for this stage
+        """
+        candidates = self.routes.get(stage)
+        if not self.enabled or not candidates or model in candidates:
+            return model, api_key
+
+        from app.services.ai_service import ai_service
+
+        try:
+            user_provider = ai_service.get_provider(model)
+        except ValueError:
+            return model, api_key
+        if not user_provider.api_key_name:
+            # Keyless (local replay) models keep every stage offline
+            return model, api_key
+
+        user_api_keys = _request_api_keys.get() or {}
+        fallback = None
+        for candidate in candidates:
+            try:
+                provider = ai_service.get_provider(candidate)
+            except ValueError:
+                continue
+            if provider.name == user_provider.name:
+                self.rerouted += 1
+                return candidate, api_key
+            candidate_key = user_api_keys.get(provider.api_key_name) if provider.api_key_name else ""
+            if fallback is None and candidate_key:
+                fallback = (candidate, candidate_key)
+
+        if fallback:
+            self.rerouted += 1
+            return fallback
+        return model, api_key
+
+    def record_latency(self, stage: str, model: str, seconds: float):
+        """Record how long a stage took on a model (slow calls are logged)."""
+        samples = self._latencies.setdefault((stage, model), deque(maxlen=self.latency_window))
+        samples.append(seconds)
+        if seconds >= self.slow_call_seconds:
+            print(f"🐢 Slow stage '{stage}' on {model}: {seconds:.2f}s (median {statistics.median(samples):.2f}s over {len(samples)} call(s))")
+
+    def get_stats(self) -> Dict[str, object]:
+        """Return the routing table and per-stage latency summaries by model."""
+        stages: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (stage, model), samples in self._latencies.items():
+            ordered = sorted(samples)
+            stages.setdefault(stage, {})[model] = {
+                "calls": len(ordered),
+                "median_seconds": round(statistics.median(ordered), 3),
+                "p95_seconds": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "max_seconds": round(ordered[-1], 3)
+            }
+        return {
+            "enabled": self.enabled,
+            "routes": self.routes,
+            "rerouted": self.rerouted,
+            "latency": stages
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+stage_router = StageRouter(
+    routes=_settings.stage_model_routes,
+    enabled=_settings.stage_routing_enabled,
+    slow_call_seconds=_settings.stage_slow_call_seconds
+)
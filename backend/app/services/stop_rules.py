@@ -0,0 +1,157 @@
+"""Local stop rules for the multi-step loops: skip the next-step call when the question is answered."""
+import re
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from app.config import get_settings
+
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10
+}
+# Whole words only: "done" or "often" must not read as "one" or "ten"
+_NUMBER = r'\b(\d+|' + '|'.join(_NUMBER_WORDS) + r')\b'
+
+# "run 3 queries", "show me five different queries"
+_REQUESTED_COUNT_PATTERN = re.compile(_NUMBER + r'\s+(?:\w+\s+)?(?:queries|query|steps|analyses|operations)\b')
+
+# "top 5", "bottom 10", "first 3", "5 highest"
+_TOP_N_PATTERN = re.compile(r'\b(?:top|bottom|first|last)\s+' + _NUMBER + r'\b|\b' + _NUMBER + r'\s+(?:highest|lowest|largest|smallest|best|worst|most|least)\b')
+
+# Broad requests the model explores over several queries
+_EXPLORATORY_PATTERN = re.compile(
+    r'\b(analy[sz]e|analysis|explore|exploration|pattern|patterns|trend|trends|insight|insights|interesting|'
+    r'tell me about|overview|investigate|understand|why|explain|correlat\w*|anomal\w*|outlier\w*|compare|comparison|predict\w*|forecast\w*)\b'
+)
+
+# Requests with several parts, or whose answer depends on an intermediate result
+_MULTI_PART_PATTERN = re.compile(r'\b(then|also|after that|followed by|as well as|and what|and how|and which|based on)\b')
+
+# Agent mode requests that change data are never finished by a SELECT
+_WRITE_PATTERN = re.compile(r'\b(insert|add|create|update|change|modify|set|delete|remove|drop|generate)\b')
+
+# One specific thing: a listing, a lookup or an aggregate
+_SPECIFIC_PATTERN = re.compile(
+    r'^(?:(?:please|can you|could you|would you)\s+)*(show|list|display|give|get|find|fetch|return|count|select|which|who|what|how many|how much|'
+    r'top|bottom|average|total|sum|max|min|highest|lowest)\b'
+)
+
+
+def _number(text: str) -> int:
+    """Parse a number written as digits or a word."""
+    return int(text) if text.isdigit() else _NUMBER_WORDS[text]
+
+
+class StopRules:
+    """
+    Decide locally that a multi-step loop is done.
+
+    After each query the Ask and Agent mode loops ask the model whether
+    another query is needed. Most questions are a single specific request
+    ("top 5 stores by sales", "how many customers") that the first result
+    already answers, so the rules here stop the loop without that round trip
+    when the question's shape and the last result show the answer is in:
+
+    - the user asked for N queries and N have run;
+    - a specific (non-exploratory, single-part) question got a successful,
+      non-empty first result, with no more rows than a "top N" asked for,
+      and the model did not announce further steps (MULTI_STEP_QUERY).
+
+    The rules only ever stop. Anything else - exploratory or multi-part
+    questions, failed or empty results - is left to the model as before.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        Initialize the rules.
+
+        Args:
+            enabled: If False check() never stops and every step asks the model
+        """
+        self.enabled = enabled
+        self.turns = 0
+        self.decisions = 0
+        self.local_stops: Counter = Counter()
+
+    def check(
+        self,
+        question: str,
+        last_result: Optional[Dict[str, Any]],
+        queries_executed: int,
+        multi_step: bool = False,
+        agent_mode: bool = False
+    ) -> Optional[str]:
+        """
+        Check whether the loop can stop without asking the model.
+
+        Args:
+            question: The user's question
+            last_result: Result of the query that just ran (None if it produced none)
+            queries_executed: Queries run so far in this turn
+            multi_step: The response that produced the query announced more steps
+            agent_mode: Questions asking to change data never stop on a read
+
+        Returns:
+            The rule that stopped the loop, or None to ask the model
+        """
+        self.decisions += 1
+        if not self.enabled:
+            return None
+
+        reason = self._match(" ".join(question.lower().split()), last_result, queries_executed, multi_step, agent_mode)
+        if reason:
+            self.local_stops[reason] += 1
+            print(f"⏭️ Stopping locally ({reason}) - next-step call skipped")
+        return reason
+
+    @staticmethod
+    def _match(
+        question: str,
+        last_result: Optional[Dict[str, Any]],
+        queries_executed: int,
+        multi_step: bool,
+        agent_mode: bool
+    ) -> Optional[str]:
+        """Apply the rules to a normalized question."""
+        requested = _REQUESTED_COUNT_PATTERN.search(question)
+        if requested:
+            return "requested_count_reached" if queries_executed >= _number(requested.group(1)) else None
+
+        if not last_result or not last_result.get('success') or last_result.get('row_count', 0) == 0:
+            return None
+        if queries_executed > 1 or multi_step or agent_mode and _WRITE_PATTERN.search(question):
+            return None
+        if _EXPLORATORY_PATTERN.search(question) or _MULTI_PART_PATTERN.search(question) or question.count("?") > 1:
+            return None
+
+        # Drop the @dataset mentions before looking at how the question starts
+        question = re.sub(r'@\S+', ' ', question).strip(" ,.:")
+        if not _SPECIFIC_PATTERN.match(question):
+            return None
+
+        top_n = _TOP_N_PATTERN.search(question)
+        if top_n and last_result['row_count'] > _number(top_n.group(1) or top_n.group(2)):
+            return None
+        return "specific_question_answered"
+
+    def record_turn(self):
+        """Count a turn that reached at least one stop decision."""
+        self.turns += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return stop decisions and the next-step round trips saved per turn."""
+        saved = sum(self.local_stops.values())
+        return {
+            "enabled": self.enabled,
+            "turns": self.turns,
+            "decisions": self.decisions,
+            "round_trips_saved": saved,
+            "round_trips_saved_per_turn": round(saved / self.turns, 3) if self.turns else 0,
+            "by_rule": dict(self.local_stops)
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+stop_rules = StopRules(enabled=_settings.stop_rules_enabled)
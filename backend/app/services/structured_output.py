@@ -0,0 +1,229 @@
+"""Structured (JSON schema / tool calling) output for SQL generation and chart decisions."""
+import json
+import re
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+from app.config import get_settings
+
+
+class SqlStep(BaseModel):
+    """A SQL generation or next-step decision."""
+    sql: Optional[str] = None
+    step: Optional[int] = None
+    done: bool = False
+    explanation: str = ""
+
+
+class ChartDecision(BaseModel):
+    """A chart decision (see chart_generator.ask_ai_for_chart_config)."""
+    should_chart: bool
+    chart_type: Optional[str] = None
+    x_axis: Optional[str] = None
+    y_axis: Optional[List[str]] = None
+    title: Optional[str] = None
+    x_axis_label: Optional[str] = None
+    y_axis_label: Optional[str] = None
+
+
+# JSON schemas in the strict form OpenAI requires (every field required, nullable via type lists).
+# "sql" comes first so it can be executed while the explanation is still streaming.
+SQL_STEP_SCHEMA: Dict[str, Any] = {
+    "name": "sql_step",
+    "description": "The next SQL query to run and the explanation shown to the user",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "sql": {"type": ["string", "null"]},
+            "step": {"type": ["integer", "null"]},
+            "done": {"type": "boolean"},
+            "explanation": {"type": "string"}
+        },
+        "required": ["sql", "step", "done", "explanation"],
+        "additionalProperties": False
+    }
+}
+
+CHART_DECISION_SCHEMA: Dict[str, Any] = {
+    "name": "chart_decision",
+    "description": "Whether to chart a query result and how",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "should_chart": {"type": "boolean"},
+            "chart_type": {"type": ["string", "null"], "enum": ["line", "bar", "pie", "grouped_bar", None]},
+            "x_axis": {"type": ["string", "null"]},
+            "y_axis": {"type": ["array", "null"], "items": {"type": "string"}},
+            "title": {"type": ["string", "null"]},
+            "x_axis_label": {"type": ["string", "null"]},
+            "y_axis_label": {"type": ["string", "null"]}
+        },
+        "required": ["should_chart", "chart_type", "x_axis", "y_axis", "title", "x_axis_label", "y_axis_label"],
+        "additionalProperties": False
+    }
+}
+
+# Appended to the per-turn prompt of SQL-stage calls (the cached prefix stays unchanged)
+SQL_STEP_INSTRUCTIONS = """
+
+RESPONSE FORMAT OVERRIDE: Reply with ONE JSON object (no code fences, no other text) with these fields:
+- "sql": the ONE SQL query to run next, without ``` fences or step markers; null if no query is needed
+- "step": the step number when this query is a MULTI_STEP_QUERY step, otherwise null
+- "done": true if no further query is needed (QUERY_COMPLETE), otherwise false
+- "explanation": the text you would otherwise write around the query, including any UNRELATED_QUERY or MISSING_DATASET marker"""
+
+_FENCE_PATTERN = re.compile(r'^```(?:json)?\s*(.*?)\s*```$', re.DOTALL)
+_KEY_PATTERN = re.compile(r'\s*,?\s*"((?:[^"\\]|\\.)*)"\s*:\s*')
+_DECODER = json.JSONDecoder()
+
+
+def parse_structured(text: str, model: Type[BaseModel]) -> Optional[BaseModel]:
+    """
+    Parse a structured response into its typed object.
+
+    Args:
+        text: Provider response (a JSON object, optionally fenced)
+        model: Expected type
+
+    Returns:
+        The validated object, or None if the text is not a valid instance
+    """
+    text = (text or "").strip()
+    fenced = _FENCE_PATTERN.match(text)
+    if fenced:
+        text = fenced.group(1)
+    start = text.find("{")
+    if start < 0:
+        return None
+    try:
+        data, _ = _DECODER.raw_decode(text, start)
+        return model.model_validate(data)
+    except (ValueError, ValidationError):
+        return None
+
+
+def render_sql_step(step: SqlStep) -> str:
+    """
+    Render a SqlStep in the free-text format the pipeline parses.
+
+    The explanation comes first (so marker checks and reasoning extraction see
+    it), then the MULTI_STEP_QUERY marker and a ```sql block, or QUERY_COMPLETE
+    when there is no further query.
+    """
+    parts = [step.explanation.strip()] if step.explanation.strip() else []
+    sql = (step.sql or "").strip()
+    if sql:
+        if step.step:
+            parts.append(f"MULTI_STEP_QUERY: Step {step.step}")
+        parts.append(f"```sql\n{sql}\n```")
+    elif step.done:
+        parts.append("QUERY_COMPLETE")
+    return "\n\n".join(parts)
+
+
+class PartialJsonObject:
+    """
+    Incremental parser for a JSON object that is still streaming in.
+
+    feed() takes the text received so far and returns the top-level fields
+    whose values are complete, so e.g. "sql" is known as soon as its closing
+    quote arrives.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self._pos: Optional[int] = None
+
+    def feed(self, text: str) -> Dict[str, Any]:
+        """Parse any newly completed fields."""
+        if self._pos is None:
+            start = text.find("{")
+            if start < 0:
+                return self.fields
+            self._pos = start + 1
+
+        while True:
+            key = _KEY_PATTERN.match(text, self._pos)
+            if not key:
+                break
+            try:
+                value, end = _DECODER.raw_decode(text, key.end())
+            except ValueError:
+                break
+            if end >= len(text) and isinstance(value, (int, float)) and not isinstance(value, bool):
+                # A number at the very end may still be growing
+                break
+            self.fields[json.loads(f'"{key.group(1)}"')] = value
+            self._pos = end
+        return self.fields
+
+
+def openai_response_format(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """OpenAI `response_format` for a strict JSON schema."""
+    return {"type": "json_schema", "json_schema": {"name": schema["name"], "schema": schema["schema"], "strict": True}}
+
+
+def _gemini_schema(node: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a JSON schema node to Gemini's OpenAPI subset (nullable flag, no additionalProperties)."""
+    converted: Dict[str, Any] = {}
+    node_type = node.get("type")
+    if isinstance(node_type, list):
+        converted["type"] = next(t for t in node_type if t != "null")
+        converted["nullable"] = "null" in node_type
+    elif node_type:
+        converted["type"] = node_type
+    if "properties" in node:
+        converted["properties"] = {name: _gemini_schema(child) for name, child in node["properties"].items()}
+        converted["required"] = list(node.get("required", []))
+    if "items" in node:
+        converted["items"] = _gemini_schema(node["items"])
+    return converted
+
+
+def gemini_generation_config(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Gemini `generation_config` requesting JSON that follows the schema."""
+    return {"response_mime_type": "application/json", "response_schema": _gemini_schema(schema["schema"])}
+
+
+def anthropic_tool_args(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Anthropic `tools`/`tool_choice` arguments forcing a tool call with the schema as its input."""
+    return {
+        "tools": [{"name": schema["name"], "description": schema["description"], "input_schema": schema["schema"]}],
+        "tool_choice": {"type": "tool", "name": schema["name"]}
+    }
+
+
+class StructuredOutputStats:
+    """Structured output setting and counters."""
+
+    def __init__(self, enabled: bool = False):
+        """
+        Initialize the counters.
+
+        Args:
+            enabled: Request structured output for SQL generation and chart decisions
+        """
+        self.enabled = enabled
+        self.requests: Dict[str, int] = {}
+        self.parsed: Dict[str, int] = {}
+        self.fallbacks: Dict[str, int] = {}
+
+    def record(self, schema: Dict[str, Any], outcome: str):
+        """Count a structured request and whether it was parsed or fell back to the text path."""
+        counters = {"request": self.requests, "parsed": self.parsed, "fallback": self.fallbacks}[outcome]
+        counters[schema["name"]] = counters.get(schema["name"], 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return structured output counters per schema."""
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "parsed": self.parsed,
+            "fallbacks": self.fallbacks
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+structured_output = StructuredOutputStats(enabled=_settings.structured_output_enabled)
@@ -0,0 +1,158 @@
+"""Token budgets for prompts: estimate each prompt section locally and trim by priority."""
+from typing import Callable, Dict, List, Tuple
+
+from app.config import get_settings
+from app.services.rate_limiter import estimate_tokens
+
+
+def _tokens(text: str) -> int:
+    """Estimated tokens of a prompt section (0 when empty)."""
+    return estimate_tokens(text) if text else 0
+
+
+class PromptSection:
+    """
+    A trimmable part of a prompt made of `count` items.
+
+    render(k) must return the section's text when only the k most important
+    items are kept (e.g. the k most recent history entries).
+    """
+
+    def __init__(self, name: str, render: Callable[[int], str], count: int, priority: int, min_count: int = 0):
+        """
+        Describe a section.
+
+        Args:
+            name: Section name used in logs and metrics
+            render: Renders the section keeping k items
+            count: Items available
+            priority: Lower priorities are trimmed first
+            min_count: Items that are never trimmed
+        """
+        self.name = name
+        self.render = render
+        self.count = count
+        self.priority = priority
+        self.min_count = min(min_count, count)
+
+
+class TokenBudget:
+    """
+    Fit prompts into a per-model input token budget.
+
+    Fixed sections (instructions, schemas, the question) are always kept. While
+    the estimate is over budget, one item at a time is dropped from the
+    lowest-priority trimmable section that still has items above its minimum.
+    """
+
+    def __init__(self, budgets: Dict[str, int], enabled: bool = True):
+        """
+        Initialize the budget manager.
+
+        Args:
+            budgets: Model name prefix -> input token budget ("default" applies otherwise)
+            enabled: If False prompts are measured but never trimmed
+        """
+        self.budgets = budgets
+        self.enabled = enabled
+        self.prompts = 0
+        self.trimmed = 0
+        self.over_budget = 0
+        self.tokens_removed = 0
+        self._section_tokens: Dict[str, int] = {}
+        self.last_breakdown: Dict[str, int] = {}
+
+    def budget_for(self, model: str) -> int:
+        """Resolve a model's budget (longest matching prefix, else "default"; 0 = unlimited)."""
+        matches = [prefix for prefix in self.budgets if prefix != "default" and model.startswith(prefix)]
+        if matches:
+            return self.budgets[max(matches, key=len)]
+        return self.budgets.get("default", 0)
+
+    def fit(
+        self,
+        model: str,
+        fixed: Dict[str, str],
+        sections: List[PromptSection]
+    ) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """
+        Decide how many items of each section fit the model's budget.
+
+        Args:
+            model: Model the prompt is for
+            fixed: Section name -> text that is always sent
+            sections: Trimmable sections
+
+        Returns:
+            (kept item count per section, estimated tokens per section incl. "total")
+        """
+        budget = self.budget_for(model) if self.enabled else 0
+        counts = {section.name: section.count for section in sections}
+        tokens = {name: _tokens(text) for name, text in fixed.items()}
+        for section in sections:
+            tokens[section.name] = _tokens(section.render(section.count))
+        original_total = sum(tokens.values())
+
+        total = original_total
+        if budget:
+            for section in sorted(sections, key=lambda section: section.priority):
+                while total > budget and counts[section.name] > section.min_count:
+                    counts[section.name] -= 1
+                    section_tokens = _tokens(section.render(counts[section.name]))
+                    total -= tokens[section.name] - section_tokens
+                    tokens[section.name] = section_tokens
+                if total <= budget:
+                    break
+
+        tokens["total"] = total
+        self._record(model, budget, original_total, counts, tokens, sections)
+        return counts, tokens
+
+    def _record(
+        self,
+        model: str,
+        budget: int,
+        original_total: int,
+        counts: Dict[str, int],
+        tokens: Dict[str, int],
+        sections: List[PromptSection]
+    ):
+        """Update metrics and log trimmed or oversized prompts."""
+        self.prompts += 1
+        for name, value in tokens.items():
+            if name != "total":
+                self._section_tokens[name] = self._section_tokens.get(name, 0) + value
+        self.last_breakdown = dict(tokens)
+
+        if tokens["total"] < original_total:
+            self.trimmed += 1
+            self.tokens_removed += original_total - tokens["total"]
+            changes = ", ".join(
+                f"{section.name} {section.count}→{counts[section.name]}"
+                for section in sections if counts[section.name] != section.count
+            )
+            print(f"✂️ Prompt for {model} trimmed from ~{original_total} to ~{tokens['total']} tokens (budget {budget}): {changes}")
+        if budget and tokens["total"] > budget:
+            self.over_budget += 1
+            largest = max((name for name in tokens if name != "total"), key=lambda name: tokens[name])
+            print(f"⚠️ Warning: Prompt for {model} is ~{tokens['total']} tokens, over its budget of {budget} (largest section: {largest})")
+
+    def get_stats(self) -> Dict[str, object]:
+        """Return budget counters and the average estimated tokens per section."""
+        return {
+            "enabled": self.enabled,
+            "budgets": self.budgets,
+            "prompts": self.prompts,
+            "trimmed": self.trimmed,
+            "over_budget": self.over_budget,
+            "tokens_removed": self.tokens_removed,
+            "avg_section_tokens": {
+                name: round(value / self.prompts) for name, value in self._section_tokens.items()
+            } if self.prompts else {},
+            "last_breakdown": self.last_breakdown
+        }
+
+
+# Singleton instance
+_settings = get_settings()
+token_budget = TokenBudget(budgets=_settings.prompt_token_budgets, enabled=_settings.prompt_budget_enabled)
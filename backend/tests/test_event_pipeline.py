@@ -0,0 +1,46 @@
+"""Tests for merging background SSE producers into one stream."""
+import asyncio
+
+from app.services.event_pipeline import EventMerger
+
+
+def test_cancel_stops_producers_and_runs_cleanups():
+    closed = []
+    cleaned = []
+
+    async def producer():
+        try:
+            yield "data: first\n\n"
+            await asyncio.sleep(10)
+            yield "data: never\n\n"
+        finally:
+            closed.append(True)
+
+    async def run():
+        merger = EventMerger()
+        merger.on_cancel(lambda: cleaned.append("speculation"))
+        merger.spawn(producer())
+        waiter = asyncio.ensure_future(asyncio.sleep(0.05))
+        events = [event async for event in merger.until(waiter)]
+        merger.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return events
+
+    assert asyncio.run(run()) == ["data: first\n\n"]
+    assert closed == [True]
+    assert cleaned == ["speculation"]
+
+
+def test_muted_statuses_are_dropped():
+    async def producer():
+        yield 'data: {"type": "loading", "content": "AI is generating charts..."}\n\n'
+        yield 'data: {"type": "chart_config", "content": {}}\n\n'
+
+    async def run():
+        merger = EventMerger()
+        merger.mute_status()
+        merger.spawn(producer())
+        return [event async for event in merger.drain()]
+
+    assert asyncio.run(run()) == ['data: {"type": "chart_config", "content": {}}\n\n']
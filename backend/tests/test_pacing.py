@@ -0,0 +1,59 @@
+"""Tests that the streaming pipeline only pauses under a pacing profile that asks for it."""
+import asyncio
+import time
+
+import pytest
+
+from app.services import chart_generator, pacing
+from app.services.pacing import set_pacing_profile
+from app.services.query_executor import execute_select_query_with_chart
+
+
+RESULT = {
+    "success": True,
+    "columns": ["Store", "Weekly_Sales"],
+    "data": [{"Store": 1, "Weekly_Sales": 24924.5}, {"Store": 2, "Weekly_Sales": 46039.49}],
+    "row_count": 2
+}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record asyncio sleeps instead of waiting; the chart decision is answered locally."""
+    recorded = []
+
+    async def sleep(seconds, *args, **kwargs):
+        recorded.append(seconds)
+
+    async def ask_ai_for_chart_config(result, ai_service, model, api_key, user_query=None):
+        return {"chart_type": "bar", "x_axis": "Store", "y_axis": ["Weekly_Sales"], "title": "Sales"}
+
+    monkeypatch.setattr(pacing.asyncio, "sleep", sleep)
+    monkeypatch.setattr(chart_generator, "ask_ai_for_chart_config", ask_ai_for_chart_config)
+    return recorded
+
+
+def run_charted_query(profile):
+    async def run():
+        set_pacing_profile(profile)
+        return [event async for event in execute_select_query_with_chart(
+            "SELECT Store, SUM(Weekly_Sales) FROM sales GROUP BY Store", "sales by store", "gpt-4o", "key",
+            prefetched=(RESULT, 3)
+        )]
+    return asyncio.run(run())
+
+
+def test_zero_pacing_makes_no_sleeps(sleeps):
+    started = time.perf_counter()
+    events = run_charted_query("none")
+    elapsed = time.perf_counter() - started
+
+    assert sleeps == []
+    assert any('"type": "chart_config"' in event for event in events)
+    assert elapsed < 0.5
+
+
+def test_demo_pacing_keeps_the_original_delays(sleeps):
+    run_charted_query("demo")
+
+    assert sleeps == [1.0, 2.0, 5.0]
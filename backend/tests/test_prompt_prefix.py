@@ -0,0 +1,46 @@
+"""Tests that the prompt prefix sent as the system prompt stays byte-identical across turns."""
+import pytest
+
+from app.services.ai_service import ai_service
+
+
+SALES = {
+    "table_name": "sales",
+    "columns": [{"name": "Store", "type": "INTEGER"}, {"name": "Weekly_Sales", "type": "REAL"}],
+    "sample_data": [{"Store": 1, "Weekly_Sales": 24924.5}, {"Store": 2, "Weekly_Sales": 46039.49}]
+}
+STORES = {
+    "table_name": "stores",
+    "columns": [{"name": "Store", "type": "INTEGER", "primary_key": True}, {"name": "Type", "type": "TEXT"}],
+    "sample_data": [{"Store": 1, "Type": "A"}]
+}
+
+TURNS = [
+    ("\n\nUser Question: total sales by store", None),
+    ("\n\nUser Question: which store type sells most?", [
+        {"role": "user", "content": "total sales by store"},
+        {"role": "assistant", "content": "Store 1 sold the most."}
+    ]),
+    ("\n\nThe user has attached 1 image(s).\n\nUser Question: compare with last year", [
+        {"role": "user", "content": "total sales by store"},
+        {"role": "assistant", "content": "Store 1 sold the most."},
+        {"role": "user", "content": "which store type sells most?"},
+        {"role": "assistant", "content": "Type A."}
+    ]),
+]
+
+
+@pytest.mark.parametrize("is_agent_mode", [False, True])
+def test_prefix_is_identical_across_questions_and_history(is_agent_mode):
+    prefixes = [
+        ai_service._build_budgeted_prompt("gpt-4o", [SALES, STORES], is_agent_mode, None, None, history, question)[0]
+        for question, history in TURNS
+    ]
+
+    assert prefixes[0].encode() == prefixes[1].encode() == prefixes[2].encode()
+    assert "total sales by store" not in prefixes[0]
+    assert "Store 1 sold the most." not in prefixes[0]
+
+
+def test_prefix_does_not_depend_on_table_order():
+    assert ai_service._build_prompt_prefix([SALES, STORES]) == ai_service._build_prompt_prefix([STORES, SALES])
@@ -0,0 +1,51 @@
+"""Tests that provider calls await the SDK's async API instead of blocking the event loop."""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from app.services.ai_service import ai_service
+from app.services.provider_clients import provider_clients
+
+
+CALL_SECONDS = 0.3
+CALLS = 5
+
+
+class FakeAsyncOpenAI:
+    """Async OpenAI client whose completions take CALL_SECONDS each."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, model, messages, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(CALL_SECONDS)
+        finally:
+            self.in_flight -= 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=messages[-1]["content"]))],
+            usage=None
+        )
+
+
+def test_parallel_provider_calls_overlap(monkeypatch):
+    client = FakeAsyncOpenAI()
+    monkeypatch.setattr(provider_clients, "get_openai_client", lambda api_key: client)
+
+    async def run():
+        return await asyncio.gather(*(
+            ai_service._generate_openai_response(f"question {i}", "gpt-4o", "key") for i in range(CALLS)
+        ))
+
+    started = time.perf_counter()
+    replies = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+
+    assert replies == [f"question {i}" for i in range(CALLS)]
+    assert client.max_in_flight == CALLS
+    # About one call's latency, not CALLS of them back to back
+    assert elapsed < CALL_SECONDS * 2
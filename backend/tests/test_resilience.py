@@ -0,0 +1,107 @@
+"""Tests for the provider circuit breakers."""
+import asyncio
+
+import pytest
+
+from app.services.resilience import CircuitOpenError, ProviderResilience, ProviderTimeoutError
+
+
+@pytest.fixture
+def resilience():
+    # Opens on the first transient failure and lets a probe through right away
+    return ProviderResilience(retry_attempts=0, failure_threshold=1, reset_seconds=0)
+
+
+async def ok():
+    return "ok"
+
+
+async def timeout():
+    raise ProviderTimeoutError("openai", "default", "total", 1)
+
+
+async def hang():
+    await asyncio.sleep(10)
+
+
+def open_circuit(resilience):
+    with pytest.raises(ProviderTimeoutError):
+        asyncio.run(resilience.call("openai", timeout))
+    assert resilience.breaker("openai").state == "open"
+
+
+def test_cancelled_probe_lets_the_next_call_through(resilience):
+    open_circuit(resilience)
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(resilience.call("openai", hang))
+        await asyncio.sleep(0)
+        assert resilience.breaker("openai").probe_in_flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(cancel_probe())
+    assert asyncio.run(resilience.call("openai", ok)) == "ok"
+    assert resilience.breaker("openai").state == "closed"
+
+
+def test_stream_probe_closed_early_lets_the_next_call_through(resilience):
+    open_circuit(resilience)
+
+    async def chunks():
+        yield "a"
+        yield "b"
+
+    async def read_one():
+        stream = resilience.stream("openai", "default", chunks)
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+
+    asyncio.run(read_one())
+    assert asyncio.run(resilience.call("openai", ok)) == "ok"
+
+
+def test_concurrent_probe_is_rejected(resilience):
+    open_circuit(resilience)
+
+    async def probe_and_call():
+        probe = asyncio.ensure_future(resilience.call("openai", hang))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(CircuitOpenError):
+                await resilience.call("openai", ok)
+        finally:
+            probe.cancel()
+
+    asyncio.run(probe_and_call())
+
+
+def test_stream_steps_run_in_the_consumer_task(resilience):
+    tasks = []
+
+    async def chunks():
+        for chunk in ("a", "b"):
+            tasks.append(asyncio.current_task())
+            yield chunk
+
+    async def read_all():
+        return [chunk async for chunk in resilience.stream("openai", "default", chunks)], asyncio.current_task()
+
+    received, consumer = asyncio.run(read_all())
+    assert received == ["a", "b"]
+    assert tasks == [consumer, consumer]
+
+
+def test_stream_first_token_timeout(resilience):
+    resilience.stage_timeouts["default"]["first_token"] = 0.05
+
+    async def slow():
+        await asyncio.sleep(1)
+        yield "late"
+
+    async def read_all():
+        return [chunk async for chunk in resilience.stream("openai", "default", slow)]
+
+    with pytest.raises(ProviderTimeoutError, match="first_token"):
+        asyncio.run(read_all())
@@ -0,0 +1,51 @@
+"""Tests for single-flight coalescing of identical provider calls."""
+import asyncio
+
+from app.services.single_flight import SingleFlight
+
+
+def test_only_requests_with_the_same_api_key_share_a_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def call(api_key):
+        async def provider():
+            calls.append(api_key)
+            await asyncio.sleep(0.05)
+            if api_key == "revoked":
+                raise PermissionError("401 invalid api key")
+            return f"answer for {api_key}"
+
+        try:
+            return await flights.do(flights.make_key("gpt-4o", api_key, "same prompt"), provider)
+        except PermissionError as e:
+            return str(e)
+
+    async def run():
+        return await asyncio.gather(call("revoked"), call("valid"), call("valid"))
+
+    assert asyncio.run(run()) == ["401 invalid api key", "answer for valid", "answer for valid"]
+    assert sorted(calls) == ["revoked", "valid"]
+
+
+def test_stream_cancelled_by_its_last_subscriber_is_not_joined():
+    flights = SingleFlight()
+    key = flights.make_key("gpt-4o", "key", "same prompt")
+    started = []
+
+    async def provider():
+        started.append(True)
+        yield "partial "
+        await asyncio.sleep(0.05)
+        yield "answer"
+
+    async def run():
+        first = flights.stream(key, provider)
+        assert await first.__anext__() == "partial "
+        # The last subscriber leaves: the stream is cancelled, a new caller starts over
+        await first.aclose()
+        return [chunk async for chunk in flights.stream(key, provider)]
+
+    assert asyncio.run(run()) == ["partial ", "answer"]
+    assert len(started) == 2
+    assert flights.get_stats()["streams_in_flight"] == 0
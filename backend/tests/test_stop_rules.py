@@ -0,0 +1,53 @@
+"""Tests for the local stop rules of the multi-step loops."""
+import pytest
+
+from app.services.stop_rules import StopRules
+
+
+ROWS_5 = {'success': True, 'row_count': 5}
+
+
+@pytest.fixture
+def rules():
+    return StopRules(enabled=True)
+
+
+def test_requested_count_stops_once_reached(rules):
+    assert rules.check("Run 3 queries on sales", ROWS_5, 2) is None
+    assert rules.check("Run 3 queries on sales", ROWS_5, 3) == "requested_count_reached"
+    assert rules.check("Show me five different queries", ROWS_5, 5) == "requested_count_reached"
+
+
+@pytest.mark.parametrize("question", [
+    "Show what was done steps",
+    "List the steps that are often queries",
+    "Show someone queries",
+    "Which tennis steps",
+])
+def test_number_words_inside_other_words_are_not_counts(rules, question):
+    assert rules.check(question, ROWS_5, 1, multi_step=True) is None
+
+
+def test_specific_question_answered_by_first_result(rules):
+    assert rules.check("Show the top 5 stores by sales", ROWS_5, 1) == "specific_question_answered"
+    assert rules.check("@sales how many customers are there?", {'success': True, 'row_count': 1}, 1) == "specific_question_answered"
+
+
+def test_top_n_with_more_rows_asks_the_model(rules):
+    assert rules.check("Show the top 3 stores by sales", ROWS_5, 1) is None
+
+
+@pytest.mark.parametrize("question, result, multi_step, agent_mode", [
+    ("Analyze this data", ROWS_5, False, False),
+    ("Show total sales by store and then compare regions", ROWS_5, False, False),
+    ("Show total sales by store", {'success': False, 'row_count': 0}, False, False),
+    ("Show total sales by store", {'success': True, 'row_count': 0}, False, False),
+    ("Which stores have above-average sales", ROWS_5, True, False),
+    ("Add 5 rows for store 9", ROWS_5, False, True),
+])
+def test_other_questions_ask_the_model(rules, question, result, multi_step, agent_mode):
+    assert rules.check(question, result, 1, multi_step=multi_step, agent_mode=agent_mode) is None
+
+
+def test_disabled_rules_never_stop():
+    assert StopRules(enabled=False).check("Run 1 query", ROWS_5, 1) is None